@@ -0,0 +1,62 @@
+"""
+Generates access codes in bulk and exports their tokens.
+
+Codes are inserted in batches and their tokens, which are signed, are computed
+in a pool of processes and streamed out as CSV along with links to the events
+that add the codes for visitors.
+"""
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlencode
+
+from django.contrib.sites.models import Site
+from django.db import transaction
+
+from . import models
+
+HEADER = ['ticket_type', 'token', 'link']
+
+
+def generate(ticket_type, count, batch_size=5000):
+    """
+    Creates the access codes and returns their IDs.
+    """
+    access_codes = [models.AccessCode(ticket_type=ticket_type)
+                    for _ in range(count)]
+    with transaction.atomic():
+        models.AccessCode.objects.bulk_create(access_codes,
+                                              batch_size=batch_size)
+    return [a.pk for a in access_codes]
+
+
+def sign(pks):
+    return [models.AccessCode.get_token(pk) for pk in pks]
+
+
+class Echo(object):
+    # Hands the rows written by csv.writer straight back
+    def write(self, value):
+        return value
+
+
+def export(access_codes, processes=None, chunk_size=5000):
+    """
+    Takes (ticket type, access code IDs) tuples and yields the CSV rows of the
+    access codes, a chunk at a time.
+    """
+    writer = csv.writer(Echo())
+    domain = Site.objects.get_current().domain
+
+    yield writer.writerow(HEADER)
+    # Forked workers only sign, so they never touch the database
+    # connections they inherit.
+    with ProcessPoolExecutor(processes) as executor:
+        for ticket_type, pks in access_codes:
+            link = 'https://{}/{}/?'.format(domain, ticket_type.event.slug)
+            chunks = [pks[i:i + chunk_size]
+                      for i in range(0, len(pks), chunk_size)]
+            for tokens in executor.map(sign, chunks):
+                yield ''.join(
+                    writer.writerow([ticket_type.pk, token,
+                                     link + urlencode({'accessCode': token})])
+                    for token in tokens)
@@ -1,6 +1,11 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.utils.translation import ugettext_lazy as _
 
-from . import models
+from . import access_codes, models
 
 
 @admin.register(models.AccessCode)
@@ -27,6 +32,22 @@ class OrganizationAdmin(admin.ModelAdmin):
     filter_horizontal = ['admins']
 
 
+@admin.register(models.OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'template_name', 'created', 'sent', 'attempts', 'next_attempt']
+    list_filter = ['template_name']
+    raw_id_fields = ['ticket_ownership']
+    date_hierarchy = 'created'
+
+
+@admin.register(models.PurchaseJob)
+class PurchaseJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'result_status', 'created', 'finished']
+    list_filter = ['status']
+    raw_id_fields = ['user']
+    date_hierarchy = 'created'
+
+
 @admin.register(models.Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['amount', 'created']
@@ -40,6 +61,7 @@ class VariationChoiceInline(admin.TabularInline):
 class TicketOwnershipInline(admin.TabularInline):
     model = models.TicketOwnership
     raw_id_fields = ['user', 'transactions']
+    readonly_fields = ['price']
     extra = 0
 
 
@@ -51,9 +73,12 @@ class TicketAdmin(admin.ModelAdmin):
     inlines = [TicketOwnershipInline]
     raw_id_fields = ['access_code']
     ordering = ['-created']
+    list_select_related = ['ticket_type', 'current_ownership__user']
 
     def current_owner(self, obj):
-        return obj.ownerships.latest().user
+        if obj.current_ownership is None:
+            return None
+        return obj.current_ownership.user
 
     def variation_choices_str(self, obj):
         return ', '.join(
@@ -62,9 +87,42 @@ class TicketAdmin(admin.ModelAdmin):
         )
 
 
+class GenerateAccessCodesForm(forms.Form):
+    count = forms.IntegerField(
+        min_value=1,
+        max_value=100000,
+        label=_('Number of access codes per ticket type'))
+
+
 @admin.register(models.TicketType)
 class TicketTypeAdmin(admin.ModelAdmin):
     inlines = [ModifierInline]
+    actions = ['generate_access_codes']
+
+    def generate_access_codes(self, request, queryset):
+        form = GenerateAccessCodesForm(
+            request.POST if 'count' in request.POST else None)
+        if not form.is_valid():
+            return TemplateResponse(
+                request, 'admin/bitket/tickettype/generate_access_codes.html',
+                dict(self.admin_site.each_context(request),
+                     title=_('Generate access codes'),
+                     opts=self.model._meta,
+                     form=form,
+                     ticket_types=queryset,
+                     action_checkbox_name=helpers.ACTION_CHECKBOX_NAME))
+
+        generated = [
+            (ticket_type, access_codes.generate(
+                ticket_type, form.cleaned_data['count']))
+            for ticket_type in queryset.select_related('event')
+        ]
+        response = StreamingHttpResponse(access_codes.export(generated),
+                                         content_type='text/csv')
+        response['Content-Disposition'] = (
+            'attachment; filename="access-codes.csv"')
+        return response
+    generate_access_codes.short_description = _('Generate access codes')
 
 
 @admin.register(models.Variation)
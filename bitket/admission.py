@@ -0,0 +1,175 @@
+import logging
+from collections import Counter, OrderedDict
+
+from django.db.models import Count
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+ADMITTED = 'admitted'
+TICKET_TYPE_UNAVAILABLE = 'ticket_type_unavailable'
+ACCESS_CODE_UTILIZED = 'access_code_utilized'
+TICKET_TYPE_CONFLICTING = 'ticket_type_conflicting'
+MAX_TOTAL_QUANTITY_EXCEEDED = 'ticket_type_max_total_quantity_exceeded'
+MAX_PERSONAL_QUANTITY_EXCEEDED = 'ticket_type_max_personal_quantity_exceeded'
+BAD_QUEUE_POSITION = 'bad_queue_position'
+
+
+class Admission(object):
+    """
+    Settles the destiny of every pending ticket of a ticket type in one pass.
+
+    The pending tickets are walked in queue order and every rule is applied
+    with knowledge of the tickets ahead, including the ones that will be
+    rejected. Since the outcome only depends on the database state, concurrent
+    passes agree with each other and nobody has to wait for anyone else.
+
+    The units that are neither sold nor held by tickets outside the queue are
+    cut in queue order, so a ticket can never take the unit of a ticket ahead
+    of it. The ticket type's inventory then holds them for as long as the
+    payment is allowed to take.
+    """
+
+    def __init__(self, ticket_type):
+        self.ticket_type = ticket_type
+
+    def get_queue(self):
+        return list(
+            self.ticket_type.tickets.pending()
+            .order_by('seq')
+            .values_list('id', 'seq', 'access_code_id',
+                         'ownerships__user_id'))
+
+    def get_sold_count(self):
+        if self.ticket_type.max_total_quantity is None:
+            return 0
+        return self.ticket_type.inventory.get_sold_count()
+
+    def get_held_count(self, ticket_ids):
+        # Tickets in the queue are cut by their position instead
+        if self.ticket_type.max_total_quantity is None:
+            return 0
+        held_ids = self.ticket_type.inventory.get_held_ids()
+        return len(held_ids - {str(i) for i in ticket_ids})
+
+    def get_owned_counts(self, user_ids):
+        if not self.ticket_type.max_personal_quantity:
+            return Counter()
+
+        return Counter(dict(
+            models.TicketOwnership.objects.current()
+            .filter(user_id__in=user_ids,
+                    ticket__ticket_type=self.ticket_type,
+                    ticket__pending=False)
+            .values_list('user_id')
+            .annotate(count=Count('id'))
+        ))
+
+    def get_conflicting_positions(self, user_ids):
+        # Maps users to the queue position of their first ticket of a
+        # conflicting type. Purchased tickets are always first, i.e. None.
+        positions = {}
+        ownerships = (
+            models.TicketOwnership.objects.current()
+            .filter(user_id__in=user_ids,
+                    ticket__ticket_type__conflicts_with=self.ticket_type)
+            .values_list('user_id', 'ticket__pending', 'ticket__seq'))
+
+        for user_id, pending, seq in ownerships:
+            if not pending:
+                positions[user_id] = None
+            elif user_id not in positions:
+                positions[user_id] = seq
+            elif positions[user_id] is not None:
+                positions[user_id] = min(positions[user_id], seq)
+
+        return positions
+
+    def get_utilized_access_codes(self, access_code_ids):
+        if self.ticket_type.is_generally_available or not access_code_ids:
+            return set()
+
+        return set(
+            models.Ticket.objects.unpending()
+            .filter(access_code_id__in=access_code_ids)
+            .values_list('access_code_id', flat=True))
+
+    def settle(self):
+        """
+        Returns an ordered mapping of pending ticket ids to outcome codes.
+        """
+        queue = self.get_queue()
+        outcomes = OrderedDict()
+
+        if not queue:
+            return outcomes
+
+        user_ids = {i[3] for i in queue}
+        ticket_type = self.ticket_type
+        max_total_quantity = ticket_type.max_total_quantity
+        max_personal_quantity = ticket_type.max_personal_quantity
+
+        sold_count = self.get_sold_count()
+        held_count = self.get_held_count(i[0] for i in queue)
+        owned_counts = self.get_owned_counts(user_ids)
+        conflicting_positions = self.get_conflicting_positions(user_ids)
+        utilized_access_codes = self.get_utilized_access_codes(
+            {i[2] for i in queue if i[2]})
+
+        admitted_count = 0
+
+        for ticket_id, seq, access_code_id, user_id in queue:
+            if not ticket_type.is_generally_available and not access_code_id:
+                outcome = TICKET_TYPE_UNAVAILABLE
+            elif (not ticket_type.is_generally_available and
+                  access_code_id in utilized_access_codes):
+                outcome = ACCESS_CODE_UTILIZED
+            elif user_id in conflicting_positions and (
+                    conflicting_positions[user_id] is None or
+                    conflicting_positions[user_id] < seq):
+                outcome = TICKET_TYPE_CONFLICTING
+            elif (max_total_quantity is not None and
+                  sold_count >= max_total_quantity):
+                outcome = MAX_TOTAL_QUANTITY_EXCEEDED
+            elif (max_personal_quantity and
+                  owned_counts[user_id] >= max_personal_quantity):
+                outcome = MAX_PERSONAL_QUANTITY_EXCEEDED
+            elif (max_total_quantity is not None and
+                  sold_count + held_count + admitted_count >=
+                  max_total_quantity):
+                # The remaining tickets are held by buyers ahead in the queue.
+                outcome = BAD_QUEUE_POSITION
+            else:
+                outcome = ADMITTED
+                admitted_count += 1
+                owned_counts[user_id] += 1
+                if access_code_id:
+                    utilized_access_codes.add(access_code_id)
+
+            outcomes[ticket_id] = outcome
+
+        logger.debug('Settled %d pending tickets of %s, admitted %d',
+                     len(outcomes), ticket_type, admitted_count)
+
+        return outcomes
+
+    def admit(self, ticket_ids):
+        """
+        Settles the pending tickets and reserves units for the given ones.
+        Returns a mapping of the given ticket ids to outcome codes.
+        """
+        outcomes = self.settle()
+        ticket_ids = set(ticket_ids)
+        ticket_ids = [i for i in outcomes if i in ticket_ids]
+        admitted_ids = [i for i in ticket_ids if outcomes[i] == ADMITTED]
+
+        reserved_ids = self.ticket_type.inventory.reserve(admitted_ids)
+
+        for ticket_id in admitted_ids:
+            if str(ticket_id) not in reserved_ids:
+                # Only happens when the inventory disagrees with the queue,
+                # until it is reconciled.
+                outcomes[ticket_id] = BAD_QUEUE_POSITION
+
+        return OrderedDict((i, outcomes[i]) for i in ticket_ids)
@@ -0,0 +1,11 @@
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+
+
+class QueryStringJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    Takes the token from the query string, for clients that cannot set
+    headers, such as EventSource.
+    """
+
+    def get_jwt_value(self, request):
+        return request.query_params.get('token')
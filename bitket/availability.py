@@ -0,0 +1,112 @@
+"""
+Caches what is left of the ticket types of events.
+
+Clients poll availability snapshots heavily during releases, so they are
+served from the cache along with an ETag of their content. Snapshots are
+stamped with a version per event, bumped whenever tickets are sold or
+released, and are rebuilt at least every CACHE_TIMEOUT_AVAILABILITY seconds to
+pick up changes made behind the back of the signals.
+"""
+import hashlib
+import json
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import models, streams
+
+Snapshot = namedtuple('Snapshot', 'data etag')
+
+
+def get_version_key(event_pk):
+    return 'bitket.availability.{}.version'.format(event_pk)
+
+
+def get_snapshot_key(event_pk):
+    return 'bitket.availability.{}.snapshot'.format(event_pk)
+
+
+def build_snapshot(event_pk):
+    """
+    Returns the availability of the published ticket types of the event, or
+    None if there is no such published event.
+    """
+    ticket_types = list(models.TicketType.objects
+                        .published()
+                        .filter(event_id=event_pk, event__published=True)
+                        .with_sold_count())
+    if not ticket_types and not models.Event.objects.filter(
+            pk=event_pk, published=True).exists():
+        return None
+
+    data = OrderedDict((
+        ('event', str(event_pk)),
+        ('ticket_types', [
+            OrderedDict((
+                ('id', str(ticket_type.pk)),
+                ('general', ticket_type.is_generally_available),
+                ('total_quantity', ticket_type.within_max_total_quantity),
+            ))
+            for ticket_type in ticket_types
+        ]),
+    ))
+    # The ETag only depends on the content, so rebuilding an unchanged
+    # snapshot does not invalidate what clients have.
+    etag = hashlib.sha256(json.dumps(data).encode()).hexdigest()
+    return Snapshot(data, etag)
+
+
+def get_snapshot(event_pk):
+    version_key = get_version_key(event_pk)
+    snapshot_key = get_snapshot_key(event_pk)
+    values = cache.get_many([version_key, snapshot_key])
+
+    version = values.get(version_key, 0)
+    entry = values.get(snapshot_key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    snapshot = build_snapshot(event_pk)
+    cache.set(snapshot_key, (version, snapshot),
+              timeout=settings.CACHE_TIMEOUT_AVAILABILITY)
+    return snapshot
+
+
+def invalidate(event_pk):
+    def bump():
+        cache.add(get_version_key(event_pk), 0, timeout=None)
+        cache.incr(get_version_key(event_pk))
+
+    def bump_and_publish():
+        bump()
+        streams.publish_availability(event_pk)
+
+    # Snapshots built before the change is committed do not reflect it, so the
+    # version is bumped once more on commit.
+    bump()
+    transaction.on_commit(bump_and_publish)
+
+
+@receiver(post_save, sender='bitket.Ticket')
+@receiver(post_delete, sender='bitket.Ticket')
+def invalidate_ticket(sender, instance, created=False, **kwargs):
+    # New pending tickets are not sold yet
+    if created and instance.pending:
+        return
+    invalidate(instance.ticket_type.event_id)
+
+
+@receiver(post_save, sender='bitket.TicketType')
+@receiver(post_delete, sender='bitket.TicketType')
+def invalidate_ticket_type(sender, instance, **kwargs):
+    invalidate(instance.event_id)
+
+
+@receiver(post_save, sender='bitket.Event')
+@receiver(post_delete, sender='bitket.Event')
+def invalidate_event(sender, instance, **kwargs):
+    invalidate(instance.pk)
@@ -2,6 +2,7 @@ from uuid import uuid4
 
 from django.contrib.auth.hashers import make_password
 from django.db import models
+from django.db.models import Expression, F
 from django.utils.translation import ugettext_lazy as _
 
 from autoslug import AutoSlugField
@@ -57,6 +58,30 @@ class NullCharField(models.CharField):
         return value or None
 
 
+class DatabaseDefault(Expression):
+    # Leaves the value to the column default of the database.
+    def as_sql(self, compiler, connection):
+        return 'DEFAULT', []
+
+
+class SequenceField(models.BigIntegerField):
+    """
+    Gets its value from the column default (i.e. a database sequence) on
+    insert and keeps it on update. The value is not loaded back into newly
+    created instances.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs['editable'] = False
+        super(SequenceField, self).__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = super(SequenceField, self).pre_save(model_instance, add)
+        if value is None:
+            return DatabaseDefault() if add else F(self.attname)
+        return value
+
+
 class SlugField(AutoSlugField):
     def __init__(self, *args, **kwargs):
         kwargs['max_length'] = kwargs.get('max_length', 64)
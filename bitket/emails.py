@@ -0,0 +1,142 @@
+import logging
+from datetime import timedelta
+from smtplib import SMTPServerDisconnected
+from time import sleep, time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from . import models, workers
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'bitket_outgoing_emails'
+
+
+def queue_confirmations(ticket_ownerships):
+    """
+    Queues confirmation emails for the ticket ownerships. Call it inside the
+    transaction creating them, so that the emails are only sent if it commits.
+    """
+    models.OutgoingEmail.objects.bulk_create([
+        models.OutgoingEmail(
+            template_name=models.OutgoingEmail.TEMPLATE_TICKET_OWNERSHIP_NEW,
+            ticket_ownership=ticket_ownership)
+        for ticket_ownership in ticket_ownerships
+    ])
+    workers.notify(NOTIFY_CHANNEL)
+
+
+def get_retry_delay(attempts):
+    # Exponential backoff, starting at a minute and capped at an hour
+    return timedelta(minutes=min(2 ** (attempts - 1), 60))
+
+
+def claim(batch_size=None):
+    """
+    Leases a batch of due emails. Emails whose worker dies before they are
+    sent become due again once the lease runs out.
+    """
+    with transaction.atomic():
+        ids = list(
+            models.OutgoingEmail.objects.due()
+            # Also gives up on emails that keep taking their workers down
+            .filter(attempts__lt=settings.EMAIL_OUTBOX_MAX_ATTEMPTS)
+            .select_for_update(skip_locked=True)
+            .order_by('next_attempt')
+            .values_list('pk', flat=True)
+            [:batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE])
+
+        models.OutgoingEmail.objects.filter(pk__in=ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt=now() + timedelta(
+                seconds=settings.EMAIL_OUTBOX_LEASE_TIMEOUT))
+
+    return list(
+        models.OutgoingEmail.objects
+        .filter(pk__in=ids)
+        .select_related('ticket_ownership__user',
+                        'ticket_ownership__ticket__ticket_type__event')
+        .order_by('next_attempt'))
+
+
+def fail(email, exc):
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        logger.error('Giving up on email %s', email.pk, exc_info=exc)
+        next_attempt = None
+    else:
+        logger.warning('Failed to send email %s, retrying', email.pk,
+                       exc_info=exc)
+        next_attempt = now() + get_retry_delay(email.attempts)
+
+    models.OutgoingEmail.objects.filter(pk=email.pk).update(
+        next_attempt=next_attempt,
+        last_error=repr(exc))
+
+
+def deliver(emails):
+    """
+    Sends the emails over a single connection, at most
+    EMAIL_OUTBOX_RATE_LIMIT per second. Returns the number of emails sent.
+    """
+    connection = get_connection()
+    interval = 1 / settings.EMAIL_OUTBOX_RATE_LIMIT
+    sent_ids = []
+    last_sent = 0
+
+    try:
+        for email in emails:
+            try:
+                message = email.get_message()
+                message.connection = connection
+
+                sleep(max(last_sent + interval - time(), 0))
+                last_sent = time()
+                # Sending closes connections it had to open itself, so we
+                # keep ours open for the whole batch.
+                connection.open()
+                try:
+                    message.send()
+                except SMTPServerDisconnected:
+                    # The server hung up between messages, try once more on
+                    # a fresh connection.
+                    connection.close()
+                    connection.open()
+                    message.send()
+            except Exception as exc:
+                fail(email, exc)
+            else:
+                sent_ids.append(email.pk)
+    finally:
+        connection.close()
+
+        models.OutgoingEmail.objects.filter(pk__in=sent_ids).update(
+            sent=now(),
+            next_attempt=None,
+            last_error='')
+
+    return len(sent_ids)
+
+
+class Worker(workers.Worker):
+    """
+    Sends queued emails until stopped.
+    """
+
+    channel = NOTIFY_CHANNEL
+
+    def __init__(self, poll_interval=None):
+        super(Worker, self).__init__(
+            poll_interval if poll_interval is not None
+            else settings.EMAIL_WORKER_POLL_INTERVAL)
+
+    def work(self):
+        emails = claim()
+        if not emails:
+            return False
+
+        deliver(emails)
+        return True
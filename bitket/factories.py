@@ -69,7 +69,6 @@ class UserFactory(factory.DjangoModelFactory):
 
 class StudentUnionFactory(factory.DjangoModelFactory):
     name = factory.fuzzy.FuzzyText()
-    slug = factory.LazyAttribute(lambda o: slugify(o.name))
 
     class Meta:
         model = models.StudentUnion
@@ -83,7 +82,7 @@ class StudentUnionMemberConditionFactory(ConditionFactory):
 
 
 class TicketFactory(factory.DjangoModelFactory):
-    product = factory.SubFactory(TicketTypeFactory)
+    ticket_type = factory.SubFactory(TicketTypeFactory)
 
     class Meta:
         model = models.Ticket
@@ -1,12 +1,15 @@
 import logging
 import json
+from uuid import UUID
 
-from django.conf import settings
+import sesam
 from django.db.models import Q
 import django_filters
 from rest_framework import filters
 
+from . import students
 from .models import Ticket
+from .scanning import ScanIndex
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +54,16 @@ class TicketOwnershipFilter(filters.BaseFilterBackend):
     def filter_queryset(self, request, queryset, view):
         if view.action == 'search':
             search_term = request.query_params['query'].strip()
+
+            event_pk = request.query_params.get('event')
+            if event_pk:
+                # The door scanning path, see bitket.scanning
+                try:
+                    index = ScanIndex(UUID(event_pk))
+                except ValueError:
+                    return queryset.none()
+                return queryset.filter(pk__in=index.lookup(search_term))
+
             query = (
                 Q(pk__icontains=search_term) |
                 Q(code__icontains=search_term) |
@@ -60,9 +73,9 @@ class TicketOwnershipFilter(filters.BaseFilterBackend):
 
             if search_term.isdigit():
                 try:
-                    sesam_response = settings.SESAM_STUDENT_SERVICE_CLIENT.get_student(
+                    sesam_response = students.get_student(
                         mifare_id=search_term)
-                except:
+                except sesam.Error:
                     pass
                 else:
                     query |= Q(user__email=sesam_response.email)
@@ -0,0 +1,327 @@
+"""
+Imports tickets paid for outside of Bitket from CSV or TSV files.
+
+What the columns of a file mean is declared in a JSON mapping:
+
+    {
+        "event": "<event ID>",
+        "user": "LiU-ID or email",
+        "name": "Name",
+        "skip": ["Error"],
+        "ticket_type": {
+            "column": "Ticket",
+            "values": {
+                "Banquet (beer)": "Banquet + party ticket",
+                "Party": "Party ticket"
+            }
+        },
+        "variation_choices": {
+            "Ticket": {"Banquet (beer)": "Beer", "Party": null},
+            "Food": {"": "No special requests", "Vegan": "Vegan"}
+        }
+    }
+
+Users are given by LiU ID, looked up in Sesam, or by email. Rows with any of
+the skip columns filled in are left out. Ticket types and variation choices
+are given by name, by the values of their columns. A value may be mapped to
+no choice, and choices the ticket type of the row does not have are left out.
+
+Rows are imported in batches, each in a transaction of its own. The IDs of the
+tickets are derived from the event, the key of the import and the positions of
+the rows, so rows already imported under the same key are skipped and a failed
+import can simply be run again, also with fixed rows. Rows must be fixed in
+place: inserting or removing rows moves the ones after them, which are then
+imported again as new tickets.
+"""
+import csv
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import sesam
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from . import availability, emails, manifests, models, scanning, students
+from .fields import LIU_ID
+
+Row = namedtuple('Row', 'number ticket_type variation_choices liu_id email '
+                        'name')
+Result = namedtuple('Result', 'number ticket_id price error')
+
+
+class RowError(Exception):
+    pass
+
+
+class SesamUnavailable(RowError):
+    # Not kept for the rest of the import, since Sesam may be back by then
+    pass
+
+
+class Mapping(object):
+    def __init__(self, data):
+        try:
+            self.event = models.Event.objects.get(pk=data['event'])
+        except (models.Event.DoesNotExist, ValidationError):
+            raise ValueError('No event {}'.format(data['event']))
+        self.user_column = data['user']
+        self.name_column = data.get('name')
+        self.skip_columns = data.get('skip', [])
+
+        ticket_types = {t.name: t for t in self.event.ticket_types.all()}
+        self.ticket_type_column = data['ticket_type']['column']
+        self.ticket_types = {}
+        for value, name in data['ticket_type']['values'].items():
+            if name not in ticket_types:
+                raise ValueError('No ticket type {}'.format(name))
+            self.ticket_types[value] = ticket_types[name]
+
+        self.choices = {}
+        for choice in (models.VariationChoice.objects
+                       .filter(variation__ticket_type__event=self.event)
+                       .select_related('variation')):
+            self.choices.setdefault(choice.variation.ticket_type_id, {})[
+                choice.name] = choice
+        names = {name for choices in self.choices.values() for name in choices}
+        self.variation_choices = data.get('variation_choices', {})
+        for values in self.variation_choices.values():
+            for name in values.values():
+                if name is not None and name not in names:
+                    raise ValueError('No variation choice {}'.format(name))
+
+    def get_value(self, row, column):
+        value = row.get(column)
+        if value is None:
+            raise RowError('No {} column'.format(column))
+        return value.strip()
+
+    def parse(self, number, row):
+        """
+        Returns the row, or None if it is to be skipped.
+        """
+        if any(self.get_value(row, c) for c in self.skip_columns):
+            return None
+
+        value = self.get_value(row, self.ticket_type_column)
+        try:
+            ticket_type = self.ticket_types[value]
+        except KeyError:
+            raise RowError('Unknown ticket type {!r}'.format(value))
+
+        variation_choices = []
+        choices = self.choices.get(ticket_type.pk, {})
+        for column, values in self.variation_choices.items():
+            value = self.get_value(row, column)
+            try:
+                name = values[value]
+            except KeyError:
+                raise RowError('Unknown {} {!r}'.format(column, value))
+            if name in choices:
+                variation_choices.append(choices[name])
+
+        user = self.get_value(row, self.user_column).lower()
+        liu_id = email = None
+        if LIU_ID.match(user):
+            liu_id = user
+        elif user.endswith('@student.liu.se'):
+            liu_id = user.split('@')[0]
+        else:
+            try:
+                validate_email(user)
+            except ValidationError:
+                raise RowError('Invalid email {!r}'.format(user))
+            email = user
+
+        name = self.get_value(row, self.name_column) if self.name_column else ''
+        return Row(number, ticket_type, variation_choices, liu_id, email,
+                   name or email)
+
+
+def get_reader(f, dialect=None):
+    if dialect is None:
+        dialect = 'excel-tab' if f.name.endswith(('.tsv', '.tab')) else 'excel'
+    return csv.DictReader(f, dialect=dialect)
+
+
+class Importer(object):
+    def __init__(self, mapping, key, threads=8):
+        self.mapping = mapping
+        self.namespace = uuid.uuid5(
+            uuid.NAMESPACE_URL,
+            'bitket.imports.{}.{}'.format(mapping.event.pk, key))
+        self.executor = ThreadPoolExecutor(threads)
+        # Looked up once per import
+        self.students = {}
+        self.users = {}
+        self.unions = dict(
+            models.StudentUnion.objects.values_list('name', 'pk'))
+        self.ticket_types = {}
+
+    def get_ticket_id(self, number):
+        return uuid.uuid5(self.namespace, str(number))
+
+    def get_student(self, liu_id):
+        try:
+            return students.get_student(liu_id=liu_id)
+        except sesam.StudentNotFound:
+            return RowError('No student {}'.format(liu_id))
+        except sesam.Error:
+            return SesamUnavailable('Sesam request failed')
+
+    def get_union_pk(self, name):
+        if not name:
+            return None
+        if name not in self.unions:
+            self.unions[name] = models.StudentUnion.objects.get_or_create(
+                name=name)[0].pk
+        return self.unions[name]
+
+    def resolve_users(self, rows):
+        """
+        Returns the users of the rows, keyed by row number, or the errors
+        telling why there are none.
+        """
+        liu_ids = list({r.liu_id for r in rows if r.liu_id} -
+                       set(self.students))
+        # Sesam is asked concurrently, once per LiU ID
+        looked_up = dict(zip(
+            liu_ids, self.executor.map(self.get_student, liu_ids)))
+        self.students.update(looked_up)
+
+        details = {}
+        for row in rows:
+            if row.liu_id is None:
+                details[row.number] = (row.email, row.name, None)
+                continue
+            student = self.students[row.liu_id]
+            if isinstance(student, RowError):
+                details[row.number] = student
+            else:
+                details[row.number] = (student.email.lower(),
+                                       student.full_name,
+                                       self.get_union_pk(student.main_union))
+        for liu_id, student in looked_up.items():
+            if isinstance(student, SesamUnavailable):
+                del self.students[liu_id]
+
+        missing_emails = {d[0] for d in details.values()
+                          if not isinstance(d, RowError)} - set(self.users)
+        self.users.update(
+            (user.email_lower, user) for user in
+            models.User.objects
+            .annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=missing_emails))
+
+        new_users = OrderedDict()
+        union_changes = {}
+        for number, detail in details.items():
+            if isinstance(detail, RowError):
+                continue
+            email, name, union_pk = detail
+            user = self.users.get(email)
+            if user is None:
+                user = new_users.setdefault(email, models.User(
+                    email=email, name=name, student_union_id=union_pk))
+                user.set_unusable_password()
+            elif (union_pk is not None and
+                  user.student_union_id != union_pk):
+                user.student_union_id = union_pk
+                union_changes[user.pk] = union_pk
+
+        models.User.objects.bulk_create(new_users.values())
+        self.users.update(new_users)
+        if union_changes:
+            students.set_unions(union_changes)
+
+        return {
+            number: detail if isinstance(detail, RowError)
+            else self.users[detail[0]]
+            for number, detail in details.items()
+        }
+
+    def import_rows(self, rows):
+        """
+        Imports the rows, unless imported already, and returns their results.
+        """
+        ticket_ids = {r.number: self.get_ticket_id(r.number) for r in rows}
+        imported = set(models.Ticket.objects
+                       .filter(pk__in=ticket_ids.values())
+                       .values_list('pk', flat=True))
+        rows = [r for r in rows if ticket_ids[r.number] not in imported]
+        if not rows:
+            return []
+
+        results = []
+        entries = []
+        with transaction.atomic():
+            users = self.resolve_users(rows)
+            for row in rows:
+                user = users[row.number]
+                if isinstance(user, RowError):
+                    results.append(Result(row.number, None, None, user))
+                    continue
+                self.ticket_types[row.ticket_type.pk] = row.ticket_type
+                entries.append((
+                    models.Ticket(pk=ticket_ids[row.number],
+                                  ticket_type=row.ticket_type,
+                                  pending=False),
+                    row.variation_choices, user))
+
+            ownerships = (models.TicketOwnership.objects
+                          .bulk_create_with_tickets(entries))
+            # The tickets were paid for, just not through Bitket
+            transactions = models.Transaction.objects.bulk_create([
+                models.Transaction(amount=o.price) for o in ownerships])
+            through = models.TicketOwnership.transactions.through
+            through.objects.bulk_create([
+                through(ticketownership_id=o.pk, transaction_id=t.pk)
+                for o, t in zip(ownerships, transactions)])
+            # Sent by the email worker once this commits
+            emails.queue_confirmations(ownerships)
+            manifests.record(self.mapping.event.pk,
+                             [o.ticket_id for o in ownerships])
+
+        numbers = {ticket_id: number for number, ticket_id in ticket_ids.items()}
+        results += [Result(numbers[o.ticket_id], o.ticket_id, o.price, None)
+                    for o in ownerships]
+        return sorted(results)
+
+    def run(self, reader, batch_size=500):
+        """
+        Imports the rows of the reader in batches, yielding the results of
+        each row, with errors for rows that could not be imported.
+        """
+        numbered = enumerate(reader, start=1)
+        try:
+            while True:
+                batch = list(islice(numbered, batch_size))
+                if not batch:
+                    break
+
+                rows = []
+                for number, data in batch:
+                    try:
+                        row = self.mapping.parse(number, data)
+                    except RowError as exc:
+                        yield Result(number, None, None, exc)
+                    else:
+                        if row is not None:
+                            rows.append(row)
+                yield from self.import_rows(rows)
+        finally:
+            self.executor.shutdown()
+            self.finish()
+
+    def finish(self):
+        # Bulk inserts skip the signals keeping these up to date
+        availability.invalidate(self.mapping.event.pk)
+        for ticket_type in self.ticket_types.values():
+            if ticket_type.inventory.is_limited:
+                ticket_type.inventory.reconcile()
+        index = scanning.ScanIndex(self.mapping.event.pk)
+        if index.client.exists(index.key):
+            index.build()
@@ -0,0 +1,194 @@
+import logging
+from time import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import WatchError
+
+logger = logging.getLogger(__name__)
+
+# KEYS: sold counter, holds
+# ARGV: current time, hold expiry time, maximum total quantity, ticket ids...
+RESERVE_SCRIPT = """
+local sold = redis.call('get', KEYS[1])
+if not sold then
+    return false
+end
+
+redis.call('zremrangebyscore', KEYS[2], '-inf', ARGV[1])
+local available = tonumber(ARGV[3]) - tonumber(sold) - redis.call('zcard', KEYS[2])
+local reserved = {}
+
+for i = 4, #ARGV do
+    if redis.call('zscore', KEYS[2], ARGV[i]) then
+        redis.call('zadd', KEYS[2], ARGV[2], ARGV[i])
+        table.insert(reserved, ARGV[i])
+    elseif available > 0 then
+        redis.call('zadd', KEYS[2], ARGV[2], ARGV[i])
+        table.insert(reserved, ARGV[i])
+        available = available - 1
+    end
+end
+
+return reserved
+"""
+
+# KEYS: sold counter, holds
+# ARGV: ticket ids...
+COMMIT_SCRIPT = """
+local committed = 0
+
+for i = 1, #ARGV do
+    committed = committed + redis.call('zrem', KEYS[2], ARGV[i])
+end
+
+if committed > 0 and redis.call('exists', KEYS[1]) == 1 then
+    redis.call('incrby', KEYS[1], committed)
+end
+
+return committed
+"""
+
+
+class Inventory(object):
+    """
+    Keeps track of the units of a ticket type in Redis.
+
+    Units are either sold or held. A hold is taken for every admitted ticket
+    and lasts until the ticket is paid for (and the hold turned into a sold
+    unit), released or expired. The sold counter is initialized from, and can
+    be reconciled against, the ticket table.
+
+    Since a ticket is marked as purchased in the database *before* its hold is
+    committed, a reconciliation can only ever overcount, never oversell.
+    """
+
+    def __init__(self, ticket_type):
+        self.ticket_type = ticket_type
+        self.client = get_redis_connection('default')
+
+    @property
+    def sold_key(self):
+        return 'bitket.inventory.{}.sold'.format(self.ticket_type.pk)
+
+    @property
+    def holds_key(self):
+        return 'bitket.inventory.{}.holds'.format(self.ticket_type.pk)
+
+    @property
+    def is_limited(self):
+        return self.ticket_type.max_total_quantity is not None
+
+    def count_sold(self):
+        return self.ticket_type.tickets.unpending().count()
+
+    def initialize(self):
+        self.client.setnx(self.sold_key, self.count_sold())
+
+    def get_sold_count(self):
+        sold = self.client.get(self.sold_key)
+        if sold is None:
+            self.initialize()
+            sold = self.client.get(self.sold_key)
+        return int(sold)
+
+    def get_held_count(self):
+        return self.client.zcount(self.holds_key, time(), '+inf')
+
+    def get_held_ids(self):
+        return {i.decode() for i in self.client.zrangebyscore(
+            self.holds_key, time(), '+inf')}
+
+    def get_remaining_count(self):
+        if not self.is_limited:
+            return None
+        return max(self.ticket_type.max_total_quantity -
+                   self.get_sold_count() - self.get_held_count(), 0)
+
+    def reserve(self, ticket_ids):
+        """
+        Takes holds for as many of the tickets as there are units left, in the
+        given order. Returns the ids of the tickets that got a hold.
+        """
+        ticket_ids = [str(i) for i in ticket_ids]
+
+        if not self.is_limited or not ticket_ids:
+            return set(ticket_ids)
+
+        reserve = self.client.register_script(RESERVE_SCRIPT)
+        now = time()
+        args = [now, now + settings.INVENTORY_HOLD_TIMEOUT,
+                self.ticket_type.max_total_quantity] + ticket_ids
+
+        reserved = reserve(keys=[self.sold_key, self.holds_key], args=args)
+        if reserved is None:
+            self.initialize()
+            reserved = reserve(keys=[self.sold_key, self.holds_key],
+                               args=args)
+
+        return {i.decode() for i in reserved}
+
+    def commit(self, ticket_ids):
+        """
+        Turns the holds of purchased tickets into sold units. Must be called
+        after the tickets are marked as purchased in the database.
+        """
+        ticket_ids = [str(i) for i in ticket_ids]
+
+        if not self.is_limited or not ticket_ids:
+            return 0
+
+        commit = self.client.register_script(COMMIT_SCRIPT)
+        committed = commit(keys=[self.sold_key, self.holds_key],
+                           args=ticket_ids)
+
+        if committed < len(ticket_ids):
+            logger.warning(
+                'Committed %d tickets of %s without holds, reconciliation '
+                'needed', len(ticket_ids) - committed, self.ticket_type)
+            self.reconcile()
+
+        return committed
+
+    def release(self, ticket_ids):
+        ticket_ids = [str(i) for i in ticket_ids]
+
+        if not self.is_limited or not ticket_ids:
+            return
+
+        self.client.zrem(self.holds_key, *ticket_ids)
+
+    def clear(self):
+        self.client.delete(self.sold_key, self.holds_key)
+
+    def reconcile(self):
+        """
+        Resets the sold counter from the ticket table and drops holds for
+        tickets that are no longer pending.
+
+        Starts over if a unit is reserved or committed meanwhile, which would
+        otherwise be overwritten by a count taken before it.
+        """
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.sold_key, self.holds_key)
+                    held_ids = [i.decode() for i in pipe.zrange(
+                        self.holds_key, 0, -1)]
+                    pending_ids = {
+                        str(i) for i in
+                        self.ticket_type.tickets.pending()
+                        .filter(pk__in=held_ids)
+                        .values_list('pk', flat=True)
+                    }
+                    sold_count = self.count_sold()
+
+                    pipe.multi()
+                    pipe.set(self.sold_key, sold_count)
+                    stale_ids = [i for i in held_ids if i not in pending_ids]
+                    if stale_ids:
+                        pipe.zrem(self.holds_key, *stale_ids)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bitket import models
+
+
+class Command(BaseCommand):
+    help = ('Points tickets without a current ownership to their latest '
+            'ownerships, e.g. after ownerships were written around the ORM. '
+            'Existing tickets are already pointed by the migration adding '
+            'current ownerships.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of tickets to update per query.')
+
+    def handle(self, *args, **options):
+        tickets = (models.Ticket.objects
+                   .filter(current_ownership__isnull=True,
+                           ownerships__isnull=False)
+                   .distinct()
+                   .order_by('pk')
+                   .values_list('pk', flat=True))
+        updated = 0
+
+        while True:
+            # Updated rows drop out of the queryset, so we always take the
+            # first batch.
+            batch = list(tickets[:options['batch_size']])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                models.Ticket.objects.filter(
+                    pk__in=batch).update_current_ownerships()
+
+            updated += len(batch)
+            self.stdout.write('{} tickets updated'.format(updated))
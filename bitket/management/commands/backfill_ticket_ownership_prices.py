@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from bitket import models
+from bitket.db.fields import MoneyField
+
+
+class Command(BaseCommand):
+    help = ('Stores the prices of ticket ownerships created before prices '
+            'were stored.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of ticket ownerships to update per query.')
+
+    def handle(self, *args, **options):
+        ownerships = (models.TicketOwnership.objects
+                      .filter(price__isnull=True)
+                      .select_related('ticket__ticket_type')
+                      .prefetch_related('modifiers',
+                                        'ticket__variation_choices')
+                      .order_by('pk'))
+        updated = 0
+
+        while True:
+            # Updated rows drop out of the queryset, so we always take the
+            # first batch.
+            batch = list(ownerships[:options['batch_size']])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                models.TicketOwnership.objects.filter(
+                    pk__in=[o.pk for o in batch],
+                    price__isnull=True,
+                ).update(price=Case(
+                    *[When(pk=o.pk, then=Value(o.calculate_price(
+                        o.ticket.ticket_type,
+                        o.modifiers.all(),
+                        o.ticket.variation_choices.all())))
+                      for o in batch],
+                    output_field=MoneyField()))
+
+            updated += len(batch)
+            self.stdout.write('{} ticket ownerships updated'.format(updated))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from bitket import models
+from bitket.scanning import ScanIndex
+
+
+class Command(BaseCommand):
+    help = ('Builds the door scan indexes of events, best done as the doors '
+            'open.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'events', nargs='+', metavar='event',
+            help='IDs of the events to build the indexes of.')
+
+    def handle(self, *args, **options):
+        for event in models.Event.objects.filter(pk__in=options['events']):
+            entries = ScanIndex(event.pk).build()
+            self.stdout.write('{}: {} entries'.format(event, entries))
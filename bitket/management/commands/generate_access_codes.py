@@ -0,0 +1,50 @@
+from time import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from bitket import access_codes, models
+
+
+class Command(BaseCommand):
+    help = ('Generates access codes for a ticket type and writes their tokens '
+            'and links as CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('ticket_type', help='ID of the ticket type.')
+        parser.add_argument('count', type=int,
+                            help='Number of access codes to generate.')
+        parser.add_argument(
+            '--output',
+            help='File to write the CSV to. Defaults to standard output.')
+        parser.add_argument(
+            '--processes', type=int,
+            help='Number of signing processes. Defaults to the number of '
+                 'CPUs.')
+
+    def handle(self, *args, **options):
+        try:
+            ticket_type = (models.TicketType.objects
+                           .select_related('event')
+                           .get(pk=options['ticket_type']))
+        except (models.TicketType.DoesNotExist, ValidationError):
+            raise CommandError('No ticket type {}'.format(
+                options['ticket_type']))
+
+        start = time()
+        pks = access_codes.generate(ticket_type, options['count'])
+        generated = time()
+
+        chunks = access_codes.export([(ticket_type, pks)],
+                                     processes=options['processes'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8',
+                      newline='') as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+
+        self.stderr.write(
+            'Generated {} access codes in {:.1f}s, exported in {:.1f}s'.format(
+                len(pks), generated - start, time() - generated))
@@ -0,0 +1,63 @@
+import csv
+import json
+from time import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bitket import imports
+
+
+class Command(BaseCommand):
+    help = ('Imports tickets paid for outside of Bitket from a CSV or TSV '
+            'file, as described in bitket.imports. Writes the row number, '
+            'ticket ID and price of each imported row as CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('mapping', help='JSON file mapping the columns.')
+        parser.add_argument('file', help='CSV or TSV file to import.')
+        parser.add_argument(
+            '--key', required=True,
+            help='Identifies the import within the event, rows imported '
+                 'under the same key are skipped. Use the same key when '
+                 'running a fixed file again.')
+        parser.add_argument(
+            '--dialect', choices=csv.list_dialects(),
+            help='CSV dialect of the file. Defaults to excel-tab for .tsv '
+                 'files and excel otherwise.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows to import per transaction.')
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Number of concurrent Sesam requests.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['mapping'], encoding='utf-8') as f:
+                mapping = imports.Mapping(json.load(f))
+        except (KeyError, ValueError) as exc:
+            raise CommandError('Invalid mapping: {}'.format(exc))
+
+        importer = imports.Importer(mapping, options['key'],
+                                    threads=options['threads'])
+        imported = failed = 0
+        start = time()
+
+        with open(options['file'], encoding='utf-8', newline='') as f:
+            writer = csv.writer(self.stdout, lineterminator='\n')
+            for result in importer.run(
+                    imports.get_reader(f, options['dialect']),
+                    batch_size=options['batch_size']):
+                if result.error is not None:
+                    failed += 1
+                    self.stderr.write('Row {}: {}'.format(result.number,
+                                                          result.error))
+                    continue
+                imported += 1
+                writer.writerow([result.number, result.ticket_id,
+                                 result.price])
+
+        self.stderr.write('Imported {} rows in {:.1f}s, {} failed'.format(
+            imported, time() - start, failed))
+        if failed:
+            raise CommandError('Fix the failed rows and run the import again')
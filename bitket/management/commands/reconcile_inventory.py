@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from bitket import models
+
+
+class Command(BaseCommand):
+    help = 'Reconciles the ticket type inventories with the ticket table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'ticket_types', nargs='*', metavar='ticket_type',
+            help='IDs of the ticket types to reconcile. Defaults to all '
+                 'limited ticket types.')
+
+    def handle(self, *args, **options):
+        ticket_types = models.TicketType.objects.filter(
+            max_total_quantity__isnull=False)
+        if options['ticket_types']:
+            ticket_types = ticket_types.filter(pk__in=options['ticket_types'])
+
+        for ticket_type in ticket_types:
+            ticket_type.inventory.reconcile()
+            self.stdout.write('{}: {} sold, {} held, {} remaining'.format(
+                ticket_type,
+                ticket_type.inventory.get_sold_count(),
+                ticket_type.inventory.get_held_count(),
+                ticket_type.inventory.get_remaining_count()))
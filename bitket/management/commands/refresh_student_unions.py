@@ -0,0 +1,111 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+
+import sesam
+from django.core.management.base import BaseCommand
+from social_django.models import UserSocialAuth
+
+from bitket import models, students
+
+logger = logging.getLogger(__name__)
+
+
+def get_union_name(nor_edu_person_lin):
+    """
+    Returns the name of the student's union, None if they have none, or
+    False if Sesam could not tell.
+    """
+    try:
+        return students.get_student(
+            fresh=True, nor_edu_person_lin=nor_edu_person_lin).main_union
+    except sesam.StudentNotFound:
+        return None
+    except sesam.Error:
+        logger.warning('Sesam request failed', exc_info=True)
+        return False
+
+
+class Command(BaseCommand):
+    help = ('Looks up the student unions of all users who have logged in '
+            'with LiU in Sesam and updates those that changed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Number of concurrent Sesam requests.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of users to look up before writing their changes.')
+        parser.add_argument(
+            '--interval', type=int,
+            help='Refreshes again every this many seconds instead of exiting.')
+
+    def handle(self, *args, **options):
+        while True:
+            self.refresh(options['threads'], options['batch_size'])
+            if not options['interval']:
+                break
+            sleep(options['interval'])
+
+    def get_users(self):
+        """
+        Yields the ID, norEduPersonLIN and current union ID of each LiU user.
+        """
+        seen = set()
+        for user_pk, extra_data, union_pk in (
+                UserSocialAuth.objects
+                .filter(provider='liu')
+                .order_by('user_id')
+                .values_list('user_id', 'extra_data', 'user__student_union_id')
+                .iterator()):
+            lin = (extra_data or {}).get('nor_edu_person_lin')
+            if lin and user_pk not in seen:
+                seen.add(user_pk)
+                yield user_pk, lin, union_pk
+
+    def get_union_pk(self, name):
+        if name is None:
+            return None
+        if name not in self.unions:
+            self.unions[name] = models.StudentUnion.objects.get_or_create(
+                name=name)[0].pk
+        return self.unions[name]
+
+    def refresh(self, threads, batch_size):
+        self.unions = dict(
+            models.StudentUnion.objects.values_list('name', 'pk'))
+        checked = changed = failed = 0
+        start = time()
+
+        users = self.get_users()
+        with ThreadPoolExecutor(threads) as executor:
+            while True:
+                batch = [user for _, user in zip(range(batch_size), users)]
+                if not batch:
+                    break
+
+                names = executor.map(get_union_name,
+                                     [lin for _, lin, _ in batch])
+                changes = {}
+                for (user_pk, _, union_pk), name in zip(batch, names):
+                    if name is False:
+                        failed += 1
+                        continue
+                    new_union_pk = self.get_union_pk(name)
+                    if new_union_pk != union_pk:
+                        changes[user_pk] = new_union_pk
+
+                if changes:
+                    students.set_unions(changes)
+
+                checked += len(batch)
+                changed += len(changes)
+                self.stdout.write(
+                    '{} users checked, {} changed, {} failed '
+                    '({:.1f} users/s)'.format(
+                        checked, changed, failed,
+                        checked / (time() - start)))
+
+        self.stdout.write('Refreshed {} users in {:.1f}s'.format(
+            checked, time() - start))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from bitket import emails
+
+
+class Command(BaseCommand):
+    help = 'Sends queued emails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Send the emails that are due and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            sent = 0
+            while True:
+                batch = emails.claim()
+                if not batch:
+                    break
+                sent += emails.deliver(batch)
+            self.stdout.write('Sent {} emails'.format(sent))
+            return
+
+        self.stdout.write('Started email worker')
+        emails.Worker().run()
@@ -0,0 +1,47 @@
+import signal
+from multiprocessing import Process, cpu_count
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from bitket.purchases import Worker
+
+
+def run_worker():
+    # Forked processes must not share the parent's database connections.
+    connections.close_all()
+    Worker().run()
+
+
+class Command(BaseCommand):
+    help = 'Runs a pool of processes handling queued purchases.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=cpu_count(),
+            help='Number of worker processes. Defaults to the number of CPUs.')
+
+    def handle(self, *args, **options):
+        connections.close_all()
+        processes = [Process(target=run_worker, daemon=True)
+                     for _ in range(options['processes'])]
+
+        def stop(*args):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+
+        for process in processes:
+            process.start()
+
+        self.stdout.write('Started {} purchase workers'.format(len(processes)))
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # The workers got the signal too and finish their current job.
+            for process in processes:
+                process.join()
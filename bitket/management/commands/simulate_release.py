@@ -0,0 +1,233 @@
+import json
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import BytesIO
+from random import Random
+from time import time
+from uuid import uuid4
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from rest_framework.reverse import reverse
+from rest_framework_jwt.settings import api_settings
+
+from bitket import models
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Rehearses a ticket release: seeds an event, lets simulated '
+            'buyers purchase concurrently through the WSGI application with '
+            'the fake payment provider and reports how it went. Fails if any '
+            'ticket type is oversold. Run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--buyers', type=int, default=500,
+            help='Number of buyers, each making one purchase.')
+        parser.add_argument(
+            '--concurrency', type=int, default=10,
+            help='Number of purchases in flight at once.')
+        parser.add_argument(
+            '--ticket-types', type=int, default=2,
+            help='Number of ticket types in the event.')
+        parser.add_argument(
+            '--max-total-quantity', type=int, default=100,
+            help='Number of tickets of each ticket type.')
+        parser.add_argument(
+            '--tickets-per-purchase', type=int, default=1,
+            help='Number of tickets, of different types, per purchase.')
+        parser.add_argument(
+            '--payment-latency', type=float, default=0.3,
+            help='Seconds each charge takes.')
+        parser.add_argument(
+            '--decline-rate', type=float, default=0.1,
+            help='Share of charges being declined.')
+        parser.add_argument(
+            '--seed', type=int,
+            help='Seed for picking the ticket types of each purchase.')
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Keep the seeded event, buyers and tickets.')
+
+    def seed(self, options):
+        suffix = uuid4().hex[:8]
+        organization = models.Organization.objects.create(
+            name='Simulated organization {}'.format(suffix),
+            organization_number='000000-0000',
+            address='-',
+            email='simulated-{}@example.com'.format(suffix))
+        event = models.Event.objects.create(
+            name='Simulated release {}'.format(suffix),
+            organization=organization,
+            published=True)
+        ticket_types = [
+            models.TicketType.objects.create(
+                name='Ticket type {}'.format(i + 1),
+                event=event,
+                price=Decimal(100),
+                is_published=True,
+                is_generally_available=True,
+                max_personal_quantity=None,
+                max_total_quantity=options['max_total_quantity'])
+            for i in range(options['ticket_types'])]
+        users = models.User.objects.bulk_create([
+            models.User(
+                name='Simulated buyer {}'.format(i + 1),
+                email='simulated-{}-{}@example.com'.format(suffix, i + 1))
+            for i in range(options['buyers'])])
+
+        return organization, ticket_types, users
+
+    def tear_down(self, organization, ticket_types, users):
+        models.Transaction.objects.filter(
+            ticket_ownerships__user__in=users).delete()
+        models.User.objects.filter(pk__in=[u.pk for u in users]).delete()
+        # Takes the event, ticket types and tickets with it
+        organization.delete()
+        for ticket_type in ticket_types:
+            ticket_type.inventory.clear()
+
+    def get_environ(self, user, body):
+        token = api_settings.JWT_ENCODE_HANDLER(
+            api_settings.JWT_PAYLOAD_HANDLER(user))
+        return {
+            'REQUEST_METHOD': 'POST',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': reverse('purchase-list'),
+            'QUERY_STRING': '',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '443',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'HTTP_X_FORWARDED_PROTO': 'https',
+            'HTTP_AUTHORIZATION': 'JWT {}'.format(token),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'https',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+    def purchase(self, application, user, ticket_types):
+        body = json.dumps({
+            'access_codes': [],
+            'tickets': [
+                {
+                    'ticket_type': reverse('tickettype-detail',
+                                           kwargs={'pk': ticket_type.pk}),
+                    'variation_choices': []
+                }
+                for ticket_type in ticket_types
+            ],
+            'payment': {
+                'type': 'stripe',
+                'payload': 'tok_visa',
+                'amount': str(sum(t.price for t in ticket_types))
+            },
+            'user': {
+                'nin': '9011290799'
+            }
+        }).encode()
+        status = []
+
+        def start_response(response_status, headers):
+            status.append(int(response_status.split()[0]))
+
+        # Each thread has a connection of its own, whose log is reset when a
+        # request starts.
+        connection.force_debug_cursor = True
+        start_time = time()
+        response = application(self.get_environ(user, body), start_response)
+        content = b''.join(response)
+        response.close()
+        latency = time() - start_time
+
+        tickets = 0
+        if status[0] == 207:
+            tickets = len(json.loads(content.decode())['tickets'])
+
+        return status[0], latency, len(connection.queries_log), tickets
+
+    def handle(self, *args, **options):
+        if options['tickets_per_purchase'] > options['ticket_types']:
+            raise CommandError(
+                'Cannot buy more ticket types than there are.')
+
+        organization, ticket_types, users = self.seed(options)
+        application = WSGIHandler()
+        random = Random(options['seed'])
+        purchases = [
+            (user, random.sample(ticket_types,
+                                 options['tickets_per_purchase']))
+            for user in users]
+
+        self.stdout.write('Simulating {} buyers, {} at a time, of {} x {} '
+                          'tickets'.format(len(users), options['concurrency'],
+                                           len(ticket_types),
+                                           options['max_total_quantity']))
+
+        try:
+            with override_settings(
+                    PAYMENT_PROVIDER='bitket.payments.FakeProvider',
+                    PAYMENT_FAKE_LATENCY=options['payment_latency'],
+                    PAYMENT_FAKE_DECLINE_RATE=options['decline_rate'],
+                    PURCHASE_QUEUE=False):
+                start_time = time()
+                with ThreadPoolExecutor(options['concurrency']) as executor:
+                    results = list(executor.map(
+                        lambda purchase: self.purchase(
+                            application, *purchase),
+                        purchases))
+                duration = time() - start_time
+
+            self.report(results, duration, ticket_types)
+            oversold = [
+                t for t in ticket_types
+                if t.tickets.unpending().count() > t.max_total_quantity]
+        finally:
+            if not options['keep']:
+                self.tear_down(organization, ticket_types, users)
+
+        if oversold:
+            raise CommandError('Oversold {}'.format(
+                ', '.join(str(t) for t in oversold)))
+
+    def report(self, results, duration, ticket_types):
+        statuses = Counter(status for status, _, _, _ in results)
+        latencies = [latency * 1000 for _, latency, _, _ in results]
+        queries = [q for _, _, q, _ in results]
+
+        self.stdout.write('{} purchases in {:.1f} s, {:.1f} per second'.format(
+            len(results), duration, len(results) / duration))
+        self.stdout.write('Responses: {}'.format(', '.join(
+            '{} x {}'.format(count, status)
+            for status, count in sorted(statuses.items()))))
+        self.stdout.write(
+            'Latency: p50 {:.0f} ms, p95 {:.0f} ms, p99 {:.0f} ms, '
+            'max {:.0f} ms'.format(
+                percentile(latencies, 50), percentile(latencies, 95),
+                percentile(latencies, 99), max(latencies)))
+        self.stdout.write('Queries per request: {:.1f} mean, {} max'.format(
+            sum(queries) / len(queries), max(queries)))
+        self.stdout.write('Tickets purchased: {}'.format(
+            sum(t for _, _, _, t in results)))
+
+        for ticket_type in ticket_types:
+            self.stdout.write('{}: {} of {} sold, {} pending'.format(
+                ticket_type,
+                ticket_type.tickets.unpending().count(),
+                ticket_type.max_total_quantity,
+                ticket_type.tickets.pending().count()))
@@ -0,0 +1,263 @@
+"""
+Lets door scanners validate tickets offline.
+
+The entry manifest of an event lists the current ownership of each of its
+purchased tickets, with its code and whether the ticket is utilized, for
+scanners to validate scans against locally. Manifests are signed with the EC
+private key in ENTRY_MANIFEST_KEY, so scanners only need the public key to
+verify them and cannot forge any. Without a key, offline scanning is off.
+
+Manifests are versioned by a change log in Redis, a sorted set of the tickets
+scored by when they last changed, so scanners can fetch only what changed
+since the version they have. Versions carry the epoch of the log, so a lost
+log makes for a full manifest rather than a wrong diff, and so do versions
+older than what the log, which is trimmed to ENTRY_MANIFEST_CHANGE_LOG_SIZE
+tickets, goes back to.
+
+Utilizations recorded offline are uploaded in batches and reconciled, with
+double entries reported back as conflicts.
+"""
+import json
+from base64 import b64encode
+from collections import OrderedDict
+from functools import lru_cache
+from uuid import uuid4
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+
+from . import models
+
+# KEYS: counter, changes, floor
+# ARGV: maximum size, ticket ids...
+RECORD_SCRIPT = """
+local counter = redis.call('incr', KEYS[1])
+for i = 2, #ARGV do
+    redis.call('zadd', KEYS[2], counter, ARGV[i])
+end
+
+-- Versions from before the oldest change left can no longer be diffed
+local excess = redis.call('zcard', KEYS[2]) - tonumber(ARGV[1])
+if excess > 0 then
+    local last = redis.call('zrange', KEYS[2], excess - 1, excess - 1,
+                            'withscores')
+    redis.call('zremrangebyrank', KEYS[2], 0, excess - 1)
+    redis.call('set', KEYS[3], last[2])
+end
+
+return counter
+"""
+
+
+def is_enabled():
+    return bool(settings.ENTRY_MANIFEST_KEY)
+
+
+@lru_cache(maxsize=None)
+def load_private_key(pem):
+    return serialization.load_pem_private_key(
+        pem.encode(), password=None, backend=default_backend())
+
+
+def get_private_key():
+    if not is_enabled():
+        raise ImproperlyConfigured(
+            'ENTRY_MANIFEST_KEY must be set to sign entry manifests')
+    return load_private_key(settings.ENTRY_MANIFEST_KEY.replace('\\n', '\n'))
+
+
+def sign(manifest):
+    signature = get_private_key().sign(manifest.encode(),
+                                       ec.ECDSA(hashes.SHA256()))
+    return b64encode(signature).decode()
+
+
+class ChangeLog(object):
+    def __init__(self, event_pk):
+        self.event_pk = event_pk
+        self.client = get_redis_connection('default')
+
+    @property
+    def epoch_key(self):
+        return 'bitket.manifests.{}.epoch'.format(self.event_pk)
+
+    @property
+    def counter_key(self):
+        return 'bitket.manifests.{}.counter'.format(self.event_pk)
+
+    @property
+    def changes_key(self):
+        return 'bitket.manifests.{}.changes'.format(self.event_pk)
+
+    @property
+    def floor_key(self):
+        return 'bitket.manifests.{}.floor'.format(self.event_pk)
+
+    def get_epoch(self):
+        self.client.setnx(self.epoch_key, uuid4().hex[:8])
+        return self.client.get(self.epoch_key).decode()
+
+    def get_version(self):
+        return '{}:{}'.format(self.get_epoch(),
+                              int(self.client.get(self.counter_key) or 0))
+
+    def parse_version(self, version):
+        """
+        Returns the counter of a version of this log, or None if it is not.
+        """
+        epoch, _, counter = (version or '').partition(':')
+        if epoch != self.get_epoch() or not counter.isdigit():
+            return None
+        counter = int(counter)
+        latest, floor = self.client.mget(self.counter_key, self.floor_key)
+        if not int(floor or 0) <= counter <= int(latest or 0):
+            return None
+        return counter
+
+    def record(self, ticket_pks):
+        ticket_pks = [str(pk) for pk in ticket_pks]
+        if not ticket_pks:
+            return
+        record = self.client.register_script(RECORD_SCRIPT)
+        record(keys=[self.counter_key, self.changes_key, self.floor_key],
+               args=[settings.ENTRY_MANIFEST_CHANGE_LOG_SIZE] + ticket_pks)
+
+    def get_changed(self, counter):
+        return [pk.decode() for pk in self.client.zrangebyscore(
+            self.changes_key, '({}'.format(counter), '+inf')]
+
+
+def record(event_pk, ticket_pks):
+    ticket_pks = list(ticket_pks)
+    log = ChangeLog(event_pk)
+
+    # Manifests take their version before reading the tickets, so one built
+    # before the change is committed is diffed against it later.
+    transaction.on_commit(lambda: log.record(ticket_pks))
+
+
+@lru_cache(maxsize=1024)
+def get_event_pk(ticket_type_pk):
+    # Ticket types stay with their events
+    return (models.TicketType.objects
+            .values_list('event_id', flat=True)
+            .get(pk=ticket_type_pk))
+
+
+def get_entry(ticket_pk, ownership_pk, code, utilized):
+    return [str(ticket_pk), str(ownership_pk), code, utilized is not None]
+
+
+def build(event_pk, since=None):
+    """
+    Returns the manifest of the event, as a string, and its signature. Given
+    a version, only what changed since is listed, with tickets that are gone
+    listed without an ownership.
+    """
+    log = ChangeLog(event_pk)
+    counter = log.parse_version(since)
+    # Taken before reading the tickets, so nothing changing meanwhile is
+    # missed by the next diff.
+    version = log.get_version()
+
+    tickets = (models.Ticket.objects
+               .filter(ticket_type__event_id=event_pk, pending=False,
+                       current_ownership__isnull=False)
+               .order_by('seq'))
+    if counter is not None:
+        changed_pks = log.get_changed(counter)
+        tickets = tickets.filter(pk__in=changed_pks)
+
+    entries = [
+        get_entry(*row) for row in tickets.values_list(
+            'pk', 'current_ownership_id', 'current_ownership__code',
+            'utilized').iterator()
+    ]
+    if counter is not None:
+        present_pks = {entry[0] for entry in entries}
+        entries += [[pk, None, None, False] for pk in changed_pks
+                    if pk not in present_pks]
+
+    manifest = json.dumps(OrderedDict((
+        ('event', str(event_pk)),
+        ('version', version),
+        ('since', since if counter is not None else None),
+        ('entries', entries),
+    )), separators=(',', ':'))
+    return manifest, sign(manifest)
+
+
+def reconcile(event_pk, utilizations):
+    """
+    Utilizes the tickets of the ownerships scanned offline. Takes (ownership
+    ID, utilized) tuples and returns the IDs of the ownerships accepted and the
+    conflicts, as (ownership ID, reason, utilized) tuples.
+    """
+    # The first scan of an ownership counts, later ones are double entries
+    utilizations = sorted(utilizations, key=lambda u: u[1])
+    accepted = []
+    conflicts = []
+
+    with transaction.atomic():
+        ownerships = {
+            ownership.pk: ownership for ownership in
+            models.TicketOwnership.objects
+            .filter(pk__in={pk for pk, _ in utilizations},
+                    ticket__ticket_type__event_id=event_pk)
+            .select_related('ticket')
+            .select_for_update()
+        }
+
+        updates = {}
+        for ownership_pk, utilized in utilizations:
+            ownership = ownerships.get(ownership_pk)
+            if ownership is None:
+                conflicts.append((ownership_pk,
+                                  models.TicketOwnership.CHECK_IN_UNKNOWN,
+                                  None))
+            elif not ownership.is_current:
+                conflicts.append((ownership_pk,
+                                  models.TicketOwnership.CHECK_IN_NOT_CURRENT,
+                                  None))
+            elif ownership.ticket.utilized is not None:
+                conflicts.append((ownership_pk,
+                                  models.TicketOwnership.CHECK_IN_UTILIZED,
+                                  ownership.ticket.utilized))
+            else:
+                ownership.ticket.utilized = utilized
+                updates[ownership.ticket_id] = utilized
+                accepted.append(ownership_pk)
+
+        if updates:
+            models.Ticket.objects.filter(pk__in=updates).update(
+                utilized=Case(
+                    *[When(pk=pk, then=Value(utilized))
+                      for pk, utilized in updates.items()],
+                    output_field=DateTimeField()))
+            record(event_pk, updates)
+
+    return accepted, conflicts
+
+
+@receiver(post_save, sender='bitket.Ticket')
+@receiver(post_delete, sender='bitket.Ticket')
+def record_ticket(sender, instance, created=False, **kwargs):
+    # New pending tickets are not in manifests yet
+    if created and instance.pending:
+        return
+    record(get_event_pk(instance.ticket_type_id), [instance.pk])
+
+
+@receiver(post_save, sender='bitket.TicketOwnership')
+def record_ownership(sender, instance, created, **kwargs):
+    if created:
+        record(get_event_pk(instance.ticket.ticket_type_id),
+               [instance.ticket_id])
@@ -0,0 +1,112 @@
+"""
+Caches which conditions users meet.
+
+Every cached set of condition IDs is stamped with a global version, bumped
+whenever a condition changes, and a version of its own user, bumped whenever
+any of the user's fields conditions depend on changes. Entries stamped with
+outdated versions are ignored, so a set computed concurrently with a change can
+never outlive it.
+"""
+from itertools import chain
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import models
+
+GLOBAL_VERSION_KEY = 'bitket.memberships.version'
+
+
+def get_user_version_key(user_pk):
+    return 'bitket.memberships.user.{}.version'.format(user_pk)
+
+
+def get_entry_key(user_pk):
+    return 'bitket.memberships.user.{}.met_conditions'.format(user_pk)
+
+
+def pack(condition_ids):
+    return b''.join(sorted(i.bytes for i in condition_ids))
+
+
+def unpack(data):
+    return frozenset(UUID(bytes=data[i:i + 16])
+                     for i in range(0, len(data), 16))
+
+
+def bump(key):
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def get_many(users, force_reevaluation=False):
+    """
+    Returns the IDs of the conditions met by each of the users, keyed by user
+    ID, reading the cache in a single round trip.
+    """
+    keys = [GLOBAL_VERSION_KEY]
+    for user in users:
+        keys += [get_user_version_key(user.pk), get_entry_key(user.pk)]
+    values = cache.get_many(keys)
+
+    global_version = values.get(GLOBAL_VERSION_KEY, 0)
+    met_condition_ids = {}
+    new_entries = {}
+
+    for user in users:
+        user_version = values.get(get_user_version_key(user.pk), 0)
+        entry = values.get(get_entry_key(user.pk))
+
+        if (not force_reevaluation and entry is not None and
+                entry[:2] == (global_version, user_version)):
+            met_condition_ids[user.pk] = unpack(entry[2])
+            continue
+
+        condition_ids = frozenset(
+            models.Condition.objects.met(user).values_list('pk', flat=True))
+        met_condition_ids[user.pk] = condition_ids
+        new_entries[get_entry_key(user.pk)] = (
+            global_version, user_version, pack(condition_ids))
+
+    if new_entries:
+        cache.set_many(new_entries,
+                       timeout=settings.CACHE_TIMEOUT_PERSON_CONDITIONS)
+
+    return met_condition_ids
+
+
+def get(user, force_reevaluation=False):
+    return get_many([user], force_reevaluation=force_reevaluation)[user.pk]
+
+
+def get_user_fields():
+    return sorted(set(chain.from_iterable(
+        c.user_fields for c in models.Condition.get_subclasses())))
+
+
+def get_user_state(user):
+    # Deferred fields are not loaded just for this
+    return tuple(user.__dict__.get(f) for f in get_user_fields())
+
+
+@receiver(post_init, sender='bitket.User')
+def remember_user_state(sender, instance, **kwargs):
+    instance._membership_state = get_user_state(instance)
+
+
+@receiver(post_save, sender='bitket.User')
+def invalidate_user(sender, instance, created, **kwargs):
+    state = get_user_state(instance)
+    if not created and state != instance._membership_state:
+        bump(get_user_version_key(instance.pk))
+    instance._membership_state = state
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_conditions(sender, instance, **kwargs):
+    if isinstance(instance, models.Condition):
+        bump(GLOBAL_VERSION_KEY)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 04:14
+from __future__ import unicode_literals
+
+import bitket.db.fields
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitket', '0005_auto_20161216_1524'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseJob',
+            fields=[
+                ('id', bitket.db.fields.IdField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('processing', 'processing'), ('completed', 'completed'), ('failed', 'failed')], default='queued', max_length=16, verbose_name='status')),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField(verbose_name='data')),
+                ('host', models.CharField(max_length=256, verbose_name='host')),
+                ('scheme', models.CharField(max_length=8, verbose_name='scheme')),
+                ('result', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True, verbose_name='result')),
+                ('result_status', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='result status')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='finished')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_jobs', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'purchase job',
+                'verbose_name_plural': 'purchase jobs',
+                'get_latest_by': 'created',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='purchasejob',
+            index=models.Index(fields=['status', 'created'], name='bitket_purc_status_542450_idx'),
+        ),
+    ]
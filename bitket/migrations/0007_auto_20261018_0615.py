@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 04:15
+from __future__ import unicode_literals
+
+import bitket.db.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitket', '0006_auto_20261018_0614'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        'CREATE SEQUENCE bitket_ticket_seq_seq',
+                        'ALTER TABLE bitket_ticket ADD COLUMN seq bigint',
+                        # Existing tickets keep their queue order
+                        'UPDATE bitket_ticket SET seq = queue.position '
+                        'FROM (SELECT id, row_number() OVER (ORDER BY created, id) AS position '
+                        'FROM bitket_ticket) AS queue '
+                        'WHERE bitket_ticket.id = queue.id',
+                        "SELECT setval('bitket_ticket_seq_seq', COALESCE(MAX(seq), 0) + 1, false) "
+                        'FROM bitket_ticket',
+                        "ALTER TABLE bitket_ticket ALTER COLUMN seq SET DEFAULT nextval('bitket_ticket_seq_seq'), "
+                        'ALTER COLUMN seq SET NOT NULL',
+                        'ALTER SEQUENCE bitket_ticket_seq_seq OWNED BY bitket_ticket.seq',
+                    ],
+                    reverse_sql=[
+                        'ALTER TABLE bitket_ticket DROP COLUMN seq',
+                    ],
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='ticket',
+                    name='seq',
+                    field=bitket.db.fields.SequenceField(editable=False, verbose_name='sequence number'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['ticket_type', 'pending', 'seq'], name='bitket_tick_ticket__dcb0ac_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketownership',
+            index=models.Index(fields=['ticket', '-created'], name='bitket_tick_ticket__9b642c_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 06:16
+from __future__ import unicode_literals
+
+import bitket.db.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitket', '0007_auto_20261018_0615'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketownership',
+            name='price',
+            field=bitket.db.fields.MoneyField(decimal_places=2, editable=False, max_digits=12, null=True, verbose_name='price'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 04:22
+from __future__ import unicode_literals
+
+import bitket.db.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitket', '0008_auto_20261018_0616'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', bitket.db.fields.IdField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template_name', models.CharField(choices=[('ticket_ownership_new', 'ticket ownership confirmation')], max_length=64, verbose_name='template name')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('next_attempt', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True, verbose_name='next attempt')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='sent')),
+                ('ticket_ownership', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_emails', to='bitket.TicketOwnership', verbose_name='ticket ownership')),
+            ],
+            options={
+                'verbose_name': 'outgoing email',
+                'verbose_name_plural': 'outgoing emails',
+                'get_latest_by': 'created',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outgoingemail',
+            index=models.Index(fields=['sent', 'next_attempt'], name='bitket_outg_sent_44d1df_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 04:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitket', '0009_auto_20261018_0622'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='current_ownership',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='current_ticket', to='bitket.TicketOwnership', verbose_name='current ownership'),
+        ),
+        # Existing tickets point to their latest ownerships, as in
+        # TicketQuerySet.update_current_ownerships
+        migrations.RunSQL(
+            sql='UPDATE bitket_ticket SET current_ownership_id = ('
+                'SELECT id FROM bitket_ticketownership '
+                'WHERE bitket_ticketownership.ticket_id = bitket_ticket.id '
+                'ORDER BY created DESC LIMIT 1)',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
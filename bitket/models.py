@@ -1,42 +1,43 @@
 import logging
 import uuid
 from collections import OrderedDict
+from datetime import timedelta
 from decimal import Decimal
 from os import urandom
 from binascii import hexlify
 import json
 from base64 import b64encode
-from six import BytesIO
 
 import requests
-import sesam
 from django.conf import settings
+from django.contrib.postgres.fields import JSONField
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.sites.models import Site
-from django.core.cache import cache
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.functional import cached_property
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _, ugettext
 from model_utils.managers import InheritanceQuerySetMixin
-from templated_email import send_templated_mail, InlineImage
-import qrcode
+from templated_email import get_templated_mail, InlineImage
 
-from . import exceptions
+from . import exceptions, manifests, memberships, pricing, qr, students
+# Registers the receivers invalidating availability snapshots
+from . import availability  # noqa: F401
+# Registers the receivers adding purchased tickets to scan indexes
+from . import scanning  # noqa: F401
 from .utils import signing
+from .inventory import Inventory
 from .db.fields import NameField, SlugField, DescriptionField, \
-    MoneyField, NullCharField, IdField
+    MoneyField, NullCharField, IdField, SequenceField
 from .utils.email import generate_pretty_email
 
 logger = logging.getLogger(__name__)
 
-sesam_student_service_client = sesam.StudentServiceClient(
-    username=settings.SESAM_USERNAME,
-    password=settings.SESAM_PASSWORD,
-)
-
 
 def generate_code(length):
     # Returns a random hex string, `length` characters long.
@@ -49,13 +50,23 @@ def generate_ticket_ownership_code():
 
 class ConditionQuerySet(InheritanceQuerySetMixin, models.QuerySet):
     def met(self, person):
-        met_pks = []
+        """
+        Returns the conditions met by the person, in a single query for
+        condition types that can be expressed as a filter. The others are
+        evaluated one by one.
+        """
+        met = models.Q(pk__in=[])
 
-        for condition in self.select_subclasses():
-            if condition.is_met(person):
-                met_pks.append(condition.pk)
+        for subclass in Condition.get_subclasses():
+            subclass_filter = subclass.get_met_filter(person)
+            if subclass_filter is None:
+                subclass_filter = models.Q(pk__in=[
+                    c.pk for c in subclass.objects.all() if c.is_met(person)])
 
-        return self.filter(pk__in=met_pks)
+            met |= models.Q(
+                pk__in=subclass.objects.filter(subclass_filter).values('pk'))
+
+        return self.filter(met)
 
 
 class TicketTypeQuerySet(models.QuerySet):
@@ -68,6 +79,23 @@ class TicketTypeQuerySet(models.QuerySet):
     def generally_available(self):
         return self.filter(is_generally_available=True)
 
+    def with_sold_count(self):
+        """
+        Annotates the number of sold tickets, saving listings a count per
+        ticket type.
+        """
+        sold_tickets = (Ticket.objects
+                        .unpending()
+                        .filter(ticket_type=models.OuterRef('pk'))
+                        .order_by()
+                        .values('ticket_type')
+                        .annotate(count=models.Count('*'))
+                        .values('count'))
+        return self.annotate(sold_count=Coalesce(
+            models.Subquery(sold_tickets,
+                            output_field=models.PositiveIntegerField()),
+            0))
+
 
 class TicketQuerySet(models.QuerySet):
     def pending(self):
@@ -77,33 +105,166 @@ class TicketQuerySet(models.QuerySet):
         return self.filter(pending=False)
 
     def owned_by(self, user, only_current=True):
-        ownerships = TicketOwnership.objects
-
         if only_current:
-            ownerships = (ownerships
-                          .order_by('ticket_id', '-created')
-                          .distinct('ticket_id'))
+            return self.filter(current_ownership__user=user)
 
         return self.filter(
-            ownerships__in=ownerships.filter(user=user)
+            ownerships__user=user
         ).distinct()  # Buying, reselling and buying back would give duplicates
 
+    def update_current_ownerships(self):
+        return self.update(current_ownership=models.Subquery(
+            TicketOwnership.objects
+            .filter(ticket=models.OuterRef('pk'))
+            .order_by('-created')
+            .values('pk')[:1]))
+
     def before_in_queue(self, ticket):
-        # Get the ticket's position by purchase time. In the extreme
-        # case of multiple tickets purchased in the same
-        # *microsecond*, we let the id (and since we use random
-        # UUIDs, luck) decide. Since the position is based on
-        # creation time, it can never get higher during the
-        # transaction, but it can get lower (if pending tickets
-        # disappear due to failed payments).
-        return self.filter(Q(created__lt=ticket.created) |
-                           Q(created__exact=ticket.created, pk__lt=ticket.pk))
+        # Get the ticket's position by insertion order, as given by the
+        # database sequence. Since the position is based on insertion, it
+        # can never get higher during the transaction, but it can get lower
+        # (if pending tickets disappear due to failed payments).
+        if ticket.seq is None:
+            ticket.refresh_from_db(fields=['seq'])
+        return self.filter(seq__lt=ticket.seq)
 
     def email_ticket(self):
         for i in self:
             i.email_ticket()
 
 
+class TicketOwnershipQuerySet(models.QuerySet):
+    def bulk_create_with_tickets(self, entries):
+        """
+        Inserts new tickets along with their variation choices, ownerships
+        and the modifiers the owners are eligible for, in a constant number of
+        queries. Takes (ticket, variation choices, user) tuples and returns the
+        ownerships, priced.
+        """
+        # Conditions are evaluated once per user rather than once per ticket.
+        # We force reevaluation when the real shit is going down (i.e. now) to
+        # ensure we don't get inconsistencies.
+        met_condition_ids = memberships.get_many(
+            {user.pk: user for _, _, user in entries}.values(),
+            force_reevaluation=True)
+        price_sheets = pricing.get_sheets(
+            ticket.ticket_type_id for ticket, _, _ in entries)
+
+        ownerships = []
+        ownership_modifiers = []
+        for ticket, variation_choices, user in entries:
+            price_sheet = price_sheets[ticket.ticket_type_id]
+            condition_ids = met_condition_ids[user.pk]
+            ownership = TicketOwnership(
+                ticket=ticket,
+                user=user,
+                price=price_sheet.get_price(
+                    condition_ids, [c.pk for c in variation_choices]))
+            ownerships.append(ownership)
+            ownership_modifiers.extend(
+                (ownership, modifier)
+                for modifier in price_sheet.get_modifiers(condition_ids))
+            # The IDs are generated up front, and foreign keys are only
+            # checked on commit, so the tickets can point out their
+            # ownerships before these are inserted.
+            ticket.current_ownership = ownership
+
+        with transaction.atomic(savepoint=False):
+            Ticket.objects.bulk_create([ticket for ticket, _, _ in entries])
+
+            ticket_variation_choices = Ticket.variation_choices.through
+            ticket_variation_choices.objects.bulk_create([
+                ticket_variation_choices(ticket_id=ticket.pk,
+                                         variationchoice_id=choice.pk)
+                for ticket, variation_choices, _ in entries
+                for choice in variation_choices
+            ])
+
+            ownerships = self.bulk_create(ownerships)
+
+            ticket_ownership_modifiers = TicketOwnership.modifiers.through
+            ticket_ownership_modifiers.objects.bulk_create([
+                ticket_ownership_modifiers(ticketownership_id=ownership.pk,
+                                           modifier_id=modifier.id)
+                for ownership, modifier in ownership_modifiers
+            ])
+
+        return ownerships
+
+    def current(self):
+        return self.filter(current_ticket__isnull=False)
+
+
+class TicketOwnershipManager(
+        models.Manager.from_queryset(TicketOwnershipQuerySet)):
+    def check_in(self, ownership_pks, utilized=None):
+        """
+        Utilizes the tickets of the ownerships that are current and not
+        utilized yet, in a single statement, so concurrent scans of a ticket
+        can only ever check it in once. Returns the IDs of the ownerships
+        checked in and the conflicts, as (ownership ID, reason, utilized)
+        tuples.
+
+        A manager method, since the update ignores any filters.
+        """
+        ownership_pks = list(OrderedDict.fromkeys(
+            pk if isinstance(pk, uuid.UUID) else uuid.UUID(pk)
+            for pk in ownership_pks))
+        if not ownership_pks:
+            return [], []
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {ticket} SET utilized = %s '
+                'FROM {ticket_type} '
+                'WHERE {ticket_type}.id = {ticket}.ticket_type_id '
+                'AND {ticket}.current_ownership_id = ANY(%s::uuid[]) '
+                'AND {ticket}.utilized IS NULL '
+                'RETURNING {ticket}.current_ownership_id, {ticket}.id, '
+                '{ticket_type}.event_id'.format(
+                    ticket=Ticket._meta.db_table,
+                    ticket_type=TicketType._meta.db_table),
+                [utilized or now(), [str(pk) for pk in ownership_pks]])
+            rows = [(uuid.UUID(str(ownership_pk)), ticket_pk, event_pk)
+                    for ownership_pk, ticket_pk, event_pk in cursor.fetchall()]
+
+        # Door scanners keep copies of what is utilized
+        ticket_pks = {}
+        for ownership_pk, ticket_pk, event_pk in rows:
+            ticket_pks.setdefault(event_pk, []).append(ticket_pk)
+        for event_pk, pks in ticket_pks.items():
+            manifests.record(event_pk, pks)
+
+        checked_in_pks = [row[0] for row in rows]
+        rejected_pks = set(ownership_pks).difference(checked_in_pks)
+        return checked_in_pks, self.get_check_in_conflicts(
+            [pk for pk in ownership_pks if pk in rejected_pks])
+
+    def get_check_in_conflicts(self, ownership_pks):
+        states = {
+            pk: (ticket_utilized, current_ticket_pk)
+            for pk, ticket_utilized, current_ticket_pk in
+            self.filter(pk__in=ownership_pks)
+            .values_list('pk', 'ticket__utilized', 'current_ticket')
+        } if ownership_pks else {}
+
+        conflicts = []
+        for ownership_pk in ownership_pks:
+            if ownership_pk not in states:
+                conflicts.append((ownership_pk,
+                                  TicketOwnership.CHECK_IN_UNKNOWN, None))
+                continue
+            ticket_utilized, current_ticket_pk = states[ownership_pk]
+            if current_ticket_pk is None:
+                conflicts.append((ownership_pk,
+                                  TicketOwnership.CHECK_IN_NOT_CURRENT, None))
+            else:
+                conflicts.append((ownership_pk,
+                                  TicketOwnership.CHECK_IN_UTILIZED,
+                                  ticket_utilized))
+        return conflicts
+
+
 class Condition(models.Model):
     id = IdField()
 
@@ -116,6 +277,9 @@ class Condition(models.Model):
     objects = ConditionQuerySet.as_manager()
 
     type_str = _('Condition')
+    # The user fields the condition depends on. Changing any of them makes
+    # the user's cached conditions stale.
+    user_fields = ()
 
     class Meta:
         verbose_name = _('condition')
@@ -128,6 +292,29 @@ class Condition(models.Model):
     def condition_str(self):
         return ''
 
+    @classmethod
+    def get_subclasses(cls):
+        subclasses = []
+        for subclass in cls.__subclasses__():
+            subclasses.append(subclass)
+            subclasses.extend(subclass.get_subclasses())
+        return subclasses
+
+    @classmethod
+    def get_met_filter(cls, user):
+        """
+        Returns a filter matching the conditions of this type met by the user,
+        or None if they must be evaluated with is_met().
+        """
+        return None
+
+    def get_user_filter(self):
+        """
+        Returns a filter matching the users meeting the condition, or None if
+        they must be evaluated with is_met().
+        """
+        return None
+
     def is_met(self, user):
         raise Exception('is_met method not overridden or incorrectly called.')
 
@@ -139,6 +326,7 @@ class StudentUnionMemberCondition(Condition):
         verbose_name=_('student union'))
 
     type_str = ugettext('Student union member')
+    user_fields = ('student_union_id',)
 
     class Meta:
         verbose_name = _('student union member condition')
@@ -148,6 +336,13 @@ class StudentUnionMemberCondition(Condition):
     def condition_str(self):
         return '{}'.format(self.student_union)
 
+    @classmethod
+    def get_met_filter(cls, user):
+        return models.Q(student_union_id=user.student_union_id)
+
+    def get_user_filter(self):
+        return models.Q(student_union_id=self.student_union_id)
+
     def is_met(self, user):
         return user.student_union_id == self.student_union_id
 
@@ -316,6 +511,181 @@ class Organization(models.Model):
         self.save()
 
 
+class OutgoingEmailQuerySet(models.QuerySet):
+    def unsent(self):
+        return self.filter(sent__isnull=True)
+
+    def due(self):
+        return self.unsent().filter(next_attempt__lte=now())
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email waiting to be sent, or a record of one that has been. Written in
+    the same transaction as whatever it is about and sent by the email worker.
+    """
+
+    TEMPLATE_TICKET_OWNERSHIP_NEW = 'ticket_ownership_new'
+    TEMPLATE_CHOICES = (
+        (TEMPLATE_TICKET_OWNERSHIP_NEW, _('ticket ownership confirmation')),
+    )
+
+    id = IdField()
+
+    template_name = models.CharField(
+        max_length=64,
+        choices=TEMPLATE_CHOICES,
+        verbose_name=_('template name'))
+    ticket_ownership = models.ForeignKey(
+        'TicketOwnership',
+        related_name='outgoing_emails',
+        verbose_name=_('ticket ownership'))
+
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name=_('attempts'))
+    # Cleared when we give up on the email.
+    next_attempt = models.DateTimeField(
+        null=True,
+        blank=True,
+        default=now,
+        verbose_name=_('next attempt'))
+    last_error = models.TextField(
+        blank=True,
+        verbose_name=_('last error'))
+
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('created'))
+    sent = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('sent'))
+
+    objects = OutgoingEmailQuerySet.as_manager()
+
+    class Meta:
+        get_latest_by = 'created'
+        indexes = [
+            models.Index(fields=['sent', 'next_attempt']),
+        ]
+
+        verbose_name = _('outgoing email')
+        verbose_name_plural = _('outgoing emails')
+
+    def __str__(self):
+        return '{} ({})'.format(self.get_template_name_display(), self.id)
+
+    def get_message(self):
+        if self.template_name == self.TEMPLATE_TICKET_OWNERSHIP_NEW:
+            return self.ticket_ownership.get_confirmation_email()
+
+        raise ValueError(
+            'Unknown email template {}.'.format(self.template_name))
+
+
+class PurchaseJobQuerySet(models.QuerySet):
+    def queued(self):
+        return self.filter(status=PurchaseJob.STATUS_QUEUED)
+
+    def claimable(self):
+        # Queued, or processing by a worker that has most likely died
+        return self.filter(
+            models.Q(status=PurchaseJob.STATUS_QUEUED) |
+            models.Q(status=PurchaseJob.STATUS_PROCESSING,
+                     started__lt=now() - timedelta(
+                         seconds=settings.PURCHASE_JOB_LEASE_TIMEOUT)))
+
+    def unfinished(self):
+        return self.filter(status__in=[PurchaseJob.STATUS_QUEUED,
+                                       PurchaseJob.STATUS_PROCESSING])
+
+
+class PurchaseJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_PROCESSING = 'processing'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, _('queued')),
+        (STATUS_PROCESSING, _('processing')),
+        (STATUS_COMPLETED, _('completed')),
+        (STATUS_FAILED, _('failed')),
+    )
+
+    id = IdField()
+
+    user = models.ForeignKey(
+        'User',
+        related_name='purchase_jobs',
+        verbose_name=_('user'))
+
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED,
+        verbose_name=_('status'))
+
+    # The purchase request as posted by the user, along with what is needed
+    # to rebuild absolute URLs in the response.
+    data = JSONField(
+        verbose_name=_('data'))
+    host = models.CharField(
+        max_length=256,
+        verbose_name=_('host'))
+    scheme = models.CharField(
+        max_length=8,
+        verbose_name=_('scheme'))
+
+    result = JSONField(
+        null=True,
+        blank=True,
+        verbose_name=_('result'))
+    result_status = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('result status'))
+
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('created'))
+    started = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('started'))
+    finished = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('finished'))
+
+    objects = PurchaseJobQuerySet.as_manager()
+
+    class Meta:
+        get_latest_by = 'created'
+        indexes = [
+            models.Index(fields=['status', 'created']),
+        ]
+
+        verbose_name = _('purchase job')
+        verbose_name_plural = _('purchase jobs')
+
+    def __str__(self):
+        return '{} ({})'.format(self.id, self.status)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
+
+    def finish(self, result, result_status):
+        self.status = (self.STATUS_COMPLETED if result_status < 400
+                       else self.STATUS_FAILED)
+        self.result = result
+        self.result_status = result_status
+        self.finished = now()
+        self.save(update_fields=['status', 'result', 'result_status',
+                                 'finished'])
+
+
 class Transaction(models.Model):
     created = models.DateTimeField(
         default=now,
@@ -334,6 +704,21 @@ class Transaction(models.Model):
 
 
 class UserQuerySet(models.QuerySet):
+    def meeting(self, condition):
+        """
+        Returns the users meeting the condition, which is the reverse of
+        ConditionQuerySet.met().
+        """
+        if type(condition) is Condition:
+            condition = Condition.objects.get_subclass(pk=condition.pk)
+
+        user_filter = condition.get_user_filter()
+        if user_filter is None:
+            user_filter = models.Q(
+                pk__in=[u.pk for u in self if condition.is_met(u)])
+
+        return self.filter(user_filter)
+
     def pretty_emails_string(self):
         """
         Returns a string with pretty formatted emails, separated by semicolons
@@ -433,13 +818,10 @@ class User(AbstractBaseUser, PermissionsMixin, models.Model):
         return self.name
 
     def get_met_conditions(self, force_reevaluation=False):
-        cache_key = 'people.person.{}.met_conditions'.format(self.pk)
-        conditions = cache.get(cache_key)
-        if force_reevaluation or conditions is None:
-            conditions = Condition.objects.met(person=self)
-            cache.set(cache_key, conditions,
-                      timeout=settings.CACHE_TIMEOUT_PERSON_CONDITIONS)
-        return conditions
+        """
+        Returns the IDs of the conditions met by the user.
+        """
+        return memberships.get(self, force_reevaluation=force_reevaluation)
 
     @property
     def pretty_email(self):
@@ -483,6 +865,22 @@ class Ticket(models.Model):
         default=False,
         verbose_name=_('pending'))
 
+    # Always the latest of the ownerships, kept by TicketOwnership. Tickets
+    # from before it was kept are filled in by its migration, and the
+    # backfill_ticket_current_ownerships command re-syncs any left without.
+    current_ownership = models.OneToOneField(
+        'TicketOwnership',
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name='current_ticket',
+        verbose_name=_('current ownership'))
+
+    # Queue position, assigned by the database on insert.
+    seq = SequenceField(
+        verbose_name=_('sequence number'))
+
     created = models.DateTimeField(
         auto_now_add=True,
         verbose_name=_('created'))
@@ -494,6 +892,10 @@ class Ticket(models.Model):
     objects = TicketQuerySet.as_manager()
 
     class Meta:
+        indexes = [
+            models.Index(fields=['ticket_type', 'pending', 'seq']),
+        ]
+
         verbose_name = _('ticket')
         verbose_name_plural = _('tickets')
 
@@ -508,6 +910,11 @@ class Ticket(models.Model):
 
 
 class TicketOwnership(models.Model):
+    # Why check-ins fail
+    CHECK_IN_UNKNOWN = 'unknown'
+    CHECK_IN_NOT_CURRENT = 'not_current'
+    CHECK_IN_UTILIZED = 'utilized'
+
     id = IdField()
 
     # This can be changed to invalidate generated switch links.
@@ -537,12 +944,26 @@ class TicketOwnership(models.Model):
         blank=True,
         verbose_name=_('transactions'))
 
+    # Frozen on creation, so this is what the owner was charged (or would have
+    # been). Ownerships from before it was stored are filled in by the
+    # backfill_ticket_ownership_prices command.
+    price = MoneyField(
+        null=True,
+        editable=False,
+        verbose_name=_('price'))
+
     created = models.DateTimeField(
         auto_now_add=True,
         verbose_name=_('created'))
 
+    objects = TicketOwnershipManager()
+
     class Meta:
         get_latest_by = 'created'
+        indexes = [
+            # Finding the current ownership of tickets
+            models.Index(fields=['ticket', '-created']),
+        ]
 
         verbose_name = _('ticket ownership')
         verbose_name_plural = _('ticket ownerships')
@@ -551,55 +972,65 @@ class TicketOwnership(models.Model):
         # self._state.adding is always False after save()
         first_save = self._state.adding
 
-        super(TicketOwnership, self).save(*args, **kwargs)
-
         # Automatically add modifiers *only* on first save()
         if first_save:
-            self.modifiers.set(
-                # We force reevaluate when the real shit is going down (i.e.
-                # now) to ensure we don't get inconsistencies
-                self.ticket.ticket_type.modifiers.eligible(
-                    self.user, force_reevaluation=True
-                )
-            )
+            # We force reevaluate when the real shit is going down (i.e.
+            # now) to ensure we don't get inconsistencies
+            modifiers = list(self.ticket.ticket_type.modifiers.eligible(
+                self.user, force_reevaluation=True))
+            if self.price is None:
+                self.price = self.calculate_price(
+                    self.ticket.ticket_type, modifiers,
+                    self.ticket.variation_choices.all())
 
-    @property
-    def price(self):
-        assert self.pk is not None, 'Save before calculating the price.'
+        super(TicketOwnership, self).save(*args, **kwargs)
 
-        return (self.ticket.ticket_type.price +
-                self.modifiers.delta() +
-                self.ticket.variation_choices.delta())
+        if first_save:
+            self.modifiers.set(modifiers)
+            # The new ownership is always the current one
+            Ticket.objects.filter(pk=self.ticket_id).update(
+                current_ownership=self)
+            self.ticket.current_ownership = self
+
+    @staticmethod
+    def calculate_price(ticket_type, modifiers, variation_choices):
+        return (ticket_type.price +
+                sum((m.delta for m in modifiers), Decimal('0.00')) +
+                sum((c.delta for c in variation_choices), Decimal('0.00')))
 
     @property
     def is_current(self):
-        return self == self.ticket.ownerships.latest()
+        return self.ticket.current_ownership_id == self.pk
 
     @property
     def resell_token(self):
         return signing.dumps(OrderedDict((('id', str(self.id)), ('code', self.code))), salt='resell_token')
 
     def utilize(self):
-        if self.ticket.utilized:
-            raise exceptions.ValidationError(
-                _('This ticket ownership is already utilized.'))
+        utilized = now()
+        checked_in_pks, conflicts = TicketOwnership.objects.check_in(
+            [self.pk], utilized=utilized)
 
-        if not self.is_current:
-            raise exceptions.ValidationError(_('This ticket ownership is not the current one.'))
+        if checked_in_pks:
+            self.ticket.utilized = utilized
+            return
 
-        self.ticket.utilize()
-        self.ticket.save()
+        ownership_pk, reason, utilized = conflicts[0]
+        if reason == self.CHECK_IN_UTILIZED:
+            raise exceptions.ValidationError(
+                _('This ticket ownership is already utilized.'))
+        raise exceptions.ValidationError(_('This ticket ownership is not the current one.'))
 
     def unutilize(self):
         self.ticket.unutilize()
         self.ticket.save()
 
-    def email_confirmation(self):
+    def get_confirmation_email(self):
         qr_inline = InlineImage(filename='qr.png', content=self.get_qr_raw())
-        send_templated_mail(
-            template_name='ticket_ownership_new',
+        return get_templated_mail(
+            template_name=OutgoingEmail.TEMPLATE_TICKET_OWNERSHIP_NEW,
             from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[self.user.pretty_email],
+            to=[self.user.pretty_email],
             context={
                 'domain': Site.objects.get_current().domain,
                 'ticket_ownership': self,
@@ -607,17 +1038,16 @@ class TicketOwnership(models.Model):
             }
         )
 
+    def email_confirmation(self):
+        self.get_confirmation_email().send()
+
+    @property
+    def qr_payload(self):
+        return json.dumps(
+            OrderedDict((('id', str(self.id)), ('code', self.code))))
+
     def get_qr_raw(self):
-        output_buffer = BytesIO()
-        qr_image = qrcode.make(
-            json.dumps(
-                OrderedDict((('id', str(self.id)), ('code', self.code)))),
-            error_correction=qrcode.ERROR_CORRECT_H,
-            box_size=6,
-            border=4  # The QR spec stipulates a border of 4
-        )
-        qr_image.save(output_buffer, format='png', optimize=True)
-        return output_buffer.getvalue()
+        return qr.image_cache.get(self.qr_payload)
 
     def get_qr(self):
         return b64encode(self.get_qr_raw())
@@ -653,7 +1083,11 @@ class AccessCode(models.Model):
 
     @property
     def token(self):
-        return signing.dumps(self.id.hex, salt='access_code')
+        return self.get_token(self.id)
+
+    @staticmethod
+    def get_token(pk):
+        return signing.dumps(pk.hex, salt='access_code')
 
     @property
     def is_utilizable(self):
@@ -713,14 +1147,25 @@ class TicketType(models.Model):
     def __str__(self):
         return self.name
 
+    @cached_property
+    def inventory(self):
+        return Inventory(self)
+
     @property
     def within_max_total_quantity(self):
         if self.max_total_quantity is None:
             return True
-        return self.tickets.unpending().count() < self.max_total_quantity
+        # Annotated by TicketTypeQuerySet.with_sold_count()
+        sold_count = getattr(self, 'sold_count', None)
+        if sold_count is None:
+            sold_count = self.inventory.get_sold_count()
+        return sold_count < self.max_total_quantity
 
     def modifier_delta(self, user):
-        return self.modifiers.eligible(user).delta()
+        if user.is_anonymous():
+            return Decimal('0.00')
+        return pricing.get_sheet(self).get_modifier_delta(
+            user.get_met_conditions())
 
 
 class Variation(models.Model):
@@ -778,6 +1223,12 @@ class VariationChoice(models.Model):
         return self.name
 
 
+@receiver(post_delete, sender=TicketOwnership)
+def fall_back_to_previous_ownership(sender, instance, **kwargs):
+    # Also for queryset deletes and cascades, which skip Model.delete()
+    Ticket.objects.filter(pk=instance.ticket_id).update_current_ownerships()
+
+
 def social_get_union(strategy, backend, response, user=None, *args, **kwargs):
     if backend.name != 'liu':
         # Just pass
@@ -786,20 +1237,4 @@ def social_get_union(strategy, backend, response, user=None, *args, **kwargs):
     if not user:
         return
 
-    union = None
-
-    try:
-        union = sesam_student_service_client.get_student(
-            nor_edu_person_lin=response.get('nor_edu_person_lin'),
-        ).main_union
-    except sesam.StudentNotFound:
-        pass
-    except sesam.Error:
-        logger.warning('Sesam request failed', exc_info=True)
-
-    user.student_union = (
-        StudentUnion.objects.get_or_create(name=union)[0]
-        if union else None
-    )
-
-    strategy.storage.user.changed(user)
+    students.refresh_union_later(user, response.get('nor_edu_person_lin'))
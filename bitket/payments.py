@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import threading
+from random import random
+from time import sleep
+from uuid import uuid4
+
+import requests
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+from stripe import api_requestor, http_client, util
+
+from . import exceptions
+
+logger = logging.getLogger(__name__)
+
+
+def get_idempotency_key(ticket_ownerships):
+    """
+    Derives a key from the ticket ownerships being paid for, making retried
+    charges for the same ownerships collapse into one.
+    """
+    ids = sorted(str(o.pk) for o in ticket_ownerships)
+    return hashlib.sha256(','.join(ids).encode()).hexdigest()
+
+
+class PaymentProvider(object):
+    """
+    Charges the buyer on behalf of an organization. Implementations raise
+    PaymentFailed for payments that are declined.
+    """
+
+    def charge(self, organization, amount, source, idempotency_key,
+               receipt_email=None, metadata=None):
+        """
+        Returns the ID of the charge.
+        """
+        raise NotImplementedError
+
+
+class StripeProvider(PaymentProvider):
+    """
+    Charges through Stripe Connect, keeping a persistent HTTP session for
+    each connected account.
+    """
+
+    max_network_retries = 2
+
+    def __init__(self):
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get_client(self, organization):
+        with self.lock:
+            client = self.clients.get(organization.stripe_account_id)
+            if client is None:
+                client = http_client.RequestsClient(
+                    timeout=settings.PAYMENT_TIMEOUT,
+                    session=requests.Session())
+                self.clients[organization.stripe_account_id] = client
+            return client
+
+    def request(self, organization, params, idempotency_key):
+        requestor = api_requestor.APIRequestor(
+            client=self.get_client(organization),
+            account=organization.stripe_account_id)
+        headers = util.populate_headers(idempotency_key)
+
+        for attempt in range(self.max_network_retries + 1):
+            try:
+                return requestor.request(
+                    'post', stripe.Charge.class_url(), params, headers)
+            except stripe.error.APIConnectionError:
+                # The idempotency key makes it safe to try again, even if the
+                # charge went through.
+                if attempt == self.max_network_retries:
+                    raise
+                logger.warning('Retrying charge %s', idempotency_key,
+                               exc_info=True)
+
+    def charge(self, organization, amount, source, idempotency_key,
+               receipt_email=None, metadata=None):
+        params = dict(
+            source=source,
+            amount=int(amount * 100),
+            currency=settings.CURRENCY,
+            receipt_email=receipt_email,
+            metadata=metadata or {})
+
+        try:
+            response, api_key = self.request(
+                organization, params, idempotency_key)
+        except stripe.error.CardError as exc:
+            # See https://stripe.com/docs/api#errors
+            raise exceptions.PaymentFailed(exc.json_body['error']['message'])
+
+        return response['id']
+
+
+class FakeProvider(PaymentProvider):
+    """
+    Charges nothing, for benchmarking and testing purchases offline. Waits
+    PAYMENT_FAKE_LATENCY seconds per charge and declines a share of them given
+    by PAYMENT_FAKE_DECLINE_RATE, as well as anything paid with Stripe's
+    tok_chargeDeclined test token.
+    """
+
+    declined_source = 'tok_chargeDeclined'
+
+    def __init__(self):
+        self.charges = {}
+        self.lock = threading.Lock()
+
+    def charge(self, organization, amount, source, idempotency_key,
+               receipt_email=None, metadata=None):
+        with self.lock:
+            if idempotency_key in self.charges:
+                return self.charges[idempotency_key]
+
+        sleep(settings.PAYMENT_FAKE_LATENCY)
+
+        if (source == self.declined_source or
+                random() < settings.PAYMENT_FAKE_DECLINE_RATE):
+            raise exceptions.PaymentFailed('Your card was declined.')
+
+        with self.lock:
+            return self.charges.setdefault(
+                idempotency_key, 'ch_fake_{}'.format(uuid4().hex))
+
+
+_providers = {}
+
+
+def get_provider():
+    path = settings.PAYMENT_PROVIDER
+    if path not in _providers:
+        _providers[path] = import_string(path)()
+    return _providers[path]
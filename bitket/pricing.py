@@ -0,0 +1,161 @@
+"""
+Caches what goes into the prices of ticket types.
+
+A price sheet holds everything needed to price a ticket type for any set of
+met conditions: the base price, the modifiers and the variation choice
+deltas. Sheets are stamped with a version per ticket type, bumped on commit of
+any change to them, and entries with outdated versions are ignored.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import models
+
+SheetModifier = namedtuple('SheetModifier', 'id condition_id condition delta')
+
+
+class PriceSheet(object):
+    def __init__(self, price, modifiers, variation_choices):
+        self.price = price
+        self.modifiers = modifiers
+        # Deltas by variation choice ID
+        self.variation_choices = variation_choices
+
+    def get_modifiers(self, condition_ids):
+        return [m for m in self.modifiers if m.condition_id in condition_ids]
+
+    def get_modifier_delta(self, condition_ids):
+        return sum((m.delta for m in self.get_modifiers(condition_ids)),
+                   Decimal('0.00'))
+
+    def get_price(self, condition_ids, variation_choice_ids=()):
+        return (self.price +
+                self.get_modifier_delta(condition_ids) +
+                sum((self.variation_choices[i] for i in variation_choice_ids),
+                    Decimal('0.00')))
+
+
+def get_version_key(ticket_type_pk):
+    return 'bitket.pricing.{}.version'.format(ticket_type_pk)
+
+
+def get_sheet_key(ticket_type_pk):
+    return 'bitket.pricing.{}.sheet'.format(ticket_type_pk)
+
+
+def build_sheets(ticket_type_pks):
+    prices = dict(models.TicketType.objects
+                  .filter(pk__in=ticket_type_pks)
+                  .values_list('pk', 'price'))
+
+    modifier_rows = list(models.Modifier.objects
+                         .filter(ticket_type_id__in=ticket_type_pks)
+                         .values_list('ticket_type_id', 'pk', 'condition_id',
+                                      'delta'))
+    conditions = {
+        c.pk: '{}'.format(c) for c in
+        models.Condition.objects
+        .filter(pk__in={row[2] for row in modifier_rows})
+        .select_subclasses()
+    }
+    modifiers = {pk: [] for pk in prices}
+    for ticket_type_pk, pk, condition_id, delta in modifier_rows:
+        modifiers[ticket_type_pk].append(SheetModifier(
+            pk, condition_id, conditions[condition_id], delta))
+
+    variation_choices = {pk: {} for pk in prices}
+    for ticket_type_pk, pk, delta in (
+            models.VariationChoice.objects
+            .filter(variation__ticket_type_id__in=ticket_type_pks)
+            .values_list('variation__ticket_type_id', 'pk', 'delta')):
+        variation_choices[ticket_type_pk][pk] = delta
+
+    return {
+        pk: PriceSheet(price, tuple(modifiers[pk]), variation_choices[pk])
+        for pk, price in prices.items()
+    }
+
+
+def get_sheets(ticket_type_pks):
+    """
+    Returns the price sheets of the ticket types, keyed by ticket type ID,
+    reading the cache in a single round trip.
+    """
+    ticket_type_pks = set(ticket_type_pks)
+    keys = []
+    for pk in ticket_type_pks:
+        keys += [get_version_key(pk), get_sheet_key(pk)]
+    values = cache.get_many(keys)
+
+    sheets = {}
+    versions = {}
+    for pk in ticket_type_pks:
+        versions[pk] = values.get(get_version_key(pk), 0)
+        entry = values.get(get_sheet_key(pk))
+        if entry is not None and entry[0] == versions[pk]:
+            sheets[pk] = entry[1]
+
+    missing_pks = ticket_type_pks - set(sheets)
+    if missing_pks:
+        new_sheets = build_sheets(missing_pks)
+        cache.set_many(
+            {get_sheet_key(pk): (versions[pk], sheet)
+             for pk, sheet in new_sheets.items()},
+            timeout=settings.CACHE_TIMEOUT_PRICE_SHEETS)
+        sheets.update(new_sheets)
+
+    return sheets
+
+
+def get_sheet(ticket_type):
+    return get_sheets([ticket_type.pk])[ticket_type.pk]
+
+
+def invalidate(ticket_type_pks):
+    ticket_type_pks = list(ticket_type_pks)
+
+    def bump():
+        for pk in ticket_type_pks:
+            cache.add(get_version_key(pk), 0, timeout=None)
+            cache.incr(get_version_key(pk))
+
+    # Sheets built before the change is committed still have the old prices,
+    # so the version is bumped once more on commit.
+    bump()
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender='bitket.TicketType')
+@receiver(post_delete, sender='bitket.TicketType')
+def invalidate_ticket_type(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+@receiver(post_save, sender='bitket.Modifier')
+@receiver(post_delete, sender='bitket.Modifier')
+def invalidate_modifier(sender, instance, **kwargs):
+    invalidate([instance.ticket_type_id])
+
+
+@receiver(post_save, sender='bitket.VariationChoice')
+@receiver(post_delete, sender='bitket.VariationChoice')
+def invalidate_variation_choice(sender, instance, **kwargs):
+    # The variation may be gone already when deleted along with it
+    invalidate(models.Variation.objects
+               .filter(pk=instance.variation_id)
+               .values_list('ticket_type_id', flat=True))
+
+
+@receiver(post_save)
+def invalidate_condition(sender, instance, **kwargs):
+    # Sheets hold the descriptions of the conditions
+    if isinstance(instance, models.Condition):
+        invalidate(models.Modifier.objects
+                   .filter(condition_id=instance.pk)
+                   .values_list('ticket_type_id', flat=True))
@@ -0,0 +1,118 @@
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpRequest
+from django.utils.timezone import now
+from rest_framework.renderers import JSONRenderer
+from rest_framework.status import HTTP_207_MULTI_STATUS
+from rest_framework.views import exception_handler
+
+from . import models, serializers, streams, workers
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'bitket_purchase_jobs'
+
+
+class JobRequest(HttpRequest):
+    """
+    Stands in for the original request when a purchase job is processed.
+    """
+
+    def __init__(self, job):
+        super(JobRequest, self).__init__()
+        self.method = 'POST'
+        self.user = job.user
+        self.META['HTTP_HOST'] = job.host
+        self.job_scheme = job.scheme
+        # The tickets, and so their ownerships, are new every time a job is
+        # retried, but the charge must not be.
+        self.idempotency_key = str(job.pk)
+
+    def _get_scheme(self):
+        return self.job_scheme
+
+
+def to_primitive(data):
+    # Gets rid of everything the JSON field won't handle, e.g. Decimals and
+    # lazy translations.
+    return json.loads(JSONRenderer().render(data).decode())
+
+
+def enqueue(request):
+    job = models.PurchaseJob.objects.create(
+        user=request.user,
+        data=request.data,
+        host=request.get_host(),
+        scheme=request.scheme)
+
+    workers.notify(NOTIFY_CHANNEL)
+
+    return job
+
+
+def claim():
+    """
+    Leases the oldest claimable job. Jobs whose worker dies while processing
+    them are claimed again once the lease runs out.
+    """
+    with transaction.atomic():
+        # The user is loaded once the job is claimed, only the job row is
+        # locked.
+        job = (models.PurchaseJob.objects.claimable()
+               .select_for_update(skip_locked=True)
+               .order_by('created')
+               .first())
+
+        if job is None:
+            return None
+
+        job.status = job.STATUS_PROCESSING
+        job.started = now()
+        job.save(update_fields=['status', 'started'])
+
+    return job
+
+
+def process(job):
+    serializer = serializers.PurchaseSerializer(
+        data=job.data, context={'request': JobRequest(job)})
+
+    try:
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+    except Exception as exc:
+        response = exception_handler(exc, {})
+        if response is None:
+            logger.exception('Purchase job %s failed', job.pk)
+            job.finish({'detail': 'A server error occurred.'}, 500)
+        else:
+            job.finish(to_primitive(response.data), response.status_code)
+    else:
+        job.finish(to_primitive(serializer.data), HTTP_207_MULTI_STATUS)
+
+    streams.publish_purchase_job(job)
+    return job
+
+
+class Worker(workers.Worker):
+    """
+    Processes queued purchase jobs until stopped.
+    """
+
+    channel = NOTIFY_CHANNEL
+
+    def __init__(self, poll_interval=None):
+        super(Worker, self).__init__(
+            poll_interval if poll_interval is not None
+            else settings.PURCHASE_WORKER_POLL_INTERVAL)
+
+    def work(self):
+        job = claim()
+        if job is None:
+            return False
+
+        process(job)
+        return True
@@ -0,0 +1,88 @@
+import hashlib
+import logging
+import os
+from tempfile import NamedTemporaryFile
+
+import qrcode
+from django.conf import settings
+from django.core.cache import cache
+from six import BytesIO
+
+logger = logging.getLogger(__name__)
+
+
+def render(payload):
+    output_buffer = BytesIO()
+    qr_image = qrcode.make(
+        payload,
+        error_correction=qrcode.ERROR_CORRECT_H,
+        box_size=6,
+        border=4  # The QR spec stipulates a border of 4
+    )
+    qr_image.save(output_buffer, format='png', optimize=True)
+    return output_buffer.getvalue()
+
+
+class ImageCache(object):
+    """
+    Keeps rendered QR images in the cache backed by files in QR_CACHE_DIR.
+    Images are addressed by a hash of their payload, so a changed payload is
+    simply a new image and nothing ever needs to be invalidated.
+    """
+
+    def get_digest(self, payload):
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_cache_key(self, digest):
+        return 'bitket.qr.{}'.format(digest)
+
+    def get_path(self, digest):
+        if not settings.QR_CACHE_DIR:
+            return None
+        # Fanning out keeps the directories small
+        return os.path.join(settings.QR_CACHE_DIR, digest[:2],
+                            '{}.png'.format(digest))
+
+    def read_file(self, digest):
+        path = self.get_path(digest)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_file(self, digest, image):
+        path = self.get_path(digest)
+        if path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written aside and moved into place so readers never see a
+            # partial image.
+            with NamedTemporaryFile(dir=os.path.dirname(path),
+                                    delete=False) as f:
+                f.write(image)
+            os.replace(f.name, path)
+        except OSError:
+            logger.warning('Could not write QR image %s', path, exc_info=True)
+
+    def get(self, payload):
+        digest = self.get_digest(payload)
+        cache_key = self.get_cache_key(digest)
+
+        image = cache.get(cache_key)
+        if image is not None:
+            return image
+
+        image = self.read_file(digest)
+        if image is None:
+            image = render(payload)
+            self.write_file(digest, image)
+
+        cache.set(cache_key, image, settings.CACHE_TIMEOUT_QR)
+        return image
+
+
+image_cache = ImageCache()
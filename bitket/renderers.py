@@ -1,3 +1,6 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
 from rest_framework import renderers
 from rest_framework.response import Response
 
@@ -16,3 +19,17 @@ class QrRenderer(renderers.BaseRenderer):
         response = stream.getvalue()
         stream.close()
         return response
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """
+    Lets stream views accept EventSource requests. Streams bypass rendering,
+    so this only renders errors, as error events.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return 'event: error\ndata: {}\n\n'.format(
+            json.dumps(data, cls=DjangoJSONEncoder)).encode()
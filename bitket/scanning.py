@@ -0,0 +1,234 @@
+"""
+Resolves door scans to ticket ownerships.
+
+Every event being scanned has an index in Redis that maps what can be scanned
+or typed in at the door (IDs, codes, QR payloads, NINs, emails and known card
+numbers) straight to the IDs of the current ownerships of the event's tickets,
+so that a scan is a single hash lookup. Indexes are built on first use, or
+ahead of opening the doors with the build_scan_index command, and ownerships
+are added as their tickets are purchased. Entries are never removed, so the
+ownerships looked up must still be checked to be current. The exception are
+learned card numbers, which are forgotten when their owner gets a ticket and
+asked about again.
+"""
+import json
+import logging
+
+import sesam
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+
+from . import models, students
+
+logger = logging.getLogger(__name__)
+
+# KEYS: index
+# ARGV: ownership id, cards entry key, entry keys...
+ADD_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+
+local cards = redis.call('hget', KEYS[1], ARGV[2])
+if cards then
+    for card in string.gmatch(cards, '%S+') do
+        redis.call('hdel', KEYS[1], 'card:' .. card)
+    end
+    redis.call('hdel', KEYS[1], ARGV[2])
+end
+
+for i = 3, #ARGV do
+    local ids = redis.call('hget', KEYS[1], ARGV[i])
+    if not ids or ids == '' then
+        redis.call('hset', KEYS[1], ARGV[i], ARGV[1])
+    elseif not string.find(ids, ARGV[1], 1, true) then
+        redis.call('hset', KEYS[1], ARGV[i], ids .. ' ' .. ARGV[1])
+    end
+end
+
+return 1
+"""
+
+# KEYS: index
+# ARGV: card number, email entry key, cards entry key (both keys empty if
+# nobody has the card)
+LEARN_CARD_SCRIPT = """
+local ids = ''
+if ARGV[2] ~= '' then
+    ids = redis.call('hget', KEYS[1], ARGV[2]) or ''
+    local cards = redis.call('hget', KEYS[1], ARGV[3])
+    if not cards or cards == '' then
+        redis.call('hset', KEYS[1], ARGV[3], ARGV[1])
+    elseif not string.find(' ' .. cards .. ' ', ' ' .. ARGV[1] .. ' ', 1,
+                           true) then
+        redis.call('hset', KEYS[1], ARGV[3], cards .. ' ' .. ARGV[1])
+    end
+end
+
+redis.call('hset', KEYS[1], 'card:' .. ARGV[1], ids)
+return ids
+"""
+
+
+def get_qr_entry_key(ownership_pk, code):
+    return 'qr:{}:{}'.format(ownership_pk, code)
+
+
+def normalize_nin(nin):
+    return nin.replace('-', '')
+
+
+def get_email_entry_key(email):
+    return 'email:{}'.format(email.lower())
+
+
+def get_cards_entry_key(email):
+    # Lists the card numbers learned for the email's ownerships
+    return 'cards:{}'.format(email.lower())
+
+
+def get_entry_keys(ownership_pk, code, nin, email):
+    keys = [
+        'id:{}'.format(ownership_pk),
+        'code:{}'.format(code),
+        get_qr_entry_key(ownership_pk, code),
+        get_email_entry_key(email),
+    ]
+    if nin:
+        keys.append('nin:{}'.format(normalize_nin(nin)))
+    return keys
+
+
+def get_lookup_keys(term):
+    if term.startswith('{'):
+        try:
+            payload = json.loads(term)
+            return [get_qr_entry_key(payload['id'], payload['code'])]
+        except (ValueError, KeyError, TypeError):
+            return []
+
+    return [
+        'id:{}'.format(term.lower()),
+        'code:{}'.format(term),
+        get_email_entry_key(term),
+        'nin:{}'.format(normalize_nin(term)),
+        'card:{}'.format(term),
+    ]
+
+
+class ScanIndex(object):
+    def __init__(self, event_pk):
+        self.event_pk = event_pk
+        self.client = get_redis_connection('default')
+
+    @property
+    def key(self):
+        return 'bitket.scanning.{}.index'.format(self.event_pk)
+
+    def get_ownerships(self):
+        return (models.TicketOwnership.objects
+                .current()
+                .filter(ticket__ticket_type__event_id=self.event_pk,
+                        ticket__pending=False))
+
+    def build(self):
+        entries = {}
+        for pk, code, nin, email in self.get_ownerships().values_list(
+                'pk', 'code', 'user__nin', 'user__email').iterator():
+            for key in get_entry_keys(pk, code, nin, email):
+                entries.setdefault(key, []).append(str(pk))
+
+        # Built aside and moved into place, so lookups never see a partial
+        # index.
+        building_key = '{}.building'.format(self.key)
+        pipe = self.client.pipeline()
+        pipe.delete(building_key)
+        # Keeps empty events from being rebuilt on every scan
+        pipe.hset(building_key, 'built', '')
+        items = [(key, ' '.join(ids)) for key, ids in entries.items()]
+        for i in range(0, len(items), 1000):
+            pipe.hmset(building_key, dict(items[i:i + 1000]))
+        pipe.rename(building_key, self.key)
+        pipe.expire(self.key, settings.SCAN_INDEX_TIMEOUT)
+        pipe.execute()
+
+        return len(entries)
+
+    def add(self, ownership):
+        add = self.client.register_script(ADD_SCRIPT)
+        email = ownership.user.email
+        # Cards learned before the owner had this ticket would not list it
+        add(keys=[self.key],
+            args=[str(ownership.pk), get_cards_entry_key(email)] +
+            get_entry_keys(ownership.pk, ownership.code, ownership.user.nin,
+                           email))
+
+    def learn_card(self, card_number):
+        """
+        Finds out whose card it is from Sesam and enters it under the card
+        number, also when nobody here owns it, so it is only asked once until
+        its owner gets a ticket.
+        """
+        args = [card_number, '', '']
+        try:
+            email = students.get_student(mifare_id=card_number).email
+        except sesam.StudentNotFound:
+            pass
+        except sesam.Error:
+            logger.warning('Sesam request failed', exc_info=True)
+            return set()
+        else:
+            args[1:] = [get_email_entry_key(email),
+                        get_cards_entry_key(email)]
+
+        learn_card = self.client.register_script(LEARN_CARD_SCRIPT)
+        ids = learn_card(keys=[self.key], args=args)
+        return set(ids.decode().split())
+
+    def lookup(self, term):
+        """
+        Returns the IDs of the ownerships the scanned or typed in term could
+        refer to.
+        """
+        term = term.strip()
+        keys = get_lookup_keys(term)
+        if not keys:
+            return set()
+
+        values = self.client.hmget(self.key, ['built'] + keys)
+        if values[0] is None:
+            self.build()
+            values = self.client.hmget(self.key, ['built'] + keys)
+
+        ids = set()
+        for value in values[1:]:
+            if value:
+                ids.update(value.decode().split())
+
+        if not ids and term.isdigit() and values[-1] is None:
+            ids.update(self.learn_card(term))
+
+        return ids
+
+
+def add(ticket, ownership):
+    if ticket.pending:
+        return
+    index = ScanIndex(ticket.ticket_type.event_id)
+    # Only events whose index is built are kept up to date
+    if index.client.exists(index.key):
+        index.add(ownership)
+
+
+@receiver(post_save, sender='bitket.Ticket')
+def add_purchased_ticket(sender, instance, **kwargs):
+    if instance.current_ownership_id is not None:
+        add(instance, instance.current_ownership)
+
+
+@receiver(post_save, sender='bitket.TicketOwnership')
+def add_transferred_ticket(sender, instance, created, **kwargs):
+    if created:
+        add(instance.ticket, instance)
@@ -1,20 +1,18 @@
 import logging
 from collections import OrderedDict
-from time import sleep
 from decimal import Decimal
-from random import random
 
-from django.conf import settings
 from django.db import transaction
+from django.db.models import Manager
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from localflavor.se.forms import SEPersonalIdentityNumberField
-import stripe
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 from rest_framework_expandable import ExpandableSerializerMixin
 from rest_framework_jwt.utils import jwt_payload_handler as original_jwt_payload_handler
 
-from . import exceptions, models
+from . import admission, emails, exceptions, models, payments, pricing
 
 logger = logging.getLogger(__name__)
 
@@ -157,6 +155,32 @@ class PurchaseSerializer(serializers.Serializer):
 
         return value
 
+    def get_admission_message(self, outcome, ticket):
+        ticket_type = ticket.ticket_type
+        text = {
+            admission.TICKET_TYPE_UNAVAILABLE: _(
+                "The ticket type '{}' is not available for purchase."),
+            admission.ACCESS_CODE_UTILIZED: _(
+                "The access code is already utilized."),
+            admission.TICKET_TYPE_CONFLICTING: _(
+                "The ticket type conflicts with another ticket of yours."),
+            admission.MAX_TOTAL_QUANTITY_EXCEEDED: _(
+                "There are no tickets of the type '{}' left."),
+            admission.MAX_PERSONAL_QUANTITY_EXCEEDED: _(
+                "You have reached your personal limit for the ticket type "
+                "'{}'."),
+            admission.BAD_QUEUE_POSITION: _(
+                "You didn't get a good enough queue position to get the "
+                "ticket '{}'."),
+        }[outcome]
+
+        return OrderedDict((
+            ('code', outcome),
+            ('text', text.format(ticket_type.name)),
+            ('entity', reverse('tickettype-detail', kwargs={
+                'pk': ticket_type.pk}, request=self.context['request']))
+        ))
+
     def create(self, validated_data):
         # * Validate ticket types according to general avail. and access code
         # * Create ticket objects
@@ -176,190 +200,149 @@ class PurchaseSerializer(serializers.Serializer):
         # We've already validated there is only one organization in play here.
         organization = tickets_data[0]['ticket_type'].event.organization
 
-        unclear_tickets = set()
         safe_tickets = set()
         lost_tickets = set()
 
         with transaction.atomic():
+            # Serializes the insertion per ticket type, making the queue order
+            # (i.e. the ticket sequence) match the order in which concurrent
+            # admissions get to see the tickets.
+            list(models.TicketType.objects.select_for_update().filter(
+                pk__in=[t['ticket_type'].pk for t in tickets_data]
+            ).order_by('pk'))
+
+            entries = []
             for ticket_data in tickets_data:
                 for access_code in validated_data.get('access_codes'):
                     if access_code and access_code.ticket_type == ticket_data['ticket_type']:
                         ticket_data['access_code'] = access_code
                 # Keeping M2M until we have saved
                 variation_choices = ticket_data.pop('variation_choices')
-                ticket = models.Ticket.objects.create(pending=True, **ticket_data)
-                ticket.variation_choices.set(variation_choices)
-                models.TicketOwnership.objects.create(ticket=ticket, user=user)
-                unclear_tickets.add(ticket)
-        try:
-            while True:
-                for ticket in unclear_tickets:
-                    if not ticket.ticket_type.is_generally_available:
-                        # Ticket type not available for purchase
-                        if not ticket.access_code:
-                            lost_tickets.add(ticket)
-                            response_data['messages'].append(dict(
-                                code='ticket_type_unavailable',
-                                text=_("The ticket type '{}' is not available for purchase.".format(
-                                        ticket.ticket_type.name)),
-                                entity=reverse('tickettype-detail', kwargs={
-                                    'pk': ticket.ticket_type_id}, request=request)))
-                            continue
-
-                        # Access code is supplied, has an impact on availability
-                        # and is utilized by a ticket before this one.
-                        if ticket.access_code and ticket.access_code.tickets.before_in_queue(ticket=ticket).exists():
-                            lost_tickets.add(ticket)
-                            response_data['messages'].append(OrderedDict((
-                                ('code', 'access_code_utilized'),
-                                ('text', _("The access code is already utilized."))
-                            )))
-                            continue
-
-                    if models.Ticket.objects.filter(ticket_type__conflicts_with=ticket.ticket_type).before_in_queue(ticket=ticket).owned_by(user).exists():
-                        lost_tickets.add(ticket)
-                        response_data['messages'].append(dict(
-                            code='ticket_type_conflicting',
-                            text=_('The ticket type conflicts with another ticket of yours.'),
-                            entity=reverse('tickettype-detail', kwargs={'pk': ticket.ticket_type_id}, request=request)
-                        ))
-                        continue
+                entries.append((models.Ticket(pending=True, **ticket_data),
+                                variation_choices, user))
 
-                    # No tickets left
-                    if not ticket.ticket_type.within_max_total_quantity:
-                        lost_tickets.add(ticket)
-                        response_data['messages'].append(OrderedDict((
-                            ('code', 'ticket_type_max_total_quantity_exceeded'),
-                            ('text', _("There are no tickets of the type '{}' left.".format(ticket.ticket_type.name))),
-                            ('entity', reverse('tickettype-detail', kwargs={'pk': ticket.ticket_type_id}, request=request))
-                        )))
-                        continue
-
-                    if ticket.ticket_type.max_personal_quantity and ticket.ticket_type.tickets.before_in_queue(ticket=ticket).owned_by(user).count() >= ticket.ticket_type.max_personal_quantity:
-                        lost_tickets.add(ticket)
-                        response_data['messages'].append(OrderedDict((
-                            ('code', 'ticket_type_max_personal_quantity_exceeded'),
-                            ('text', _(
-                                "You have reached your personal limit for the ticket type '{}'.".format(
-                                    ticket.ticket_type.name))),
-                            ('entity', reverse('tickettype-detail', kwargs={
-                                'pk': ticket.ticket_type_id}, request=request))
-                        )))
-                        continue
+            ticket_ownerships = (models.TicketOwnership.objects
+                                 .bulk_create_with_tickets(entries))
+            tickets = [o.ticket for o in ticket_ownerships]
+            # There is one ownership per new ticket
+            ticket_ownerships = {o.ticket_id: o for o in ticket_ownerships}
+        ticket_types = OrderedDict(
+            (t.ticket_type_id, t.ticket_type) for t in tickets)
 
-                    max_total_quantity = ticket.ticket_type.max_total_quantity
-                    position = ticket.ticket_type.tickets.before_in_queue(ticket=ticket).count()
+        def get_ticket_ids(ticket_type, tickets):
+            return [t.pk for t in tickets if t.ticket_type_id == ticket_type.pk]
 
-                    # position is zero-indexed
-                    if not max_total_quantity or position < max_total_quantity:
-                        # Since the position never gets higher, we now know that
-                        # this ticket is safe. Great!
-                        safe_tickets.add(ticket)
+        try:
+            for ticket_type in ticket_types.values():
+                # Every pending ticket of the type is settled at once, but
+                # units are only reserved for our own.
+                outcomes = admission.Admission(ticket_type).admit(
+                    get_ticket_ids(ticket_type, tickets))
+
+                for ticket in tickets:
+                    if ticket.ticket_type_id != ticket_type.pk:
                         continue
 
-                    # Everything above this position will be discarded.
-                    cutoff_position = 2 * max_total_quantity - ticket.ticket_type.tickets.unpending().count()
-
-                    # Cutting off randomly (although weighted) up to the point
-                    # where there are as many pending over the maximum quantity
-                    # as under it. (Beneath this point all are discarded)
-                    if random() <= (
-                            (position - max_total_quantity) /
-                            (cutoff_position - max_total_quantity or 0.001)  # Save us from ZeroDivisionError
-                            ) ** 3:  # Make it much harder near the cutoff
+                    outcome = outcomes[ticket.pk]
+                    if outcome == admission.ADMITTED:
+                        safe_tickets.add(ticket)
+                    else:
                         lost_tickets.add(ticket)
-                        response_data['messages'].append(OrderedDict((
-                            ('code', 'bad_queue_position'),
-                            ('text', _(
-                                "You didn't get a good enough queue position to get the ticket '{}'.".format(
-                                    ticket.ticket_type.name))),
-                            ('entity', reverse('tickettype-detail', kwargs={
-                                'pk': ticket.ticket_type_id}, request=request))
-                        )))
-                        continue
-
-                unclear_tickets = unclear_tickets.difference(safe_tickets,
-                                                             lost_tickets)
-
-                # Delete all lost tickets so we release the positions to
-                # concurrent buyers
-                for ticket in lost_tickets:
-                    ticket.delete()
-                lost_tickets.clear()
+                        response_data['messages'].append(
+                            self.get_admission_message(outcome, ticket))
 
-                if unclear_tickets:
-                    # Wait for a while and retry.
-                    sleep(0.5)
-                    continue
-                else:
-                    # We know every ticket's destiny.
-                    break
+            # Delete all lost tickets so we release the positions to
+            # concurrent buyers
+            models.Ticket.objects.filter(
+                pk__in=[t.pk for t in lost_tickets]).delete()
 
         except Exception as exc:
             # Something went really wrong and we must clean up the mess before
             # raising the exception.
-            for ticket in unclear_tickets | safe_tickets | lost_tickets:
-                ticket.delete()
+            for ticket_type in ticket_types.values():
+                ticket_type.inventory.release(
+                    get_ticket_ids(ticket_type, tickets))
+            models.Ticket.objects.filter(
+                pk__in=[t.pk for t in tickets]).delete()
 
             raise exc
 
         if safe_tickets:
-            charge_amount = Decimal(0)
-
-            for ticket in safe_tickets:
-                # There should be one ownership per ticket, hence get()
-                charge_amount += ticket.ownerships.get().price
+            charge_amount = sum(
+                (ticket_ownerships[t.pk].price for t in safe_tickets),
+                Decimal(0))
 
             try:
                 assert charge_amount <= validated_data['payment']['amount']
 
-                charge = stripe.Charge.create(
-                    stripe_account=organization.stripe_account_id,
+                charge_id = payments.get_provider().charge(
+                    organization,
+                    amount=charge_amount,
                     source=validated_data['payment']['payload'],
-                    amount=int(charge_amount * 100),
-                    currency=settings.CURRENCY,
+                    idempotency_key=(
+                        getattr(request, 'idempotency_key', None) or
+                        payments.get_idempotency_key(
+                            ticket_ownerships[t.pk] for t in safe_tickets)),
                     receipt_email=user.email,
                     metadata=dict(
-                        bitket_ticket_ownerships=','.join(map(lambda x: str(x.ownerships.get().pk), safe_tickets))
+                        bitket_ticket_ownerships=','.join(map(lambda x: str(ticket_ownerships[x.pk].pk), safe_tickets))
                     )
                 )
             except Exception as exc:
                 # Something went wrong and we must clean up the mess.
+                for ticket_type in ticket_types.values():
+                    ticket_type.inventory.release(
+                        get_ticket_ids(ticket_type, safe_tickets))
                 for ticket in safe_tickets:
                     ticket.delete()
 
-                if isinstance(exc, stripe.error.CardError):
-                    # See https://stripe.com/docs/api#errors
-                    error = exc.json_body['error']
-                    raise exceptions.PaymentFailed(error['message'])
-
                 raise exc
 
-            purchase_transaction = models.Transaction.objects.create(
-                amount=charge_amount,
-                stripe_charge=charge.id
-            )
-            response_data['transactions'].append(purchase_transaction)
-
-            # Must be done before sending the confirmation emails
-            user.nin = validated_data['user']['nin']
-            user.save()
-
-            for ticket in safe_tickets:
-                ticket.pending = False
-                ticket_ownership = ticket.ownerships.latest()
-                purchase_transaction.ticket_ownerships.add(ticket_ownership)
-                ticket.save()
-                response_data['tickets'].append(ticket)
-                try:
-                    ticket_ownership.email_confirmation()
-                except Exception as exc:
-                    # This should not stop us.
-                    logger.exception('Exception during mail send')
+            with transaction.atomic():
+                purchase_transaction = models.Transaction.objects.create(
+                    amount=charge_amount,
+                    stripe_charge=charge_id
+                )
+                response_data['transactions'].append(purchase_transaction)
+
+                # Must be done before sending the confirmation emails
+                user.nin = validated_data['user']['nin']
+                user.save()
+
+                for ticket in safe_tickets:
+                    ticket.pending = False
+                    purchase_transaction.ticket_ownerships.add(
+                        ticket_ownerships[ticket.pk])
+                    ticket.save()
+                    response_data['tickets'].append(ticket)
+
+                # Sent by the email worker once this commits
+                emails.queue_confirmations(
+                    ticket_ownerships[t.pk] for t in safe_tickets)
+
+            # The tickets are now purchased according to the database, so the
+            # holds can be turned into sold units.
+            for ticket_type in ticket_types.values():
+                ticket_type.inventory.commit(
+                    get_ticket_ids(ticket_type, safe_tickets))
 
         return response_data
 
 
+class PurchaseJobSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = models.PurchaseJob
+        fields = (
+            'url',
+            'id',
+            'status',
+            'created'
+        )
+        extra_kwargs = {
+            'url': {'view_name': 'purchase-detail'}
+        }
+
+
 class TicketSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = models.Ticket
@@ -434,6 +417,19 @@ class TicketOwnershipSerializer(ExpandableSerializerMixin,
     def get_utilized(self, obj):
         return obj.ticket.utilized
 
+class CheckInSerializer(serializers.Serializer):
+    ownerships = serializers.ListField(child=serializers.UUIDField())
+
+
+class EntrySerializer(serializers.Serializer):
+    ownership = serializers.UUIDField()
+    utilized = serializers.DateTimeField()
+
+
+class EntryBatchSerializer(serializers.Serializer):
+    entries = EntrySerializer(many=True)
+
+
 class VariationChoiceSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = models.VariationChoice
@@ -486,12 +482,23 @@ class AccessCodeSerializer(serializers.HyperlinkedModelSerializer):
         return self.context['view'].kwargs.get('token', obj.token)
 
 
+class TicketTypeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        data = list(data.all() if isinstance(data, Manager) else data)
+        # Reads the price sheets of all ticket types at once
+        self.child.price_sheets = pricing.get_sheets(t.pk for t in data)
+        return super(TicketTypeListSerializer, self).to_representation(data)
+
+
 class TicketTypeSerializer(serializers.HyperlinkedModelSerializer):
     modifiers = serializers.SerializerMethodField()
     availability = serializers.SerializerMethodField()
 
+    price_sheets = None
+
     class Meta:
         model = models.TicketType
+        list_serializer_class = TicketTypeListSerializer
         fields = [
             'url',
             'id',
@@ -511,21 +518,23 @@ class TicketTypeSerializer(serializers.HyperlinkedModelSerializer):
             ('total_quantity', obj.within_max_total_quantity)
         ))
 
-    def get_modifiers(self, obj):
-        class _ModifierSerializer(serializers.ModelSerializer):
-            condition = serializers.SerializerMethodField()
-
-            class Meta:
-                model = models.Modifier
-                fields = [
-                    'condition',
-                    'delta'
-                ]
-
-            def get_condition(self, obj):
-                return '{}'.format(obj.condition_subclass)
-
+    @cached_property
+    def met_condition_ids(self):
         user = self.context['request'].user
-        modifiers = obj.modifiers.eligible(user).select_related('condition')
-        serializer = _ModifierSerializer(modifiers, read_only=True, many=True)
-        return serializer.data
+        if user.is_anonymous():
+            return frozenset()
+        return user.get_met_conditions()
+
+    def get_modifiers(self, obj):
+        if self.price_sheets and obj.pk in self.price_sheets:
+            price_sheet = self.price_sheets[obj.pk]
+        else:
+            price_sheet = pricing.get_sheet(obj)
+
+        return [
+            OrderedDict((
+                ('condition', modifier.condition),
+                ('delta', str(modifier.delta)),
+            ))
+            for modifier in price_sheet.get_modifiers(self.met_condition_ids)
+        ]
@@ -2,6 +2,7 @@ import datetime
 import re
 import warnings
 from os import path
+from tempfile import gettempdir
 
 import certifi
 import django.http.request
@@ -94,6 +95,13 @@ EMAIL_SUBJECT_ENV_PREFIX = env.str('EMAIL_SUBJECT_ENV_PREFIX',
                                '[Bitket] ')
 SERVER_EMAIL = env.str('SERVER_EMAIL', DEFAULT_FROM_EMAIL)
 
+EMAIL_OUTBOX_BATCH_SIZE = env.int('EMAIL_OUTBOX_BATCH_SIZE', default=50)
+# Messages per second
+EMAIL_OUTBOX_RATE_LIMIT = env.float('EMAIL_OUTBOX_RATE_LIMIT', default=10)
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+EMAIL_OUTBOX_LEASE_TIMEOUT = 10 * 60
+EMAIL_WORKER_POLL_INTERVAL = 5
+
 ADMINS = tuple(
     ("""Bitket admin""", address)
     for address in
@@ -223,7 +231,7 @@ SOCIAL_AUTH_PIPELINE = (
     # specified by settings (and the default ones like access_token, etc).
     'social_core.pipeline.social_auth.load_extra_data',
 
-    # Gets student union, if applicable
+    # Looks up the student union in the background, if applicable
     'bitket.models.social_get_union',
 
     # Update the user record with any changed info from the auth service.
@@ -346,6 +354,19 @@ KOBRA_TOKEN = env.str('KOBRA_TOKEN', default='')
 
 SESAM_USERNAME = env.str('SESAM_USERNAME', default='')
 SESAM_PASSWORD = env.str('SESAM_PASSWORD', default='')
+# Overrides the address in the WSDL, such as for a stub Sesam
+SESAM_URL = env.str('SESAM_URL', default='')
+SESAM_TIMEOUT = env.float('SESAM_TIMEOUT', default=5)
+SESAM_POOL_SIZE = env.int('SESAM_POOL_SIZE', default=10)
+SESAM_BREAKER_THRESHOLD = env.int('SESAM_BREAKER_THRESHOLD', default=5)
+SESAM_BREAKER_TIMEOUT = env.int('SESAM_BREAKER_TIMEOUT', default=30)
+
+# Student unions are looked up on login when older than this
+STUDENT_UNION_MAX_AGE = env.int('STUDENT_UNION_MAX_AGE', default=24 * 60 * 60)
+STUDENT_UNION_WORKERS = env.int('STUDENT_UNION_WORKERS', default=4)
+# Should exceed the time a lookup takes, including its wait for a worker.
+STUDENT_UNION_PENDING_TIMEOUT = env.int('STUDENT_UNION_PENDING_TIMEOUT',
+                                        default=60)
 
 STRIPE_OAUTH_AUTHORIZATION_URL = 'https://connect.stripe.com/oauth/authorize'
 STRIPE_OAUTH_TOKEN_URL = 'https://connect.stripe.com/oauth/token'
@@ -355,11 +376,63 @@ STRIPE_SECRET_KEY = env.str('STRIPE_SECRET_KEY', '')
 STRIPE_CLIENT_ID = env.str('STRIPE_CLIENT_ID', '')
 stripe.api_key = STRIPE_SECRET_KEY
 
+PAYMENT_PROVIDER = env.str('PAYMENT_PROVIDER',
+                           default='bitket.payments.StripeProvider')
+PAYMENT_TIMEOUT = env.int('PAYMENT_TIMEOUT', default=30)
+PAYMENT_FAKE_LATENCY = env.float('PAYMENT_FAKE_LATENCY', default=0.5)
+PAYMENT_FAKE_DECLINE_RATE = env.float('PAYMENT_FAKE_DECLINE_RATE', default=0.1)
+
 CURRENCY = 'SEK'
 
 TYPEKIT_ID = env.str('TYPEKIT_ID', '')
 
+QR_CACHE_DIR = env.str('QR_CACHE_DIR',
+                       default=path.join(gettempdir(), 'bitket-qr'))
+
 CACHE_TIMEOUT_PERSON_CONDITIONS = 10 * 60
+CACHE_TIMEOUT_QR = 7 * 24 * 60 * 60
+CACHE_TIMEOUT_PRICE_SHEETS = 24 * 60 * 60
+# Also the longest an availability snapshot can lag behind changes that bypass
+# signals, such as queryset updates.
+CACHE_TIMEOUT_AVAILABILITY = env.int('CACHE_TIMEOUT_AVAILABILITY', 5)
+# Sesam lookups by identifier, as (found, not found)
+CACHE_TIMEOUT_SESAM = {
+    'liu_id': (24 * 60 * 60, 60 * 60),
+    'nor_edu_person_lin': (24 * 60 * 60, 60 * 60),
+    # Cards are handed out and replaced more often
+    'mifare_id': (60 * 60, 10 * 60),
+}
+
+# Streams end after STREAM_MAX_DURATION seconds, after which clients reconnect
+# within STREAM_RETRY_INTERVAL seconds.
+STREAM_MAX_DURATION = env.int('STREAM_MAX_DURATION', 10 * 60)
+STREAM_RETRY_INTERVAL = env.int('STREAM_RETRY_INTERVAL', 3)
+STREAM_HEARTBEAT_INTERVAL = env.int('STREAM_HEARTBEAT_INTERVAL', 15)
+STREAM_QUEUE_SIZE = 100
+
+# PEM encoded EC private key signing entry manifests, e.g. made with
+# `openssl ecparam -name prime256v1 -genkey -noout`. Door scanners verify the
+# manifests with its public key. Newlines may be escaped as \n. Offline
+# scanning is off without it.
+ENTRY_MANIFEST_KEY = env.str('ENTRY_MANIFEST_KEY', default='')
+# Number of changed tickets kept for diffing manifests. Scanners whose
+# versions are older get full manifests.
+ENTRY_MANIFEST_CHANGE_LOG_SIZE = env.int('ENTRY_MANIFEST_CHANGE_LOG_SIZE',
+                                         5000)
+
+# Scan indexes are rebuilt this often, picking up changes to users.
+SCAN_INDEX_TIMEOUT = env.int('SCAN_INDEX_TIMEOUT', 6 * 60 * 60)
+
+# Should comfortably exceed the time a payment can take.
+INVENTORY_HOLD_TIMEOUT = env.int('INVENTORY_HOLD_TIMEOUT', 15 * 60)
+
+# Hands purchases over to the purchase workers instead of processing them
+# within the request.
+PURCHASE_QUEUE = env.bool('PURCHASE_QUEUE', default=False)
+PURCHASE_WORKER_POLL_INTERVAL = 5
+# Should comfortably exceed the time a purchase can take. Jobs processing for
+# longer are handed to another worker.
+PURCHASE_JOB_LEASE_TIMEOUT = env.int('PURCHASE_JOB_LEASE_TIMEOUT', 5 * 60)
 
 FRONTEND_SETTINGS = {
     # WARNING: These settings are published!
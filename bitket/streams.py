@@ -0,0 +1,218 @@
+"""
+Pushes availability changes and purchase outcomes to clients as server-sent
+events.
+
+Messages are published on Redis channels. Every process holds a single
+subscription to all of them, through its hub, and fans messages out to the
+clients connected to it, so clients cost no Redis connections of their own.
+Streams are long-lived, so serve them with a threaded or asynchronous worker.
+"""
+import json
+import logging
+import threading
+from collections import defaultdict
+from queue import Empty, Full, Queue
+from time import sleep, time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection
+from django.http import StreamingHttpResponse
+from django_redis import get_redis_connection
+from redis.exceptions import ConnectionError
+
+from . import availability
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'bitket.streams.'
+EVENT_CHANNEL_PREFIX = '{}events.'.format(CHANNEL_PREFIX)
+USER_CHANNEL_PREFIX = '{}users.'.format(CHANNEL_PREFIX)
+
+
+def get_event_channel(event_pk):
+    return '{}{}'.format(EVENT_CHANNEL_PREFIX, event_pk)
+
+
+def get_user_channel(user_pk):
+    return '{}{}'.format(USER_CHANNEL_PREFIX, user_pk)
+
+
+def publish(channel, data=None):
+    # Streams are best effort, clients catch up on reconnecting
+    try:
+        get_redis_connection('default').publish(
+            channel, json.dumps(data, cls=DjangoJSONEncoder))
+    except ConnectionError:
+        logger.warning('Could not publish on %s', channel, exc_info=True)
+
+
+def publish_availability(event_pk):
+    # The hub reads the snapshot, once per process
+    publish(get_event_channel(event_pk))
+
+
+def publish_purchase_job(job):
+    publish(get_user_channel(job.user_id), {
+        'id': job.pk,
+        'status': job.status,
+        'result_status': job.result_status,
+        'result': job.result,
+    })
+
+
+class Message(object):
+    def __init__(self, event, data, id=None):
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def encode(self):
+        lines = ['event: {}'.format(self.event)]
+        if self.id is not None:
+            lines.append('id: {}'.format(self.id))
+        lines.append('data: {}'.format(
+            json.dumps(self.data, cls=DjangoJSONEncoder)))
+        return '{}\n\n'.format('\n'.join(lines)).encode()
+
+
+class Subscription(object):
+    def __init__(self, hub, channels):
+        self.hub = hub
+        self.channels = channels
+        self.queue = Queue(maxsize=settings.STREAM_QUEUE_SIZE)
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            # The client does not keep up, it gets what is current once it
+            # reconnects.
+            logger.warning('Dropping message for a slow stream client')
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub(object):
+    """
+    Dispatches the messages of a single Redis subscription to the
+    subscriptions of the process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+        # The ETags of the last availability snapshots dispatched by channel
+        self.etags = {}
+        self.thread = None
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self.lock:
+            for channel in channels:
+                self.subscriptions[channel].add(subscription)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True,
+                                               name='bitket-stream-hub')
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].discard(subscription)
+                if not self.subscriptions[channel]:
+                    del self.subscriptions[channel]
+                    self.etags.pop(channel, None)
+
+    def get_message(self, channel, data):
+        if channel.startswith(EVENT_CHANNEL_PREFIX):
+            # The hub's connection is long-lived
+            close_old_connections()
+            snapshot = availability.get_snapshot(
+                channel[len(EVENT_CHANNEL_PREFIX):])
+            # Changes often leave the availability as it was
+            if snapshot is None or self.etags.get(channel) == snapshot.etag:
+                return None
+            self.etags[channel] = snapshot.etag
+            return Message('availability', snapshot.data, id=snapshot.etag)
+        return Message('purchase', data)
+
+    def dispatch(self, channel, data):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        if not subscriptions:
+            return
+
+        message = self.get_message(channel, json.loads(data.decode()))
+        if message is None:
+            return
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def run(self):
+        while True:
+            try:
+                pubsub = get_redis_connection('default').pubsub(
+                    ignore_subscribe_messages=True)
+                pubsub.psubscribe('{}*'.format(CHANNEL_PREFIX))
+                for message in pubsub.listen():
+                    try:
+                        self.dispatch(message['channel'].decode(),
+                                      message['data'])
+                    except Exception:
+                        logger.exception('Could not dispatch %s',
+                                         message['channel'])
+            except ConnectionError:
+                logger.warning('Lost the Redis subscription, resubscribing',
+                               exc_info=True)
+                sleep(1)
+
+
+hub = Hub()
+
+
+def stream(subscription, initial_messages=()):
+    """
+    Yields the encoded messages of the subscription, with heartbeats in
+    between, for at most STREAM_MAX_DURATION seconds after which clients
+    reconnect.
+    """
+    try:
+        yield 'retry: {}\n\n'.format(
+            settings.STREAM_RETRY_INTERVAL * 1000).encode()
+        for message in initial_messages:
+            yield message.encode()
+
+        # Nothing is read from the database while streaming, so its
+        # connection is handed back now rather than when the stream ends.
+        if not connection.in_atomic_block:
+            connection.close()
+
+        deadline = time() + settings.STREAM_MAX_DURATION
+        while time() < deadline:
+            message = subscription.get(settings.STREAM_HEARTBEAT_INTERVAL)
+            if message is None:
+                # Also finds out about clients that went away
+                yield b': heartbeat\n\n'
+            else:
+                yield message.encode()
+    finally:
+        subscription.close()
+
+
+def get_response(subscription, initial_messages=()):
+    response = StreamingHttpResponse(
+        stream(subscription, initial_messages),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keeps proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,257 @@
+"""
+Looks up LiU students in Sesam.
+
+Sesam is asked on logins and door scans, so lookups share a pool of HTTP
+connections with short timeouts and are cached by the identifier they were
+made by, not found students included, with timeouts per identifier set in
+CACHE_TIMEOUT_SESAM. While Sesam is failing, lookups fail right away: after
+SESAM_BREAKER_THRESHOLD failures the breaker opens for SESAM_BREAKER_TIMEOUT
+seconds, after which a single failure opens it again and a success closes it.
+
+The student unions of users logging in with LiU are looked up in the
+background, once every STUDENT_UNION_MAX_AGE seconds at most, so logins do not
+wait for Sesam.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import sesam
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
+from zeep.transports import Transport
+
+from . import memberships, models
+
+logger = logging.getLogger(__name__)
+
+# Cached in place of students that were not found
+NOT_FOUND = 'not-found'
+
+
+class StudentServiceUnavailable(sesam.Error):
+    pass
+
+
+def normalize(identifier, value):
+    if identifier == 'liu_id':
+        return value.strip().lower()
+    if identifier == 'nor_edu_person_lin':
+        return str(uuid.UUID(str(value)))
+    if identifier == 'mifare_id':
+        # Sesam ignores leading zeros
+        return str(value).strip().lstrip('0')
+    raise ValueError('Students cannot be cached by {}'.format(identifier))
+
+
+def get_cache_key(identifier, value):
+    return 'bitket.students.{}.{}'.format(identifier, value)
+
+
+class Breaker(object):
+    failures_key = 'bitket.students.breaker.failures'
+    open_key = 'bitket.students.breaker.open'
+
+    def check(self):
+        if cache.get(self.open_key) is not None:
+            raise StudentServiceUnavailable(
+                message='Sesam is unavailable, not asking it for a while')
+
+    def succeed(self):
+        cache.delete(self.failures_key)
+
+    def fail(self):
+        cache.add(self.failures_key, 0, timeout=settings.SESAM_BREAKER_TIMEOUT)
+        failures = cache.incr(self.failures_key)
+        if failures >= settings.SESAM_BREAKER_THRESHOLD:
+            logger.warning('Sesam failed %s times, opening the breaker',
+                           failures)
+            cache.set(self.open_key, True,
+                      timeout=settings.SESAM_BREAKER_TIMEOUT)
+            # One more failure once the breaker closes opens it again
+            cache.set(self.failures_key, settings.SESAM_BREAKER_THRESHOLD - 1,
+                      timeout=2 * settings.SESAM_BREAKER_TIMEOUT)
+
+
+class StudentService(object):
+    def __init__(self, username, password, url=None,
+                 timeout=None, pool_size=None):
+        self.client = sesam.StudentServiceClient(username=username,
+                                                 password=password)
+        self.breaker = Breaker()
+
+        session = Session()
+        adapter = HTTPAdapter(
+            pool_maxsize=pool_size or settings.SESAM_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        # The client has no say in how it connects, so its zeep client is
+        # handed a transport that does.
+        zeep_client = self.client._zeep_client
+        zeep_client.transport = Transport(
+            session=session,
+            operation_timeout=timeout or settings.SESAM_TIMEOUT)
+        if url:
+            zeep_client.service._binding_options['address'] = url
+
+    def fetch(self, identifier, value):
+        self.breaker.check()
+        try:
+            student = self.client.get_student(**{identifier: value})
+        except sesam.StudentNotFound:
+            self.breaker.succeed()
+            raise
+        except sesam.Error:
+            self.breaker.fail()
+            raise
+        except RequestException as exc:
+            self.breaker.fail()
+            raise StudentServiceUnavailable(message=str(exc)) from exc
+        self.breaker.succeed()
+        return student
+
+    def get_student(self, fresh=False, **identity):
+        """
+        Returns the student by a single identifier: liu_id,
+        nor_edu_person_lin or mifare_id. Raises sesam.StudentNotFound, or
+        another sesam.Error if Sesam could not be asked. Fresh lookups skip
+        the cache, but still fill it.
+        """
+        (identifier, value), = identity.items()
+        value = normalize(identifier, value)
+        key = get_cache_key(identifier, value)
+
+        student = None if fresh else cache.get(key)
+        if student == NOT_FOUND:
+            raise sesam.StudentNotFound(
+                message='Student not found: {}'.format(identity))
+        if student is not None:
+            return student
+
+        timeouts = settings.CACHE_TIMEOUT_SESAM
+        try:
+            student = self.fetch(identifier, value)
+        except sesam.StudentNotFound:
+            cache.set(key, NOT_FOUND, timeout=timeouts[identifier][1])
+            raise
+
+        # Also saves asking by the other identifiers it came with
+        identity = {
+            'liu_id': student.liu_id,
+            'nor_edu_person_lin': student.nor_edu_person_lin,
+            identifier: value,
+        }
+        for identifier, value in identity.items():
+            if value:
+                cache.set(get_cache_key(identifier,
+                                        normalize(identifier, value)),
+                          student, timeout=timeouts[identifier][0])
+        return student
+
+
+@lru_cache(maxsize=None)
+def get_service():
+    # Reading the WSDL takes a while, so it is done on first use
+    return StudentService(username=settings.SESAM_USERNAME,
+                          password=settings.SESAM_PASSWORD,
+                          url=settings.SESAM_URL or None)
+
+
+def get_student(fresh=False, **identity):
+    return get_service().get_student(fresh=fresh, **identity)
+
+
+def get_union_key(user_pk):
+    # Set once the union is looked up
+    return 'bitket.students.unions.{}'.format(user_pk)
+
+
+def get_union_pending_key(user_pk):
+    # Set while a lookup is on its way, so logins in the meantime do not queue
+    # another
+    return 'bitket.students.unions.{}.pending'.format(user_pk)
+
+
+def set_unions(changes):
+    """
+    Sets the student unions of many users at once. Takes union IDs, or None,
+    keyed by user ID.
+    """
+    by_union = defaultdict(list)
+    for user_pk, union_pk in changes.items():
+        by_union[union_pk].append(user_pk)
+
+    with transaction.atomic():
+        for union_pk, user_pks in by_union.items():
+            models.User.objects.filter(pk__in=user_pks).update(
+                student_union_id=union_pk)
+
+    # Updates skip the signals, so the cached conditions of the users are
+    # invalidated here, and once more on commit.
+    def bump():
+        for user_pk in changes:
+            memberships.bump(memberships.get_user_version_key(user_pk))
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def refresh_union(user_pk, nor_edu_person_lin):
+    try:
+        name = get_student(nor_edu_person_lin=nor_edu_person_lin).main_union
+    except sesam.StudentNotFound:
+        name = None
+    except sesam.Error:
+        # Tried again on the next login
+        logger.warning('Sesam request failed', exc_info=True)
+        return
+
+    user = models.User.objects.get(pk=user_pk)
+    union = (models.StudentUnion.objects.get_or_create(name=name)[0]
+             if name else None)
+    if user.student_union_id != (union and union.pk):
+        user.student_union = union
+        user.save(update_fields=['student_union'])
+    # Ready for the user's first look at the ticket types
+    memberships.get(user)
+    cache.set(get_union_key(user_pk), True,
+              timeout=settings.STUDENT_UNION_MAX_AGE)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(settings.STUDENT_UNION_WORKERS,
+                              thread_name_prefix='bitket-student-unions')
+
+
+def run_refresh_union(user_pk, nor_edu_person_lin):
+    try:
+        refresh_union(user_pk, nor_edu_person_lin)
+    except Exception:
+        logger.exception('Could not refresh the student union of %s', user_pk)
+    finally:
+        cache.delete(get_union_pending_key(user_pk))
+        # Each thread of the executor has a connection of its own
+        connection.close()
+
+
+def refresh_union_later(user, nor_edu_person_lin):
+    """
+    Looks up the student union of the user in the background, unless it was
+    looked up recently and the stored one will do.
+    """
+    if not nor_edu_person_lin or cache.get(get_union_key(user.pk)):
+        return
+    # Expires by itself if the login is rolled back or the process dies
+    # before the lookup is made.
+    if not cache.add(get_union_pending_key(user.pk), True,
+                     timeout=settings.STUDENT_UNION_PENDING_TIMEOUT):
+        return
+    # New users are not there for other connections until committed
+    transaction.on_commit(lambda: get_executor().submit(
+        run_refresh_union, user.pk, nor_edu_person_lin))
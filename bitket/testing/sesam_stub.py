@@ -0,0 +1,130 @@
+"""
+A local stand-in for Sesam's student service, answering GetStudent.
+
+    with StubStudentService() as stub:
+        stub.add(student, mifare_id='1234567')
+        service = students.StudentService('', '', url=stub.url)
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+IDENTITY_NS = 'http://service.integration.it.liu.se/ViewModels'
+
+RESPONSE = """<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">
+<s:Body>
+<GetStudentResponse xmlns="http://service.integration.it.liu.se/StudentService/2.0">
+<GetStudentResult xmlns:a="http://service.integration.it.liu.se/EmployeeService/2.1/Contract">
+<a:Student
+    xmlns:b="http://service.integration.it.liu.se/EmployeeService/2.1/ViewModels"
+    xmlns:c="http://schemas.microsoft.com/2003/10/Serialization/Arrays">
+<b:DisplayName>{full_name}</b:DisplayName>
+<b:EmailAddress>{email}</b:EmailAddress>
+<b:GivenName>{first_name}</b:GivenName>
+<b:LiUId>{liu_id}</b:LiUId>
+<b:LiULIN>{liu_lin}</b:LiULIN>
+<b:MainUnion>{main_union}</b:MainUnion>
+<b:StudentUnion>{student_union}</b:StudentUnion>
+<b:SurName>{last_name}</b:SurName>
+<b:eduPersonAffiliations>{edu_person_affiliations}</b:eduPersonAffiliations>
+<b:eduPersonPrimaryAffiliation>{edu_person_primary_affiliation}</b:eduPersonPrimaryAffiliation>
+<b:eduPersonScopedAffiliations>{edu_person_scoped_affiliations}</b:eduPersonScopedAffiliations>
+<b:norEduPersonLIN>{nor_edu_person_lin}</b:norEduPersonLIN>
+</a:Student>
+</GetStudentResult>
+</GetStudentResponse>
+</s:Body>
+</s:Envelope>"""
+
+FAULT = """<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">
+<s:Body>
+<s:Fault>
+<faultcode>s:Client</faultcode>
+<faultstring>{}</faultstring>
+</s:Fault>
+</s:Body>
+</s:Envelope>"""
+
+
+def render_strings(strings):
+    return ''.join('<c:string>{}</c:string>'.format(escape(s))
+                   for s in sorted(strings))
+
+
+def render_student(student):
+    return RESPONSE.format(**{
+        name: (render_strings(value) if isinstance(value, frozenset)
+               else escape(str(value or '')))
+        for name, value in vars(student).items()
+    })
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        identity = {
+            element.tag.split('}')[1]: element.text
+            for element in ElementTree.fromstring(body).iter()
+            if element.tag.startswith('{{{}}}'.format(IDENTITY_NS)) and
+            element.text
+        }
+        stub.requests.append(identity)
+
+        if stub.failing:
+            self.respond(500, FAULT.format('Internal error'))
+            return
+
+        student = stub.find(identity)
+        if student is None:
+            self.respond(500, FAULT.format(
+                'Could not find Student in database'))
+        else:
+            self.respond(200, render_student(student))
+
+    def respond(self, status, content):
+        content = content.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubStudentService(object):
+    def __init__(self):
+        self.students = []
+        # The identities asked for, by Sesam's names for them
+        self.requests = []
+        # Fails every request while set
+        self.failing = False
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.server.stub = self
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self.server.server_port)
+
+    def add(self, student, mifare_id=None):
+        self.students.append((student, mifare_id))
+
+    def find(self, identity):
+        for student, mifare_id in self.students:
+            if (identity.get('LiUId') == student.liu_id or
+                    identity.get('norEduPersonLIN') ==
+                    str(student.nor_edu_person_lin) or
+                    (mifare_id and identity.get('MifareNumber') == mifare_id)):
+                return student
+        return None
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -28,6 +28,8 @@ router.register(r'variation-choices', views.VariationChoiceViewSet)
 api_urlpatterns = [
     url(r'^', include(router.urls)),
     url(r'^purchases/$', views.PurchaseView.as_view(), name='purchase-list'),
+    url(r'^purchases/stream/$', views.PurchaseStreamView.as_view(), name='purchase-stream'),
+    url(r'^purchases/(?P<pk>[^/]+)/$', views.PurchaseJobView.as_view(), name='purchase-detail'),
     url(r'^auth-token/$', SocialJWTOnlyAuthView.as_view()),
     url(r'^auth-token/refresh/$', refresh_jwt_token)
 ]
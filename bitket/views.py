@@ -1,4 +1,6 @@
 import json
+from collections import OrderedDict
+from uuid import UUID
 
 from braces.views import LoginRequiredMixin, PermissionRequiredMixin
 from django.conf import settings
@@ -6,18 +8,26 @@ from django.core import signing
 from django.core.exceptions import SuspiciousOperation
 from django.core.signing import BadSignature
 from django.db.models import Q
+from django.http import Http404
 from django.template.response import TemplateResponse
-from django.utils.http import urlencode
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag, urlencode
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic import TemplateView, RedirectView
 from django.views.generic.detail import SingleObjectMixin
 from rest_framework import views, viewsets, status, mixins
 from rest_framework.decorators import detail_route, list_route
-from rest_framework.permissions import IsAdminUser
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework_expandable import ExpandableViewMixin
 
-from . import filters, models, serializers
+from . import (availability, filters, manifests, models, purchases,
+               serializers, streams)
+from .authentication import QueryStringJSONWebTokenAuthentication
+from .renderers import EventStreamRenderer
 from .utils.signing import sign_state, unsign_state
 
 
@@ -28,6 +38,23 @@ def frontend_view(request):
 
 
 
+def get_check_in_response(checked_in_pks, conflicts):
+    return Response(
+        OrderedDict((
+            ('accepted', checked_in_pks),
+            ('conflicts', [
+                OrderedDict((
+                    ('ownership', ownership_pk),
+                    ('reason', reason),
+                    ('utilized', utilized),
+                ))
+                for ownership_pk, reason, utilized in conflicts
+            ]),
+        )),
+        status=(status.HTTP_207_MULTI_STATUS if conflicts
+                else status.HTTP_200_OK))
+
+
 class StripeConnectPermissionMixin(LoginRequiredMixin,
                                    PermissionRequiredMixin):
     permission_required = 'organizers.manage_organizer_stripe'
@@ -99,6 +126,85 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = models.Event.objects.filter(published=True)
     serializer_class = serializers.EventSerializer
 
+    def get_event_pk(self, pk):
+        # Normalized, since it names cache keys and stream channels
+        try:
+            return UUID(pk)
+        except ValueError:
+            raise Http404
+
+    def get_snapshot(self, event_pk):
+        # Served from the cache without loading the event, since clients poll
+        # this during releases.
+        snapshot = availability.get_snapshot(event_pk)
+        if snapshot is None:
+            raise Http404
+        return snapshot
+
+    @detail_route(('get',))
+    def availability(self, request, pk=None):
+        snapshot = self.get_snapshot(self.get_event_pk(pk))
+
+        etag = quote_etag(snapshot.etag)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(snapshot.data)
+        response['ETag'] = etag
+        # Clients must revalidate, which is cheap
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    @detail_route(('get',), permission_classes=(IsAdminUser,))
+    def manifest(self, request, pk=None):
+        """
+        The signed entry manifest of the event, only with what changed since
+        the version given as since, if any.
+        """
+        if not manifests.is_enabled():
+            raise Http404
+        event = self.get_object()
+        manifest, signature = manifests.build(
+            event.pk, since=request.query_params.get('since'))
+        return Response(OrderedDict((
+            ('manifest', manifest),
+            ('signature', signature),
+        )))
+
+    @detail_route(('post',), permission_classes=(IsAdminUser,))
+    def entries(self, request, pk=None):
+        """
+        Reconciles the entries door scanners recorded offline.
+        """
+        if not manifests.is_enabled():
+            raise Http404
+        event = self.get_object()
+        serializer = serializers.EntryBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        accepted, conflicts = manifests.reconcile(event.pk, [
+            (entry['ownership'], entry['utilized'])
+            for entry in serializer.validated_data['entries']
+        ])
+        return get_check_in_response(accepted, conflicts)
+
+    @detail_route(('get',), renderer_classes=(EventStreamRenderer,
+                                              JSONRenderer))
+    def stream(self, request, pk=None):
+        """
+        Streams the availability of the event as it changes.
+        """
+        event_pk = self.get_event_pk(pk)
+        snapshot = self.get_snapshot(event_pk)
+        subscription = streams.hub.subscribe(
+            [streams.get_event_channel(event_pk)])
+
+        initial_messages = []
+        # Reconnecting clients already have what they last received
+        if request.META.get('HTTP_LAST_EVENT_ID') != snapshot.etag:
+            initial_messages.append(streams.Message(
+                'availability', snapshot.data, id=snapshot.etag))
+        return streams.get_response(subscription, initial_messages)
+
 
 class OrganizationViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = models.Organization.objects.all()
@@ -121,15 +227,59 @@ class AccessCodeViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
 
 
 class PurchaseView(views.APIView):
+    permission_classes = (IsAuthenticated,)
+
     def post(self, request, *args, **kwargs):
         serializer = serializers.PurchaseSerializer(
             data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
+
+        if settings.PURCHASE_QUEUE:
+            job = purchases.enqueue(request)
+            job_serializer = serializers.PurchaseJobSerializer(
+                job, context={'request': request})
+            return Response(job_serializer.data,
+                            status=status.HTTP_202_ACCEPTED,
+                            headers={'Location': job_serializer.data['url']})
+
         serializer.save()
 
         return Response(serializer.data, status=status.HTTP_207_MULTI_STATUS)
 
 
+class PurchaseStreamView(views.APIView):
+    """
+    Streams the outcomes of the user's purchase jobs as they finish. Jobs
+    finishing before the stream is opened are not streamed, so look them up
+    once it is.
+    """
+    authentication_classes = (
+        (QueryStringJSONWebTokenAuthentication,) +
+        tuple(api_settings.DEFAULT_AUTHENTICATION_CLASSES))
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (EventStreamRenderer, JSONRenderer)
+
+    def get(self, request, *args, **kwargs):
+        subscription = streams.hub.subscribe(
+            [streams.get_user_channel(request.user.pk)])
+        return streams.get_response(subscription)
+
+
+class PurchaseJobView(views.APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(request.user.purchase_jobs.all(), pk=pk)
+
+        if job.is_finished:
+            # Exactly what the purchase would have responded with
+            return Response(job.result, status=job.result_status)
+
+        serializer = serializers.PurchaseJobSerializer(
+            job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
 class TicketViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = models.Ticket.objects.all()
     serializer_class = serializers.TicketSerializer
@@ -137,13 +287,17 @@ class TicketViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 class TicketTypeViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = models.TicketType.objects.published().filter(event__published=True)
+    queryset = (models.TicketType.objects
+                .published()
+                .filter(event__published=True)
+                .with_sold_count()
+                .prefetch_related('conflicts_with'))
     serializer_class = serializers.TicketTypeSerializer
 
 
 class TicketOwnershipViewSet(ExpandableViewMixin,
                              viewsets.ReadOnlyModelViewSet):
-    queryset = models.TicketOwnership.objects.all()
+    queryset = models.TicketOwnership.objects.select_related('ticket')
     serializer_class = serializers.TicketOwnershipSerializer
     filter_backends = (filters.TicketOwnershipFilter,)
     expandable_actions = ExpandableViewMixin.expandable_actions + ['search']
@@ -152,7 +306,18 @@ class TicketOwnershipViewSet(ExpandableViewMixin,
     def utilize(self, request, pk=None):
         instance = self.get_object()
         instance.utilize()
-        return self.retrieve(request=request, pk=pk)
+        return Response(self.get_serializer(instance).data)
+
+    @list_route(('post',), permission_classes=(IsAdminUser,),
+                url_path='utilize', url_name='utilize-many')
+    def utilize_many(self, request):
+        """
+        Checks in many scans at once, for gates sending them in batches.
+        """
+        serializer = serializers.CheckInSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return get_check_in_response(*models.TicketOwnership.objects.check_in(
+            serializer.validated_data['ownerships']))
 
     @detail_route(('post',), permission_classes=(IsAdminUser,))
     def unutilize(self, request, pk=None):
@@ -0,0 +1,67 @@
+import logging
+import select
+import signal
+from time import sleep
+
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+
+def notify(channel):
+    # Delivered to the listening workers on commit
+    with connection.cursor() as cursor:
+        cursor.execute('NOTIFY {}'.format(channel))
+
+
+class Worker(object):
+    """
+    Works until stopped. Idle workers sleep until notified on their channel,
+    falling back to polling.
+    """
+
+    channel = None
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self.running = False
+
+    def work(self):
+        """
+        Does a unit of work. Returns False if there was nothing to do.
+        """
+        raise NotImplementedError
+
+    def stop(self, *args):
+        self.running = False
+
+    def listen(self):
+        with connection.cursor() as cursor:
+            cursor.execute('LISTEN {}'.format(self.channel))
+
+    def wait(self):
+        pg_connection = connection.connection
+        if select.select([pg_connection], [], [], self.poll_interval)[0]:
+            pg_connection.poll()
+            del pg_connection.notifies[:]
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.running = True
+        listening = False
+
+        while self.running:
+            try:
+                if not listening:
+                    self.listen()
+                    listening = True
+
+                if not self.work():
+                    self.wait()
+            except OperationalError:
+                logger.warning('Lost the database connection, reconnecting',
+                               exc_info=True)
+                connection.close()
+                listening = False
+                sleep(self.poll_interval)
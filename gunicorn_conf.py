@@ -8,6 +8,8 @@ bind = ['0.0.0.0:{}'.format(env.int('GUNICORN_PORT', 80))]
 
 reload = env.bool('GUNICORN_RELOAD', False)
 workers = env.int('GUNICORN_WORKERS', cpu_count()*2+1)
+worker_class = env.str('GUNICORN_WORKER_CLASS', 'sync')
+threads = env.int('GUNICORN_THREADS', 1)
 
 loglevel = env.str('GUNICORN_LOG_LEVEL', 'info')
 errorlog = '-'  # stderr
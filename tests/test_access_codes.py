@@ -0,0 +1,55 @@
+import csv
+import io
+
+from django.contrib.admin import helpers
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from bitket import factories, models
+
+
+class GenerateAccessCodesTests(TestCase):
+    def setUp(self):
+        self.ticket_type = factories.TicketTypeFactory()
+
+    def assertExported(self, content, count):
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), count)
+        self.assertEqual(models.AccessCode.objects.filter(
+            ticket_type=self.ticket_type).count(), count)
+
+        for row in rows:
+            access_code = models.AccessCode.objects.get(token=row['token'])
+            self.assertEqual(access_code.ticket_type, self.ticket_type)
+            self.assertEqual(access_code.token, row['token'])
+            self.assertEqual(row['ticket_type'], str(self.ticket_type.pk))
+            self.assertEqual(row['link'], 'https://{}/{}/?accessCode={}'.format(
+                Site.objects.get_current().domain,
+                self.ticket_type.event.slug, row['token']))
+
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command('generate_access_codes', str(self.ticket_type.pk), '25',
+                     processes=2, stdout=stdout, stderr=io.StringIO())
+
+        self.assertExported(stdout.getvalue(), 25)
+
+    def test_admin_action(self):
+        user = factories.UserFactory(is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        url = reverse('admin:bitket_tickettype_changelist')
+        data = {
+            'action': 'generate_access_codes',
+            helpers.ACTION_CHECKBOX_NAME: [str(self.ticket_type.pk)],
+        }
+
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(models.AccessCode.objects.exists())
+
+        response = self.client.post(url, dict(data, count=10))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertExported(
+            b''.join(response.streaming_content).decode(), 10)
@@ -0,0 +1,128 @@
+from django.test import TestCase
+
+from bitket import admission, factories, models
+
+
+class AdmissionTests(TestCase):
+    def create_pending_ticket(self, user, ticket_type, **kwargs):
+        ticket = models.Ticket.objects.create(
+            ticket_type=ticket_type, pending=True, **kwargs)
+        models.TicketOwnership.objects.create(ticket=ticket, user=user)
+        return ticket
+
+    def test_admit_max_total_quantity(self):
+        ticket_type = factories.TicketTypeFactory(
+            is_generally_available=True,
+            max_total_quantity=2,
+            max_personal_quantity=None)
+        users = factories.UserFactory.create_batch(4)
+        sold_ticket = self.create_pending_ticket(users[0], ticket_type)
+        sold_ticket.pending = False
+        sold_ticket.save()
+        tickets = [self.create_pending_ticket(u, ticket_type)
+                   for u in users[1:]]
+
+        with self.assertNumQueries(3):
+            outcomes = admission.Admission(ticket_type).admit(
+                [t.pk for t in tickets])
+
+        self.assertEqual(list(outcomes.keys()), [t.pk for t in tickets])
+        self.assertEqual(list(outcomes.values()), [
+            admission.ADMITTED,
+            admission.BAD_QUEUE_POSITION,
+            admission.BAD_QUEUE_POSITION,
+        ])
+
+        models.Ticket.objects.filter(pk=tickets[0].pk).update(pending=False)
+        ticket_type.inventory.commit([tickets[0].pk])
+        outcomes = admission.Admission(ticket_type).admit([tickets[1].pk])
+        self.assertEqual(
+            outcomes[tickets[1].pk],
+            admission.MAX_TOTAL_QUANTITY_EXCEEDED)
+
+    def test_admit_in_queue_order(self):
+        ticket_type = factories.TicketTypeFactory(
+            is_generally_available=True,
+            max_total_quantity=1,
+            max_personal_quantity=None)
+        first, second = [
+            self.create_pending_ticket(u, ticket_type)
+            for u in factories.UserFactory.create_batch(2)]
+
+        # The later ticket's pass gets to the inventory first
+        outcomes = admission.Admission(ticket_type).admit([second.pk])
+        self.assertEqual(outcomes[second.pk], admission.BAD_QUEUE_POSITION)
+        outcomes = admission.Admission(ticket_type).admit([first.pk])
+        self.assertEqual(outcomes[first.pk], admission.ADMITTED)
+
+    def test_settle_rejected_tickets_release_positions(self):
+        ticket_type = factories.TicketTypeFactory(
+            is_generally_available=True,
+            max_total_quantity=2,
+            max_personal_quantity=1)
+        greedy_user, user = factories.UserFactory.create_batch(2)
+        greedy_tickets = [self.create_pending_ticket(greedy_user, ticket_type)
+                          for _ in range(3)]
+        ticket = self.create_pending_ticket(user, ticket_type)
+
+        outcomes = admission.Admission(ticket_type).settle()
+
+        self.assertEqual(outcomes[greedy_tickets[0].pk], admission.ADMITTED)
+        self.assertEqual(
+            outcomes[greedy_tickets[1].pk],
+            admission.MAX_PERSONAL_QUANTITY_EXCEEDED)
+        self.assertEqual(
+            outcomes[greedy_tickets[2].pk],
+            admission.MAX_PERSONAL_QUANTITY_EXCEEDED)
+        self.assertEqual(outcomes[ticket.pk], admission.ADMITTED)
+
+    def test_settle_access_codes(self):
+        ticket_type = factories.TicketTypeFactory(
+            is_generally_available=False,
+            max_personal_quantity=None)
+        access_code = models.AccessCode.objects.create(ticket_type=ticket_type)
+        users = factories.UserFactory.create_batch(3)
+        first = self.create_pending_ticket(
+            users[0], ticket_type, access_code=access_code)
+        second = self.create_pending_ticket(
+            users[1], ticket_type, access_code=access_code)
+        without = self.create_pending_ticket(users[2], ticket_type)
+
+        outcomes = admission.Admission(ticket_type).settle()
+
+        self.assertEqual(outcomes[first.pk], admission.ADMITTED)
+        self.assertEqual(outcomes[second.pk], admission.ACCESS_CODE_UTILIZED)
+        self.assertEqual(
+            outcomes[without.pk], admission.TICKET_TYPE_UNAVAILABLE)
+
+    def test_settle_conflicting_ticket_types(self):
+        event = factories.EventFactory()
+        ticket_type = factories.TicketTypeFactory(
+            event=event, is_generally_available=True)
+        other_ticket_type = factories.TicketTypeFactory(
+            event=event, is_generally_available=True)
+        ticket_type.conflicts_with.add(other_ticket_type)
+        user = factories.UserFactory()
+        self.create_pending_ticket(user, other_ticket_type)
+        ticket = self.create_pending_ticket(user, ticket_type)
+
+        outcomes = admission.Admission(ticket_type).settle()
+
+        self.assertEqual(
+            outcomes[ticket.pk], admission.TICKET_TYPE_CONFLICTING)
+
+    def test_queue_sequence(self):
+        ticket_type = factories.TicketTypeFactory()
+        tickets = [
+            models.Ticket.objects.create(ticket_type=ticket_type, pending=True)
+            for _ in range(3)]
+        tickets[0].pending = False
+        tickets[0].save()
+
+        self.assertEqual(
+            list(ticket_type.tickets.order_by('seq')),
+            tickets)
+        self.assertEqual(
+            list(ticket_type.tickets.before_in_queue(tickets[2])
+                 .order_by('seq')),
+            tickets[:2])
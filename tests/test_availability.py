@@ -0,0 +1,49 @@
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from bitket import factories
+
+
+class EventAvailabilityTests(APITestCase):
+    def setUp(self):
+        self.event = factories.EventFactory(published=True)
+        self.ticket_type = factories.TicketTypeFactory(
+            event=self.event, is_published=True, max_total_quantity=1)
+        self.url = reverse('event-availability', kwargs={'pk': self.event.pk})
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['ticket_types'], [{
+            'id': str(self.ticket_type.pk),
+            'general': False,
+            'total_quantity': True,
+        }])
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def test_sold_out(self):
+        etag = self.client.get(self.url)['ETag']
+        ticket = factories.TicketFactory(ticket_type=self.ticket_type,
+                                         pending=True)
+        ticket.pending = False
+        ticket.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertFalse(response.data['ticket_types'][0]['total_quantity'])
+
+    def test_unpublished_event(self):
+        self.event.published = False
+        self.event.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,29 @@
+from django.test import TestCase
+
+from bitket import factories, models
+
+
+class ConditionTests(TestCase):
+    def setUp(self):
+        self.student_union = factories.StudentUnionFactory()
+        self.condition = factories.StudentUnionMemberConditionFactory(
+            student_union=self.student_union)
+        self.other_condition = factories.StudentUnionMemberConditionFactory()
+        self.member = factories.UserFactory(student_union=self.student_union)
+        self.user = factories.UserFactory()
+
+    def test_met(self):
+        with self.assertNumQueries(1):
+            met = list(models.Condition.objects.met(self.member))
+
+        self.assertEqual([c.pk for c in met], [self.condition.pk])
+
+        self.assertFalse(models.Condition.objects.met(self.user).exists())
+
+    def test_meeting(self):
+        condition = models.Condition.objects.get(pk=self.condition.pk)
+
+        self.assertEqual(
+            list(models.User.objects.meeting(condition)), [self.member])
+        self.assertFalse(
+            models.User.objects.meeting(self.other_condition).exists())
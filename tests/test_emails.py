@@ -0,0 +1,54 @@
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
+
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from bitket import emails, factories, models
+
+
+@override_settings(EMAIL_OUTBOX_RATE_LIMIT=1000, EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.ticket_ownerships = [
+            models.TicketOwnership.objects.create(
+                ticket=factories.TicketFactory(),
+                user=factories.UserFactory())
+            for _ in range(2)]
+
+    def test_deliver(self):
+        emails.queue_confirmations(self.ticket_ownerships)
+
+        batch = emails.claim()
+        self.assertEqual(len(batch), 2)
+        # Leased emails are not due
+        self.assertEqual(emails.claim(), [])
+
+        self.assertEqual(emails.deliver(batch), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            {m.to[0] for m in mail.outbox},
+            {o.user.pretty_email for o in self.ticket_ownerships})
+        self.assertFalse(models.OutgoingEmail.objects.unsent().exists())
+
+    def test_deliver_retry(self):
+        emails.queue_confirmations(self.ticket_ownerships[:1])
+        error = SMTPRecipientsRefused({})
+
+        with mock.patch('django.core.mail.EmailMessage.send',
+                        side_effect=error):
+            self.assertEqual(emails.deliver(emails.claim()), 0)
+
+            email = models.OutgoingEmail.objects.get()
+            self.assertEqual(email.attempts, 1)
+            self.assertIsNotNone(email.next_attempt)
+            self.assertEqual(email.last_error, repr(error))
+
+            models.OutgoingEmail.objects.update(next_attempt=email.created)
+            self.assertEqual(emails.deliver(emails.claim()), 0)
+
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 2)
+        self.assertIsNone(email.next_attempt)
+        self.assertIsNone(email.sent)
+        self.assertEqual(emails.claim(), [])
@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+import sesam
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from bitket import factories, models, students
+
+ROWS = [
+    ['User', 'Name', 'Ticket', 'Food', 'Error'],
+    ['abcde123', '', 'Banquet', 'Vegan', ''],
+    ['guest@example.com', 'A Guest', 'Party', '', ''],
+    ['someone@example.com', 'Someone', 'Party', 'Vegan', 'Yes'],
+    ['guest@example.com', 'A Guest', 'Banquet', 'Meat', ''],
+]
+
+
+class ImportPrepaidTests(TestCase):
+    def setUp(self):
+        self.event = factories.EventFactory()
+        self.banquet = factories.TicketTypeFactory(
+            event=self.event, name='Banquet', price=Decimal('300.00'))
+        self.party = factories.TicketTypeFactory(
+            event=self.event, name='Party', price=Decimal('100.00'))
+        variation = models.Variation.objects.create(
+            ticket_type=self.banquet, name='Food')
+        self.vegan = models.VariationChoice.objects.create(
+            variation=variation, name='Vegan', delta=Decimal('10.00'))
+        self.student_union = factories.StudentUnionFactory()
+
+        self.student = mock.Mock(
+            full_name='Abc Def', email='ABCDE123@student.liu.se',
+            main_union=self.student_union.name)
+        get_student = mock.patch('bitket.students.get_student',
+                                 return_value=self.student)
+        self.get_student = get_student.start()
+        self.addCleanup(get_student.stop)
+
+        self.mapping = self.write('mapping.json', json.dumps({
+            'event': str(self.event.pk),
+            'user': 'User',
+            'name': 'Name',
+            'skip': ['Error'],
+            'ticket_type': {
+                'column': 'Ticket',
+                'values': {'Banquet': 'Banquet', 'Party': 'Party'},
+            },
+            'variation_choices': {
+                'Food': {'': None, 'Vegan': 'Vegan'},
+            },
+        }))
+
+    def write(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        filename = os.path.join(directory.name, name)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return filename
+
+    def import_rows(self, rows, mapping=None):
+        filename = self.write('prepaid.tsv', '\n'.join(
+            '\t'.join(row) for row in rows))
+        with open(os.devnull, 'w') as devnull:
+            # Required options are only taken as arguments
+            call_command('import_prepaid', mapping or self.mapping, filename,
+                         '--key=prepaid', batch_size=2, stdout=devnull,
+                         stderr=devnull)
+
+    def test_import(self):
+        with self.assertRaises(CommandError):
+            self.import_rows(ROWS)
+
+        self.get_student.assert_called_once_with(liu_id='abcde123')
+        student = models.User.objects.get(email='abcde123@student.liu.se')
+        self.assertEqual(student.name, 'Abc Def')
+        self.assertEqual(student.student_union, self.student_union)
+        guest = models.User.objects.get(email='guest@example.com')
+        self.assertFalse(guest.has_usable_password())
+
+        ownership = models.TicketOwnership.objects.get(user=student)
+        self.assertEqual(ownership.price, Decimal('310.00'))
+        self.assertEqual(list(ownership.ticket.variation_choices.all()),
+                         [self.vegan])
+        self.assertEqual(ownership.ticket.current_ownership, ownership)
+        self.assertFalse(ownership.ticket.pending)
+        self.assertEqual(ownership.transactions.get().amount,
+                         Decimal('310.00'))
+
+        # The meat eater fails
+        self.assertEqual(models.Ticket.objects.filter(
+            ticket_type__event=self.event).count(), 2)
+        self.assertEqual(models.OutgoingEmail.objects.filter(
+            ticket_ownership__ticket__ticket_type__event=self.event).count(),
+            2)
+
+        # Imported rows are skipped once the failed one is fixed
+        rows = [list(row) for row in ROWS]
+        rows[4][3] = ''
+        self.import_rows(rows)
+        self.assertEqual(models.Ticket.objects.filter(
+            ticket_type__event=self.event).count(), 3)
+        self.assertEqual(guest.ticket_ownerships.count(), 2)
+
+    def test_import_other_event(self):
+        self.import_rows(ROWS[:3])
+
+        event = factories.EventFactory()
+        factories.TicketTypeFactory(event=event, name='Party')
+        mapping = self.write('mapping.json', json.dumps({
+            'event': str(event.pk),
+            'user': 'User',
+            'ticket_type': {
+                'column': 'Ticket',
+                'values': {'Party': 'Party'},
+            },
+        }))
+        # Same key, but nothing of the other event is skipped
+        self.import_rows(ROWS[:1] + ROWS[2:3], mapping=mapping)
+
+        self.assertEqual(models.Ticket.objects.filter(
+            ticket_type__event=event).count(), 1)
+
+    def test_sesam_unavailable(self):
+        self.get_student.side_effect = [
+            students.StudentServiceUnavailable(), self.student]
+        with self.assertRaises(CommandError):
+            self.import_rows(ROWS[:3] + ROWS[1:2])
+
+        # Asked again in the next batch
+        self.assertEqual(self.get_student.call_count, 2)
+        self.assertTrue(models.TicketOwnership.objects.filter(
+            user__email='abcde123@student.liu.se').exists())
+
+    def test_student_not_found(self):
+        self.get_student.side_effect = sesam.StudentNotFound()
+        with self.assertRaises(CommandError):
+            self.import_rows(ROWS[:2])
+        self.assertFalse(models.Ticket.objects.filter(
+            ticket_type__event=self.event).exists())
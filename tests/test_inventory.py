@@ -0,0 +1,65 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from bitket import factories, models
+
+
+class InventoryTests(TestCase):
+    def test_reserve_commit_release(self):
+        ticket_type = factories.TicketTypeFactory(max_total_quantity=3)
+        models.Ticket.objects.create(ticket_type=ticket_type, pending=False)
+        tickets = [
+            models.Ticket.objects.create(ticket_type=ticket_type, pending=True)
+            for _ in range(3)]
+        ticket_ids = [str(t.pk) for t in tickets]
+        inventory = ticket_type.inventory
+
+        self.assertEqual(inventory.reserve(ticket_ids), set(ticket_ids[:2]))
+        self.assertEqual(inventory.get_remaining_count(), 0)
+
+        inventory.release(ticket_ids[1:2])
+        self.assertEqual(inventory.reserve(ticket_ids[2:]), {ticket_ids[2]})
+
+        models.Ticket.objects.filter(pk=ticket_ids[0]).update(pending=False)
+        self.assertEqual(inventory.commit(ticket_ids[:1]), 1)
+        self.assertEqual(inventory.get_sold_count(), 2)
+        self.assertEqual(inventory.get_held_count(), 1)
+
+    def test_reconcile(self):
+        ticket_type = factories.TicketTypeFactory(max_total_quantity=3)
+        ticket = models.Ticket.objects.create(
+            ticket_type=ticket_type, pending=True)
+        inventory = ticket_type.inventory
+        inventory.reserve([ticket.pk])
+
+        ticket.delete()
+        models.Ticket.objects.create(ticket_type=ticket_type, pending=False)
+        inventory.reconcile()
+
+        self.assertEqual(inventory.get_sold_count(), 1)
+        self.assertEqual(inventory.get_held_count(), 0)
+        self.assertEqual(inventory.get_remaining_count(), 2)
+
+    def test_reconcile_during_commit(self):
+        ticket_type = factories.TicketTypeFactory(max_total_quantity=3)
+        ticket = models.Ticket.objects.create(
+            ticket_type=ticket_type, pending=True)
+        inventory = ticket_type.inventory
+        inventory.reserve([ticket.pk])
+        count_sold = inventory.count_sold
+
+        def commit_meanwhile():
+            # The purchase commits after the ticket table is counted
+            count = count_sold()
+            if not inventory.get_sold_count():
+                models.Ticket.objects.filter(pk=ticket.pk).update(
+                    pending=False)
+                inventory.commit([ticket.pk])
+            return count
+
+        with mock.patch.object(inventory, 'count_sold', commit_meanwhile):
+            inventory.reconcile()
+
+        self.assertEqual(inventory.get_sold_count(), 1)
+        self.assertEqual(inventory.get_held_count(), 0)
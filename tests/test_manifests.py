@@ -0,0 +1,139 @@
+import json
+from base64 import b64decode
+from datetime import timedelta
+from unittest import mock
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from bitket import factories, manifests, models
+
+
+PRIVATE_KEY = ec.generate_private_key(ec.SECP256R1(), default_backend())
+PRIVATE_KEY_PEM = PRIVATE_KEY.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.PKCS8,
+    serialization.NoEncryption()).decode()
+
+
+class ManifestTestMixin(object):
+    def setUp(self):
+        # Changes are recorded once committed, which tests never are
+        on_commit = mock.patch('bitket.manifests.transaction.on_commit',
+                               lambda func: func())
+        on_commit.start()
+        self.addCleanup(on_commit.stop)
+
+        self.event = factories.EventFactory()
+        self.ticket_type = factories.TicketTypeFactory(event=self.event)
+
+    def create_ownership(self):
+        ticket = factories.TicketFactory(ticket_type=self.ticket_type,
+                                         pending=False)
+        return models.TicketOwnership.objects.create(
+            ticket=ticket, user=factories.UserFactory())
+
+
+@override_settings(ENTRY_MANIFEST_KEY=PRIVATE_KEY_PEM)
+class ManifestTests(ManifestTestMixin, TestCase):
+    def test_build(self):
+        ownership = self.create_ownership()
+        manifest, signature = manifests.build(self.event.pk)
+
+        # Raises if the signature is wrong
+        PRIVATE_KEY.public_key().verify(
+            b64decode(signature), manifest.encode(),
+            ec.ECDSA(hashes.SHA256()))
+        manifest = json.loads(manifest)
+        self.assertIsNone(manifest['since'])
+        self.assertEqual(manifest['entries'], [
+            [str(ownership.ticket_id), str(ownership.pk), ownership.code,
+             False]])
+
+    def test_diff(self):
+        sold = self.create_ownership()
+        version = json.loads(manifests.build(self.event.pk)[0])['version']
+
+        bought = models.TicketOwnership.objects.create(
+            ticket=sold.ticket, user=factories.UserFactory())
+        other = self.create_ownership()
+        manifest = json.loads(manifests.build(self.event.pk, since=version)[0])
+
+        self.assertEqual(manifest['since'], version)
+        self.assertEqual(sorted(manifest['entries']), sorted([
+            [str(sold.ticket_id), str(bought.pk), bought.code, False],
+            [str(other.ticket_id), str(other.pk), other.code, False],
+        ]))
+
+        manifest = json.loads(manifests.build(
+            self.event.pk, since='stale:{}'.format(version))[0])
+        self.assertIsNone(manifest['since'])
+        self.assertEqual(len(manifest['entries']), 2)
+
+    @override_settings(ENTRY_MANIFEST_CHANGE_LOG_SIZE=1)
+    def test_diff_trimmed(self):
+        self.create_ownership()
+        version = json.loads(manifests.build(self.event.pk)[0])['version']
+
+        self.create_ownership()
+        self.create_ownership()
+        manifest = json.loads(manifests.build(self.event.pk, since=version)[0])
+
+        self.assertIsNone(manifest['since'])
+        self.assertEqual(len(manifest['entries']), 3)
+
+    def test_reconcile(self):
+        ownership = self.create_ownership()
+        sold = self.create_ownership()
+        models.TicketOwnership.objects.create(
+            ticket=sold.ticket, user=factories.UserFactory())
+        utilized = now()
+
+        accepted, conflicts = manifests.reconcile(self.event.pk, [
+            (ownership.pk, utilized + timedelta(minutes=1)),
+            (ownership.pk, utilized),
+            (sold.pk, utilized),
+        ])
+
+        self.assertEqual(accepted, [ownership.pk])
+        self.assertEqual(conflicts, [
+            (sold.pk, models.TicketOwnership.CHECK_IN_NOT_CURRENT, None),
+            (ownership.pk, models.TicketOwnership.CHECK_IN_UTILIZED, utilized),
+        ])
+        ownership.ticket.refresh_from_db()
+        self.assertEqual(ownership.ticket.utilized, utilized)
+
+
+@override_settings(ENTRY_MANIFEST_KEY=PRIVATE_KEY_PEM)
+class EntriesViewTests(ManifestTestMixin, APITestCase):
+    def test_upload(self):
+        ownership = self.create_ownership()
+        ownership.ticket.utilized = now()
+        ownership.ticket.save()
+        self.client.force_authenticate(factories.UserFactory(is_staff=True))
+
+        response = self.client.post(
+            reverse('event-entries', kwargs={'pk': self.event.pk}),
+            {'entries': [{'ownership': ownership.pk,
+                          'utilized': now().isoformat()}]},
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['accepted'], [])
+        self.assertEqual(response.data['conflicts'][0]['reason'],
+                         models.TicketOwnership.CHECK_IN_UTILIZED)
+
+    @override_settings(ENTRY_MANIFEST_KEY='')
+    def test_disabled(self):
+        self.client.force_authenticate(factories.UserFactory(is_staff=True))
+
+        response = self.client.get(
+            reverse('event-manifest', kwargs={'pk': self.event.pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
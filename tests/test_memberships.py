@@ -0,0 +1,46 @@
+from django.test import TestCase
+
+from bitket import factories, memberships, models
+
+
+class MembershipCacheTests(TestCase):
+    def setUp(self):
+        self.student_union = factories.StudentUnionFactory()
+        self.condition = factories.StudentUnionMemberConditionFactory(
+            student_union=self.student_union)
+        self.member = factories.UserFactory(student_union=self.student_union)
+        self.user = factories.UserFactory()
+
+    def test_get_many(self):
+        users = [self.member, self.user]
+        expected = {self.member.pk: {self.condition.pk}, self.user.pk: set()}
+
+        self.assertEqual(memberships.get_many(users), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(memberships.get_many(users), expected)
+
+    def test_invalidate_user(self):
+        self.assertEqual(memberships.get(self.user), set())
+
+        user = models.User.objects.get(pk=self.user.pk)
+        user.student_union = self.student_union
+        user.save()
+
+        self.assertEqual(memberships.get(user), {self.condition.pk})
+
+        # Saves not touching what conditions depend on keep the cache
+        user.name = 'Someone else'
+        user.save()
+        with self.assertNumQueries(0):
+            memberships.get(user)
+
+    def test_invalidate_conditions(self):
+        self.assertEqual(memberships.get(self.member), {self.condition.pk})
+
+        other_condition = factories.StudentUnionMemberConditionFactory(
+            student_union=self.student_union)
+        self.assertEqual(memberships.get(self.member),
+                         {self.condition.pk, other_condition.pk})
+
+        other_condition.delete()
+        self.assertEqual(memberships.get(self.member), {self.condition.pk})
@@ -0,0 +1,103 @@
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from bitket import exceptions, factories, models, payments
+
+
+@override_settings(PAYMENT_FAKE_LATENCY=0, PAYMENT_FAKE_DECLINE_RATE=0)
+class FakeProviderTests(TestCase):
+    def setUp(self):
+        self.provider = payments.FakeProvider()
+        self.organization = factories.OrganizationFactory()
+
+    def test_charge_idempotency(self):
+        charge_id = self.provider.charge(
+            self.organization, 100, 'tok_visa', idempotency_key='a')
+
+        self.assertEqual(
+            self.provider.charge(
+                self.organization, 100, 'tok_visa', idempotency_key='a'),
+            charge_id)
+        self.assertNotEqual(
+            self.provider.charge(
+                self.organization, 100, 'tok_visa', idempotency_key='b'),
+            charge_id)
+
+    def test_charge_declined(self):
+        with self.assertRaises(exceptions.PaymentFailed):
+            self.provider.charge(
+                self.organization, 100, 'tok_chargeDeclined',
+                idempotency_key='a')
+
+        with override_settings(PAYMENT_FAKE_DECLINE_RATE=1):
+            with self.assertRaises(exceptions.PaymentFailed):
+                self.provider.charge(
+                    self.organization, 100, 'tok_visa', idempotency_key='b')
+
+    def test_idempotency_key(self):
+        ownerships = [models.TicketOwnership(), models.TicketOwnership()]
+
+        self.assertEqual(
+            payments.get_idempotency_key(ownerships),
+            payments.get_idempotency_key(reversed(ownerships)))
+        self.assertNotEqual(
+            payments.get_idempotency_key(ownerships),
+            payments.get_idempotency_key(ownerships[:1]))
+
+
+@override_settings(PAYMENT_PROVIDER='bitket.payments.FakeProvider',
+                   PAYMENT_FAKE_LATENCY=0,
+                   PAYMENT_FAKE_DECLINE_RATE=0)
+class PurchaseTests(APITestCase):
+    purchase_url = reverse('purchase-list')
+
+    def setUp(self):
+        self.user = factories.UserFactory()
+        self.ticket_type = factories.TicketTypeFactory(
+            is_generally_available=True)
+        self.client.force_authenticate(self.user)
+
+    def get_purchase_data(self, payload):
+        return {
+            'access_codes': [],
+            'tickets': [{
+                'ticket_type': reverse('tickettype-detail',
+                                       kwargs={'pk': self.ticket_type.pk}),
+                'variation_choices': []
+            }],
+            'payment': {
+                'type': 'stripe',
+                'payload': payload,
+                'amount': '1000.00'
+            },
+            'user': {
+                'nin': '9011290799'
+            }
+        }
+
+    def test_purchase(self):
+        response = self.client.post(
+            self.purchase_url, data=self.get_purchase_data('tok_visa'),
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        ticket = models.Ticket.objects.get()
+        self.assertFalse(ticket.pending)
+        ownership = ticket.ownerships.get()
+        purchase_transaction = ownership.transactions.get()
+        self.assertEqual(purchase_transaction.amount, ownership.price)
+        self.assertTrue(purchase_transaction.stripe_charge.startswith('ch_'))
+        self.assertTrue(ownership.outgoing_emails.unsent().exists())
+
+    def test_purchase_declined(self):
+        response = self.client.post(
+            self.purchase_url,
+            data=self.get_purchase_data('tok_chargeDeclined'),
+            format='json')
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_402_PAYMENT_REQUIRED)
+        self.assertFalse(models.Ticket.objects.exists())
+        self.assertEqual(self.ticket_type.inventory.get_held_count(), 0)
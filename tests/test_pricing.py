@@ -0,0 +1,129 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from bitket import factories, models, pricing
+
+
+class PriceSheetTests(TestCase):
+    def setUp(self):
+        self.ticket_type = factories.TicketTypeFactory(price=Decimal('100.00'))
+        self.condition = factories.StudentUnionMemberConditionFactory()
+        self.modifier = factories.ModifierFactory(
+            ticket_type=self.ticket_type, condition=self.condition,
+            delta=Decimal('-30.00'))
+        variation = models.Variation.objects.create(
+            ticket_type=self.ticket_type, name='Size')
+        self.choice = models.VariationChoice.objects.create(
+            variation=variation, name='Large', delta=Decimal('20.00'))
+
+    def test_get_price(self):
+        sheet = pricing.get_sheet(self.ticket_type)
+
+        self.assertEqual(sheet.get_price(set()), Decimal('100.00'))
+        self.assertEqual(sheet.get_price({self.condition.pk}),
+                         Decimal('70.00'))
+        self.assertEqual(
+            sheet.get_price({self.condition.pk}, [self.choice.pk]),
+            Decimal('90.00'))
+        self.assertEqual(
+            [m.id for m in sheet.get_modifiers({self.condition.pk})],
+            [self.modifier.pk])
+
+        with self.assertNumQueries(0):
+            pricing.get_sheet(self.ticket_type)
+
+    def test_invalidate(self):
+        pricing.get_sheet(self.ticket_type)
+
+        self.modifier.delta = Decimal('-50.00')
+        self.modifier.save()
+        self.assertEqual(
+            pricing.get_sheet(self.ticket_type).get_price(
+                {self.condition.pk}),
+            Decimal('50.00'))
+
+        self.choice.delta = Decimal('10.00')
+        self.choice.save()
+        self.ticket_type.price = Decimal('200.00')
+        self.ticket_type.save()
+        self.assertEqual(
+            pricing.get_sheet(self.ticket_type).get_price(
+                set(), [self.choice.pk]),
+            Decimal('210.00'))
+
+        self.modifier.delete()
+        self.assertEqual(
+            pricing.get_sheet(self.ticket_type).get_modifiers(
+                {self.condition.pk}),
+            [])
+
+
+class TicketTypeModifiersTests(APITestCase):
+    def test_list_modifiers(self):
+        student_union = factories.StudentUnionFactory()
+        condition = factories.StudentUnionMemberConditionFactory(
+            student_union=student_union)
+        ticket_type = factories.TicketTypeFactory(is_published=True)
+        factories.ModifierFactory(ticket_type=ticket_type,
+                                  condition=condition,
+                                  delta=Decimal('-30.00'))
+        self.client.force_authenticate(
+            factories.UserFactory(student_union=student_union))
+
+        response = self.client.get(
+            reverse('tickettype-detail', kwargs={'pk': ticket_type.pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['modifiers'], [
+            {'condition': '{}'.format(condition), 'delta': '-30.00'}])
+
+
+class TicketTypeListTests(APITestCase):
+    def setUp(self):
+        self.student_union = factories.StudentUnionFactory()
+        self.condition = factories.StudentUnionMemberConditionFactory(
+            student_union=self.student_union)
+        self.event = factories.EventFactory()
+        self.client.force_authenticate(
+            factories.UserFactory(student_union=self.student_union))
+
+    def add_ticket_types(self, count):
+        for _ in range(count):
+            ticket_type = factories.TicketTypeFactory(
+                event=self.event, is_published=True, max_total_quantity=1)
+            ticket_type.conflicts_with.add(
+                factories.TicketTypeFactory(event=self.event,
+                                            is_published=False))
+            factories.ModifierFactory(ticket_type=ticket_type,
+                                      condition=self.condition,
+                                      delta=Decimal('-30.00'))
+            factories.TicketFactory(ticket_type=ticket_type, pending=False)
+
+    def count_list_queries(self):
+        # Warms the price sheets and met conditions
+        self.client.get(reverse('tickettype-list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('tickettype-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_constant_queries(self):
+        self.add_ticket_types(2)
+        _, few_queries = self.count_list_queries()
+
+        self.add_ticket_types(8)
+        response, many_queries = self.count_list_queries()
+
+        self.assertEqual(many_queries, few_queries)
+        self.assertEqual(len(response.data), 10)
+        for ticket_type in response.data:
+            self.assertFalse(ticket_type['availability']['total_quantity'])
+            self.assertEqual(ticket_type['modifiers'], [
+                {'condition': '{}'.format(self.condition),
+                 'delta': '-30.00'}])
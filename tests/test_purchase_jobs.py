@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from bitket import factories, models, purchases
+
+
+@override_settings(PURCHASE_QUEUE=True)
+class PurchaseJobTests(APITestCase):
+    purchase_url = reverse('purchase-list')
+
+    def setUp(self):
+        self.user = factories.UserFactory()
+        self.ticket_type = factories.TicketTypeFactory(
+            is_generally_available=True)
+        self.client.force_authenticate(self.user)
+
+    def get_purchase_data(self, **kwargs):
+        data = {
+            'access_codes': [],
+            'tickets': [{
+                'ticket_type': reverse('tickettype-detail',
+                                       kwargs={'pk': self.ticket_type.pk}),
+                'variation_choices': []
+            }],
+            'payment': {
+                'type': 'stripe',
+                'payload': 'tok_visa',
+                'amount': '1000.00'
+            },
+            'user': {
+                'nin': '9011290799'
+            }
+        }
+        data.update(kwargs)
+        return data
+
+    def test_enqueue(self):
+        response = self.client.post(
+            self.purchase_url, data=self.get_purchase_data(), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], models.PurchaseJob.STATUS_QUEUED)
+        self.assertEqual(response['Location'], response.data['url'])
+        self.assertFalse(models.Ticket.objects.exists())
+
+        response = self.client.get(response.data['url'])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_enqueue_invalid(self):
+        response = self.client.post(
+            self.purchase_url, data=self.get_purchase_data(tickets=[]),
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(models.PurchaseJob.objects.exists())
+
+    def test_process_failed_job(self):
+        job = self.client.post(
+            self.purchase_url, data=self.get_purchase_data(), format='json'
+        ).data
+        # Makes the purchase invalid by the time the job gets processed
+        self.ticket_type.is_published = False
+        self.ticket_type.save()
+
+        claimed_job = purchases.claim()
+        self.assertEqual(str(claimed_job.pk), job['id'])
+        self.assertEqual(claimed_job.status, models.PurchaseJob.STATUS_PROCESSING)
+        self.assertIsNone(purchases.claim())
+
+        purchases.process(claimed_job)
+        self.assertEqual(claimed_job.status, models.PurchaseJob.STATUS_FAILED)
+
+        response = self.client.get(job['url'])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tickets', response.data)
+
+    def test_job_of_other_user(self):
+        job = self.client.post(
+            self.purchase_url, data=self.get_purchase_data(), format='json'
+        ).data
+
+        self.client.force_authenticate(factories.UserFactory())
+        response = self.client.get(job['url'])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_claim_abandoned_job(self):
+        self.client.post(
+            self.purchase_url, data=self.get_purchase_data(), format='json')
+        job = purchases.claim()
+
+        # The worker died, the job is claimed again once its lease runs out
+        self.assertIsNone(purchases.claim())
+        models.PurchaseJob.objects.filter(pk=job.pk).update(
+            started=job.started - timedelta(
+                seconds=settings.PURCHASE_JOB_LEASE_TIMEOUT + 1))
+        self.assertEqual(purchases.claim(), job)
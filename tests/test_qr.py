@@ -0,0 +1,39 @@
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from bitket import factories, models, qr
+
+
+class QRImageCacheTests(TestCase):
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+        self.addCleanup(rmtree, self.cache_dir)
+        self.ticket_ownership = models.TicketOwnership.objects.create(
+            ticket=factories.TicketFactory(),
+            user=factories.UserFactory())
+
+    def test_get(self):
+        payload = self.ticket_ownership.qr_payload
+        digest = qr.image_cache.get_digest(payload)
+
+        with override_settings(QR_CACHE_DIR=self.cache_dir), \
+                mock.patch('bitket.qr.render', wraps=qr.render) as render:
+            image = self.ticket_ownership.get_qr_raw()
+            self.assertEqual(self.ticket_ownership.get_qr_raw(), image)
+            self.assertEqual(render.call_count, 1)
+
+            # Falls back to the file
+            cache.delete(qr.image_cache.get_cache_key(digest))
+            self.assertEqual(self.ticket_ownership.get_qr_raw(), image)
+            self.assertEqual(render.call_count, 1)
+
+            # A new code is a new image
+            self.ticket_ownership.code = models.generate_ticket_ownership_code()
+            self.assertNotEqual(self.ticket_ownership.get_qr_raw(), image)
+            self.assertEqual(render.call_count, 2)
+
+        self.assertTrue(image.startswith(b'\x89PNG'))
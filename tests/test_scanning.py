@@ -0,0 +1,104 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from bitket import factories, models, scanning
+
+
+class ScanIndexTests(TestCase):
+    def setUp(self):
+        self.event = factories.EventFactory()
+        self.user = factories.UserFactory(nin='199011290799',
+                                          email='Guest@example.com')
+        self.ownership = self.create_ownership(self.user)
+        self.index = scanning.ScanIndex(self.event.pk)
+        self.index.client.delete(self.index.key)
+
+    def create_ownership(self, user):
+        ticket = factories.TicketFactory(
+            ticket_type=factories.TicketTypeFactory(event=self.event),
+            pending=False)
+        return models.TicketOwnership.objects.create(ticket=ticket, user=user)
+
+    def test_lookup(self):
+        pk = str(self.ownership.pk)
+
+        self.assertEqual(self.index.lookup(pk), {pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.lookup(self.ownership.code), {pk})
+            self.assertEqual(self.index.lookup(self.ownership.qr_payload),
+                             {pk})
+            self.assertEqual(self.index.lookup('19901129-0799'), {pk})
+            self.assertEqual(self.index.lookup('guest@example.com'), {pk})
+            self.assertEqual(self.index.lookup(json.dumps(
+                {'id': pk, 'code': 'wrong'})), set())
+
+    def test_add_purchased(self):
+        self.index.build()
+        ownership = self.create_ownership(self.user)
+
+        self.assertEqual(self.index.lookup('guest@example.com'),
+                         {str(self.ownership.pk), str(ownership.pk)})
+
+    def test_learn_card(self):
+        student = mock.Mock(email='guest@example.com')
+        with mock.patch('bitket.students.get_student') as get_student:
+            get_student.return_value = student
+            self.assertEqual(self.index.lookup('1234567'),
+                             {str(self.ownership.pk)})
+            self.assertEqual(self.index.lookup('1234567'),
+                             {str(self.ownership.pk)})
+
+        get_student.assert_called_once_with(mifare_id='1234567')
+
+    def test_learn_card_before_ticket(self):
+        user = factories.UserFactory(email='student@example.com')
+        student = mock.Mock(email='Student@example.com')
+        with mock.patch('bitket.students.get_student') as get_student:
+            get_student.return_value = student
+            self.assertEqual(self.index.lookup('1234567'), set())
+            ownership = self.create_ownership(user)
+            self.assertEqual(self.index.lookup('1234567'),
+                             {str(ownership.pk)})
+
+        self.assertEqual(get_student.call_count, 2)
+
+
+class TicketOwnershipViewTests(APITestCase):
+    def test_search_event(self):
+        ownership = models.TicketOwnership.objects.create(
+            ticket=factories.TicketFactory(pending=False),
+            user=factories.UserFactory())
+        self.client.force_authenticate(factories.UserFactory(is_staff=True))
+
+        response = self.client.get(reverse('ticketownership-search'), {
+            'event': ownership.ticket.ticket_type.event_id,
+            'query': ownership.code,
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([o['id'] for o in response.data],
+                         [str(ownership.pk)])
+
+    def test_utilize_many(self):
+        ownership = models.TicketOwnership.objects.create(
+            ticket=factories.TicketFactory(pending=False),
+            user=factories.UserFactory())
+        self.client.force_authenticate(factories.UserFactory(is_staff=True))
+        url = reverse('ticketownership-utilize-many')
+
+        response = self.client.post(url, {'ownerships': [ownership.pk]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([str(pk) for pk in response.data['accepted']],
+                         [str(ownership.pk)])
+
+        response = self.client.post(url, {'ownerships': [ownership.pk]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['conflicts'][0]['reason'],
+                         models.TicketOwnership.CHECK_IN_UTILIZED)
@@ -0,0 +1,23 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from bitket import models
+
+
+class SimulateReleaseTests(TransactionTestCase):
+    def test_simulate_release(self):
+        stdout = StringIO()
+
+        # Seeded so that both ticket types get more buyers than tickets
+        call_command('simulate_release', buyers=20, concurrency=4,
+                     ticket_types=2, max_total_quantity=5,
+                     payment_latency=0, decline_rate=0, seed=0, stdout=stdout)
+
+        output = stdout.getvalue()
+        self.assertIn('20 purchases', output)
+        self.assertIn('Ticket type 1: 5 of 5 sold, 0 pending', output)
+        self.assertIn('Ticket type 2: 5 of 5 sold, 0 pending', output)
+        self.assertFalse(models.Event.objects.exists())
+        self.assertFalse(models.User.objects.exists())
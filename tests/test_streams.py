@@ -0,0 +1,81 @@
+from time import sleep, time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+from rest_framework_jwt.settings import api_settings
+
+from bitket import availability, factories, streams
+
+
+class HubTests(TestCase):
+    def test_fan_out(self):
+        hub = streams.Hub()
+        user_pk = factories.UserFactory().pk
+        channel = streams.get_user_channel(user_pk)
+        subscriptions = [hub.subscribe([channel]) for _ in range(2)]
+
+        # The hub subscribes in the background
+        deadline = time() + 5
+        messages = [None, None]
+        while None in messages and time() < deadline:
+            streams.publish(channel, {'id': 1})
+            sleep(0.1)
+            messages = [s.get(0) for s in subscriptions]
+
+        for message in messages:
+            self.assertEqual(message.event, 'purchase')
+            self.assertEqual(message.data, {'id': 1})
+
+        for subscription in subscriptions:
+            subscription.close()
+        self.assertNotIn(channel, hub.subscriptions)
+
+
+@override_settings(STREAM_MAX_DURATION=0)
+class StreamViewTests(APITestCase):
+    def test_event_stream(self):
+        event = factories.EventFactory(published=True)
+        factories.TicketTypeFactory(event=event, is_published=True)
+        url = reverse('event-stream', kwargs={'pk': event.pk})
+        snapshot = availability.get_snapshot(event.pk)
+
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('event: availability\nid: {}\n'.format(snapshot.etag),
+                      content)
+
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream',
+                                   HTTP_LAST_EVENT_ID=snapshot.etag)
+        content = b''.join(response.streaming_content).decode()
+        self.assertNotIn('event: availability', content)
+
+    def test_event_stream_channel(self):
+        event = factories.EventFactory(published=True)
+        url = reverse('event-stream', kwargs={'pk': event.pk.hex.upper()})
+
+        with mock.patch.object(streams.hub, 'subscribe',
+                               wraps=streams.hub.subscribe) as subscribe:
+            response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+            b''.join(response.streaming_content)
+
+        subscribe.assert_called_once_with(
+            [streams.get_event_channel(event.pk)])
+
+    def test_purchase_stream(self):
+        url = reverse('purchase-stream')
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        token = api_settings.JWT_ENCODE_HANDLER(
+            api_settings.JWT_PAYLOAD_HANDLER(factories.UserFactory()))
+        response = self.client.get(url, {'token': token},
+                                   HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'retry: 3000\n\n')
@@ -0,0 +1,200 @@
+import random
+import string
+import uuid
+from io import StringIO
+from unittest import mock
+
+import sesam
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from social_django.models import UserSocialAuth
+
+from bitket import factories, memberships, models, students
+from bitket.testing.sesam_stub import StubStudentService
+
+
+def create_student(**kwargs):
+    # Random enough not to hit lookups cached by earlier runs
+    liu_id = '{}{:03}'.format(
+        ''.join(random.choice(string.ascii_lowercase) for _ in range(5)),
+        random.randrange(1000))
+    return sesam.Student(**dict(dict(
+        full_name='Abc Def',
+        first_name='Abc',
+        last_name='Def',
+        liu_id=liu_id,
+        email='{}@student.liu.se'.format(liu_id),
+        nor_edu_person_lin=uuid.uuid4(),
+        liu_lin=uuid.uuid4(),
+        main_union='LinTek',
+        student_union='LinTek',
+        edu_person_affiliations=frozenset(['member', 'student']),
+        edu_person_scoped_affiliations=frozenset(['student@liu.se']),
+        edu_person_primary_affiliation='student',
+    ), **kwargs))
+
+
+@override_settings(SESAM_BREAKER_THRESHOLD=2)
+class StudentServiceTests(SimpleTestCase):
+    def setUp(self):
+        cache.delete_many([students.Breaker.failures_key,
+                           students.Breaker.open_key])
+        self.stub = StubStudentService().__enter__()
+        self.addCleanup(self.stub.__exit__)
+        self.student = create_student()
+        self.mifare_id = str(uuid.uuid4().int)[:10]
+        self.stub.add(self.student, mifare_id=self.mifare_id)
+        self.service = students.StudentService('', '', url=self.stub.url)
+
+    def test_get_student(self):
+        self.assertEqual(
+            self.service.get_student(mifare_id='00' + self.mifare_id),
+            self.student)
+        self.assertEqual(self.stub.requests,
+                         [{'MifareNumber': self.mifare_id}])
+
+        # Cached by every identifier it came with
+        self.assertEqual(self.service.get_student(mifare_id=self.mifare_id),
+                         self.student)
+        self.assertEqual(
+            self.service.get_student(liu_id=self.student.liu_id.upper()),
+            self.student)
+        self.assertEqual(self.service.get_student(
+            nor_edu_person_lin=str(self.student.nor_edu_person_lin)),
+            self.student)
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_not_found(self):
+        liu_id = create_student().liu_id
+        for i in range(2):
+            with self.assertRaises(sesam.StudentNotFound):
+                self.service.get_student(liu_id=liu_id)
+        self.assertEqual(self.stub.requests, [{'LiUId': liu_id}])
+
+    def test_breaker(self):
+        self.stub.failing = True
+        for i in range(2):
+            with self.assertRaises(sesam.Error):
+                self.service.get_student(liu_id=self.student.liu_id)
+        self.assertEqual(len(self.stub.requests), 2)
+
+        self.stub.failing = False
+        with self.assertRaises(students.StudentServiceUnavailable):
+            self.service.get_student(liu_id=self.student.liu_id)
+        self.assertEqual(len(self.stub.requests), 2)
+
+        # Closes again after a while, opening on the next failure
+        cache.delete(students.Breaker.open_key)
+        self.stub.failing = True
+        with self.assertRaises(sesam.Error):
+            self.service.get_student(liu_id=self.student.liu_id)
+        with self.assertRaises(students.StudentServiceUnavailable):
+            self.service.get_student(liu_id=self.student.liu_id)
+
+    def test_unreachable(self):
+        self.stub.__exit__()
+        with self.assertRaises(students.StudentServiceUnavailable):
+            self.service.get_student(liu_id=self.student.liu_id)
+
+
+class StudentUnionTests(TestCase):
+    def setUp(self):
+        self.student_union = factories.StudentUnionFactory()
+        self.condition = factories.StudentUnionMemberConditionFactory(
+            student_union=self.student_union)
+        self.user = factories.UserFactory()
+        self.student = create_student(main_union=self.student_union.name)
+
+    def test_refresh_union(self):
+        self.assertEqual(memberships.get(self.user), set())
+
+        with mock.patch('bitket.students.get_student') as get_student:
+            get_student.return_value = self.student
+            students.refresh_union(self.user.pk,
+                                   self.student.nor_edu_person_lin)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.student_union, self.student_union)
+        # The conditions were already reevaluated
+        with self.assertNumQueries(0):
+            self.assertEqual(memberships.get(self.user), {self.condition.pk})
+        self.assertTrue(cache.get(students.get_union_key(self.user.pk)))
+
+    def test_refresh_union_failed(self):
+        with mock.patch('bitket.students.get_student') as get_student:
+            get_student.side_effect = students.StudentServiceUnavailable()
+            students.refresh_union(self.user.pk,
+                                   self.student.nor_edu_person_lin)
+
+        self.assertIsNone(
+            models.User.objects.get(pk=self.user.pk).student_union)
+        self.assertIsNone(cache.get(students.get_union_key(self.user.pk)))
+
+    def test_refresh_union_later(self):
+        lin = self.student.nor_edu_person_lin
+        with mock.patch('bitket.students.transaction.on_commit') as on_commit:
+            for i in range(2):
+                students.refresh_union_later(self.user, lin)
+            # The lookup of the first login is on its way
+            self.assertEqual(on_commit.call_count, 1)
+
+            # The first login was rolled back
+            cache.delete(students.get_union_pending_key(self.user.pk))
+            students.refresh_union_later(self.user, lin)
+            self.assertEqual(on_commit.call_count, 2)
+
+            with mock.patch('bitket.students.get_student') as get_student:
+                get_student.return_value = self.student
+                students.run_refresh_union(self.user.pk, lin)
+            # The union looked up is used on the next login
+            students.refresh_union_later(self.user, lin)
+            self.assertEqual(on_commit.call_count, 2)
+
+    def test_refresh_student_unions(self):
+        users = {}
+        for name in ['joined', 'left', 'unchanged', 'failed']:
+            user = factories.UserFactory(
+                student_union=None if name == 'joined' else self.student_union)
+            UserSocialAuth.objects.create(
+                user=user, provider='liu', uid=str(uuid.uuid4()),
+                extra_data={'nor_edu_person_lin': str(uuid.uuid4())})
+            memberships.get(user)
+            users[name] = user
+        lins = {
+            UserSocialAuth.objects.get(user=user).extra_data[
+                'nor_edu_person_lin']: name
+            for name, user in users.items()
+        }
+
+        def get_student(fresh, nor_edu_person_lin):
+            self.assertTrue(fresh)
+            name = lins[nor_edu_person_lin]
+            if name == 'left':
+                raise sesam.StudentNotFound()
+            if name == 'failed':
+                raise students.StudentServiceUnavailable()
+            return self.student
+
+        with mock.patch('bitket.students.get_student', get_student):
+            call_command('refresh_student_unions', batch_size=3,
+                         stdout=StringIO())
+
+        unions = dict(models.User.objects
+                      .filter(pk__in=[u.pk for u in users.values()])
+                      .values_list('pk', 'student_union'))
+        self.assertEqual(unions, {
+            users['joined'].pk: self.student_union.pk,
+            users['left'].pk: None,
+            users['unchanged'].pk: self.student_union.pk,
+            users['failed'].pk: self.student_union.pk,
+        })
+
+        for name, user in users.items():
+            users[name] = models.User.objects.get(pk=user.pk)
+        self.assertEqual(memberships.get(users['joined']), {self.condition.pk})
+        self.assertEqual(memberships.get(users['left']), set())
+        # Users whose union stayed keep their cached conditions
+        with self.assertNumQueries(0):
+            memberships.get(users['unchanged'])
+            memberships.get(users['failed'])
@@ -0,0 +1,160 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from bitket import exceptions, factories, models, pricing
+
+
+class TicketOwnershipTests(TestCase):
+    def test_bulk_create_with_tickets(self):
+        student_union = factories.StudentUnionFactory()
+        condition = factories.StudentUnionMemberConditionFactory(
+            student_union=student_union)
+        ticket_type = factories.TicketTypeFactory()
+        other_ticket_type = factories.TicketTypeFactory(
+            event=ticket_type.event)
+        modifier = factories.ModifierFactory(
+            ticket_type=ticket_type, condition=condition)
+        factories.ModifierFactory(
+            ticket_type=other_ticket_type, condition=condition)
+        variation = models.Variation.objects.create(
+            ticket_type=ticket_type, name='Size')
+        choice = models.VariationChoice.objects.create(
+            variation=variation, name='Large', delta=Decimal('20.00'))
+        member = factories.UserFactory(student_union=student_union)
+        user = factories.UserFactory()
+
+        entries = [
+            (models.Ticket(ticket_type=ticket_type, pending=True), [choice],
+             member),
+            (models.Ticket(ticket_type=ticket_type, pending=True), [], user),
+        ]
+
+        pricing.get_sheet(ticket_type)
+        with self.assertNumQueries(6):
+            ownerships = (models.TicketOwnership.objects
+                          .bulk_create_with_tickets(entries))
+
+        member_ticket, user_ticket = [
+            models.Ticket.objects.get(pk=o.ticket_id) for o in ownerships]
+        self.assertLess(member_ticket.seq, user_ticket.seq)
+        self.assertEqual(list(member_ticket.variation_choices.all()), [choice])
+        self.assertEqual(list(user_ticket.variation_choices.all()), [])
+
+        member_ownership = member_ticket.ownerships.get()
+        self.assertEqual(member_ownership.user, member)
+        self.assertEqual(list(member_ownership.modifiers.all()), [modifier])
+        self.assertEqual(
+            member_ownership.price,
+            ticket_type.price + modifier.delta + choice.delta)
+        user_ownership = user_ticket.ownerships.get()
+        self.assertEqual(list(user_ownership.modifiers.all()), [])
+        self.assertEqual(user_ownership.price, ticket_type.price)
+        self.assertEqual(member_ticket.current_ownership, member_ownership)
+        self.assertEqual(user_ticket.current_ownership, user_ownership)
+
+    def test_current_ownership(self):
+        ticket = factories.TicketFactory()
+        seller = factories.UserFactory()
+        buyer = factories.UserFactory()
+        sold = models.TicketOwnership.objects.create(ticket=ticket,
+                                                     user=seller)
+        bought = models.TicketOwnership.objects.create(ticket=ticket,
+                                                       user=buyer)
+
+        self.assertFalse(sold.is_current)
+        self.assertTrue(bought.is_current)
+        self.assertEqual(list(models.Ticket.objects.owned_by(buyer)),
+                         [ticket])
+        self.assertEqual(list(models.Ticket.objects.owned_by(seller)), [])
+        self.assertEqual(
+            list(models.Ticket.objects.owned_by(seller, only_current=False)),
+            [ticket])
+        self.assertEqual(list(models.TicketOwnership.objects.current()),
+                         [bought])
+
+        bought.delete()
+        ticket.refresh_from_db()
+        self.assertTrue(sold.is_current)
+
+    def test_delete_current_owner(self):
+        ticket = factories.TicketFactory(pending=False)
+        seller, buyer = factories.UserFactory.create_batch(2)
+        sold = models.TicketOwnership.objects.create(ticket=ticket,
+                                                     user=seller)
+        models.TicketOwnership.objects.create(ticket=ticket, user=buyer)
+
+        # Cascades to the ownership without calling its delete()
+        models.User.objects.filter(pk=buyer.pk).delete()
+
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.current_ownership, sold)
+
+    def test_backfill_prices(self):
+        ticket_type = factories.TicketTypeFactory()
+        modifier = factories.ModifierFactory(
+            ticket_type=ticket_type,
+            condition=factories.StudentUnionMemberConditionFactory())
+        user = factories.UserFactory()
+        ticket = models.Ticket.objects.create(ticket_type=ticket_type)
+        ownership = models.TicketOwnership.objects.create(
+            ticket=ticket, user=user)
+        ownership.modifiers.set([modifier])
+        models.TicketOwnership.objects.filter(pk=ownership.pk).update(
+            price=None)
+
+        call_command('backfill_ticket_ownership_prices', batch_size=1,
+                     stdout=StringIO())
+
+        ownership.refresh_from_db()
+        self.assertEqual(ownership.price, ticket_type.price + modifier.delta)
+
+    def test_backfill_current_ownerships(self):
+        ticket = factories.TicketFactory()
+        models.TicketOwnership.objects.create(
+            ticket=ticket, user=factories.UserFactory())
+        ownership = models.TicketOwnership.objects.create(
+            ticket=ticket, user=factories.UserFactory())
+        models.Ticket.objects.filter(pk=ticket.pk).update(
+            current_ownership=None)
+
+        call_command('backfill_ticket_current_ownerships', batch_size=1,
+                     stdout=StringIO())
+
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.current_ownership, ownership)
+
+    def test_check_in(self):
+        ticket = factories.TicketFactory(pending=False)
+        sold = models.TicketOwnership.objects.create(
+            ticket=ticket, user=factories.UserFactory())
+        bought = models.TicketOwnership.objects.create(
+            ticket=ticket, user=factories.UserFactory())
+        other = models.TicketOwnership.objects.create(
+            ticket=factories.TicketFactory(pending=False),
+            user=factories.UserFactory())
+
+        with self.assertNumQueries(1):
+            checked_in_pks, conflicts = (models.TicketOwnership.objects
+                                         .check_in([bought.pk]))
+        self.assertEqual(checked_in_pks, [bought.pk])
+        self.assertEqual(conflicts, [])
+
+        ticket.refresh_from_db()
+        checked_in_pks, conflicts = models.TicketOwnership.objects.check_in(
+            [sold.pk, bought.pk, other.pk])
+        self.assertEqual(checked_in_pks, [other.pk])
+        self.assertEqual(conflicts, [
+            (sold.pk, models.TicketOwnership.CHECK_IN_NOT_CURRENT, None),
+            (bought.pk, models.TicketOwnership.CHECK_IN_UTILIZED,
+             ticket.utilized),
+        ])
+
+        # Only the manager checks in, querysets would lose their filters
+        self.assertFalse(hasattr(models.TicketOwnership.objects.all(),
+                                 'check_in'))
+
+        with self.assertRaises(exceptions.ValidationError):
+            bought.utilize()